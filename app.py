@@ -1,14 +1,35 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
-import threading
+import socket
 import uuid
 import traceback
 from datetime import datetime
 import time
 
 from pipeline import run_pipeline
-from redis_db import db
-# from sqlite_db import db
+from refresh import run_refresh, FAQ_STATE_DIR
+from job_control import JobControl, Watchdog
+import profiling
+import http_cache
+import generate_faq
+from faq_index import faq_index
+from workspace import workspaces, WorkspaceFull, disk_usage
+from scheduler import scheduler, merge_stats, PRIORITIES
+
+# Storage backend: Redis by default, SQLite for single-box and local runs
+if os.getenv('FAQ_STORAGE', 'redis') == 'sqlite':
+    from sqlite_db import db
+else:
+    from redis_db import db
+
+# Tenant caps count the tenant's running jobs on every worker
+scheduler.leases = db
+
+# Each worker shares its queue stats for /metrics/queue; stats of a worker
+# that stopped publishing are dropped after QUEUE_STATS_TTL_S
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+QUEUE_STATS_TTL_S = 30
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -17,9 +38,147 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit upload size to 16MB
 # Configuration for production
 app.config['DEBUG'] = False
 
-# Background jobs tracker
+# /generate answers from the FAQ index when the page was generated this recently (seconds).
+# Requests can override it with "max_age"; 0 always runs the pipeline.
+FAQ_REUSE_MAX_AGE_S = int(os.getenv('FAQ_REUSE_MAX_AGE_S', 0))
+
+# Number of proxies in front of the app that append to X-Forwarded-For. The
+# client IP is the entry the outermost of them added; anything to its left
+# was sent by the client and is ignored. Behind a proxy with TRUST_PROXY=0,
+# every request comes from the proxy's IP and all clients are one tenant.
+TRUST_PROXY = int(os.getenv('TRUST_PROXY', 0))
+if TRUST_PROXY:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUST_PROXY)
+_warned_proxy = False
+
+# Show a quick draft from a faster model while the full FAQ is generated.
+# Requests can override it with "speculative".
+FAQ_SPECULATIVE = os.getenv('FAQ_SPECULATIVE', '0') == '1'
+
+# Dependencies that the pipeline imports on first use. Importing them is what
+# makes a cold worker slow, so a preloading server can import them up front.
+HEAVY_MODULES = ['scrapegraphai.graphs', 'openai', 'playwright.sync_api']
+if os.getenv('FAQ_STORAGE', 'redis') != 'sqlite':
+    HEAVY_MODULES.append('redis')
+
+def warmup():
+    """Import the heavy dependencies now; called by gunicorn in the master with preload_app"""
+    import importlib
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            print(f"Preloaded {module} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Left to be imported (and fail visibly) on first use
+            print(f"Could not preload {module}: {e}")
+
+# Rendered responses of completed jobs, in front of storage
+response_cache = http_cache.ResponseCache()
+
+# Background jobs tracker, per process: jobs run in the worker that accepted them
 background_jobs = {}
 
+# Statuses a job does not leave
+FINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+def _running_controls():
+    """Controls of the tracked jobs; queued jobs are skipped by the watchdog until they start"""
+    return [job['control'] for job in list(background_jobs.values())]
+
+def _tenant():
+    """Who a request counts against for fair scheduling: its API key if known, or else its client IP"""
+    return scheduler.tenant(api_key=request.headers.get('X-API-Key'), ip=request.remote_addr)
+
+def _drop_queued(job_id):
+    # Called by the scheduler for a job cancelled before it started; it has no workspace yet
+    background_jobs.pop(job_id, None)
+
+def _start_job(job_id, control, *args, **kwargs):
+    """Run by the scheduler when the job leaves the queue"""
+    # Created only now: a queued job has no deadline, and a workspace waiting
+    # in the queue past WORKSPACE_MAX_LIFETIME_S would be swept from under it
+    try:
+        workspace = workspaces.create(job_id)
+    except WorkspaceFull as e:
+        background_jobs.pop(job_id, None)
+        db.store_result(job_id, {
+            'status': 'failed',
+            'progress': 100,
+            'message': f"No disk space to run the job: {e}",
+            'created_at': datetime.now().isoformat(),
+            'data': None,
+            'error': str(e)
+        })
+        return
+
+    # The watchdog stops the job if its workspace grows over quota
+    control.add_guard(workspace.over_quota)
+    process_faq_generation(job_id, *args, control=control, workspace=workspace, **kwargs)
+
+def _store_stopped(control, status, message):
+    response_cache.invalidate(control.job_id)
+    db.store_result(control.job_id, {
+        'status': status,
+        'progress': 100,
+        'message': message,
+        'created_at': datetime.now().isoformat(),
+        'data': {'stage': control.stage},
+        'error': control.reason
+    })
+
+def _on_job_expired(control):
+    _store_stopped(control, 'failed', f"FAQ generation stopped in the {control.stage} stage: {control.reason}")
+
+def _cancel(job_id, job):
+    """Cancel a job tracked by this process; False if it was already stopping"""
+    control = job['control']
+    if not control.cancel('cancelled by request'):
+        return False
+
+    # A job still waiting in the queue never runs; the scheduler calls _drop_queued for it
+    scheduler.remove(job_id)
+
+    _store_stopped(control, 'cancelled', f"FAQ generation cancelled in the {control.stage} stage.")
+    return True
+
+def _apply_cancel_requests():
+    # A DELETE handled by another worker leaves a cancel request in storage
+    for job_id, job in list(background_jobs.items()):
+        if not job['control'].cancelled and db.pop_cancel_request(job_id):
+            _cancel(job_id, job)
+
+def _publish_queue_stats():
+    try:
+        db.publish_scheduler_stats(WORKER_ID, scheduler.stats(), QUEUE_STATS_TTL_S)
+    except Exception as e:
+        print(f"Could not publish queue stats: {e}")
+
+def _housekeeping():
+    _apply_cancel_requests()
+    # Renew tenant leases and start jobs whose tenant was at its cap on other workers
+    scheduler.poll()
+    _publish_queue_stats()
+    # Expired and kept workspaces go away even when no new jobs come in
+    workspaces.maybe_sweep()
+
+# Cancels jobs past their deadlines or without a heartbeat, and jobs cancelled
+# through another worker; also runs the periodic housekeeping. Started on the
+# first request of each worker process.
+watchdog = Watchdog(_running_controls, _on_job_expired, on_sweep=_housekeeping)
+
+@app.before_request
+def start_watchdog():
+    watchdog.start()
+
+@app.before_request
+def check_proxy():
+    global _warned_proxy
+    if not TRUST_PROXY and not _warned_proxy and 'X-Forwarded-For' in request.headers:
+        _warned_proxy = True
+        print("Requests come through a proxy but TRUST_PROXY is 0: all clients are scheduled as one tenant, "
+              "the proxy's IP. Set TRUST_PROXY to the number of proxies.")
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -37,12 +196,20 @@ def generate_faq():
         platform = data['platform']
         language = data.get('language', 'en')
         faq_count = data.get('faq_count', 10)
+        refresh = bool(data.get('refresh', False))
+        profile = profiling.should_profile(bool(data.get('profile', False)))
+        speculative = bool(data.get('speculative', FAQ_SPECULATIVE))
+        priority = data.get('priority', 'interactive')
         
         # Validate platform
         valid_platforms = ["fb", "ig", "x", "df"]
         if platform not in valid_platforms:
             return jsonify({'error': f"Invalid platform '{platform}'. Choose from {valid_platforms}."}), 400
         
+        # Validate priority
+        if priority not in PRIORITIES:
+            return jsonify({'error': f"Invalid priority '{priority}'. Choose from {PRIORITIES}."}), 400
+
         # Validate FAQ count
         try:
             faq_count = int(faq_count)
@@ -51,13 +218,52 @@ def generate_faq():
         except ValueError:
             return jsonify({'error': 'FAQ count must be an integer'}), 400
         
+        try:
+            max_age = int(data.get('max_age', FAQ_REUSE_MAX_AGE_S))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_age must be an integer number of seconds'}), 400
+
         # Generate unique job ID
         job_id = str(uuid.uuid4())
 
+        # Answer from a fresh enough indexed result instead of running the pipeline
+        indexed = None if refresh else faq_index.lookup(url, platform, language, faq_count, max_age)
+        if indexed:
+            db.store_result(job_id, {
+                'status': 'completed',
+                'progress': 100,
+                'message': 'FAQs reused from a recent generation.',
+                'created_at': datetime.now().isoformat(),
+                'data': {
+                    'faq_content': indexed['faq_content'],
+                    'url': url,
+                    'language': language,
+                    'platform': platform,
+                    'faq_count': faq_count,
+                    'reused_from': indexed['job_id'],
+                    'generated_at': indexed['created_at']
+                },
+                'error': None
+            })
+            return jsonify({
+                'job_id': job_id,
+                'status': 'completed',
+                'message': 'FAQs reused from a recent generation.',
+                'check_status_url': f'/status/{job_id}',
+                'result_url': f'/result/{job_id}'
+            })
+
+        # Each job gets an isolated scratch directory when it starts; refuse it
+        # now rather than queue it if there is no room for one
+        try:
+            workspaces.check_room()
+        except WorkspaceFull as e:
+            return jsonify({'error': f"No disk space for a new job: {e}"}), 507
+
         # Store initial result
         initial_result = {
             'status': 'Processing...',
-            'message': 'Starting FAQ generation...',
+            'message': 'Waiting for a free slot...',
             'progress': 0,
             'created_at': datetime.now().isoformat(),
             'data': None,
@@ -65,53 +271,191 @@ def generate_faq():
         }
         db.store_result(job_id, initial_result)
 
-        # Start processing in a background thread
-        thread = threading.Thread(
-            target=process_faq_generation,
-            args=(job_id, url, platform, language, faq_count)
-        )
-        thread.daemon = True
-        thread.start()
+        control = JobControl(job_id)
 
         # Track the background job
+        tenant = _tenant()
         background_jobs[job_id] = {
-            'thread': thread,
-            'start_time': time.time()
+            'start_time': time.time(),
+            'control': control,
+            'tenant': tenant,
+            'priority': priority
         }
 
+        # Queue it; the scheduler runs it in a background thread when the tenant's turn comes
+        ahead = scheduler.submit(
+            job_id,
+            lambda: _start_job(job_id, control, url, platform, language, faq_count, refresh, profile=profile, speculative=speculative),
+            control,
+            tenant,
+            priority,
+            on_drop=lambda: _drop_queued(job_id)
+        )
+
         # Return immediately - don't wait for processing
-        return jsonify({
+        response = {
             'job_id': job_id, 
             'status': 'queued',
             'message': 'FAQ generation started. Check status later with the job ID.',
-            'check_status_url': f'/status/{job_id}'
-        })
+            'check_status_url': f'/status/{job_id}',
+            'priority': priority,
+            'queued_ahead': ahead
+        }
+        if profile:
+            response['profile_url'] = f'/jobs/{job_id}/profile'
+        return jsonify(response)
 
         # return jsonify({'job_id': job_id, 'status': 'processing'})
     
     except Exception as e:
         return jsonify({'error': f"Server error: {str(e)}"}), 500
     
+def _cached_response(kind, job_id, render):
+    """
+    Respond from the response cache, or from storage through render(result),
+    which returns (body, mimetype). Completed jobs are cached and sent as
+    immutable; every response carries an ETag and may be compressed.
+    """
+    entry = response_cache.get((kind, job_id))
+    if entry is None:
+        result = db.get_result(job_id)
+        if not result:
+            return jsonify({'error': 'Invalid job ID'}), 404
+
+        completed = result['status'] == 'completed'
+        body, mimetype = render(result)
+        entry = http_cache.CachedBody(
+            body.encode('utf-8'),
+            mimetype,
+            last_modified=http_cache.parse_timestamp(result.get('created_at')),
+            immutable=completed
+        )
+        if completed:
+            response_cache.put((kind, job_id), entry)
+
+    return http_cache.respond(entry, request)
+
 @app.route('/status/<job_id>')
 def get_status(job_id):
-    result = db.get_result(job_id)
-    if not result:
-        return jsonify({'error': 'Invalid job ID'}), 404
-    
-    return jsonify(result)
+    return _cached_response('status', job_id, lambda result: (app.json.dumps(result), 'application/json'))
 
 @app.route('/result/<job_id>')
 def get_result(job_id):
-    result = db.get_result(job_id)
-    if not result:
-        return jsonify({'error': 'Invalid job ID'}), 404
-    
-    if result['status'] == 'completed':
-        return render_template('result.html', result=result)
-    else:
-        return jsonify(result)
+    def render(result):
+        if result['status'] == 'completed':
+            return render_template('result.html', result=result), 'text/html'
+        return app.json.dumps(result), 'application/json'
+
+    return _cached_response('result', job_id, render)
+
+@app.route('/faqs/search')
+def search_faqs():
+    # ?q=words to match, and/or filters url, platform, language; limit and offset page through results
+    query = request.args.get('q', '').strip()
+    url = request.args.get('url')
+    if not query and not url:
+        return jsonify({'error': 'Give a search query (q) or a page url'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    results = faq_index.search(
+        query,
+        url=url,
+        platform=request.args.get('platform'),
+        language=request.args.get('language'),
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({'query': query, 'count': len(results), 'results': results})
+
+@app.route('/metrics/queue')
+def queue_metrics():
+    # Running and queued jobs per tenant summed over the workers, with each
+    # worker's own stats (queue and slot wait percentiles) under by_worker
+    try:
+        by_worker = db.get_scheduler_stats()
+    except Exception as e:
+        print(f"Could not read queue stats of the other workers: {e}")
+        by_worker = {}
+    by_worker[WORKER_ID] = scheduler.stats()
+    return jsonify(merge_stats(by_worker))
+
+@app.route('/metrics/disk')
+def disk_metrics():
+    # Sizes of the job workspaces and of the other directories the app writes to
+    metrics = {'workspaces': workspaces.metrics(), 'paths': {}}
+    for name, path in (
+        ('profiles', profiling.PROFILE_DIR),
+        ('faq_state', FAQ_STATE_DIR),
+        ('faq_index', faq_index.db_path),
+    ):
+        if os.path.isdir(path):
+            metrics['paths'][name] = {'path': os.path.abspath(path), 'bytes': disk_usage(path)}
+        elif os.path.exists(path):
+            metrics['paths'][name] = {'path': os.path.abspath(path), 'bytes': os.path.getsize(path)}
+    return jsonify(metrics)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = background_jobs.get(job_id)
+    if not job:
+        result = db.get_result(job_id)
+        if not result:
+            return jsonify({'error': 'Invalid job ID'}), 404
+        if result['status'] in FINAL_STATUSES:
+            return jsonify({'error': 'Job is not running', 'status': result['status']}), 409
+        # Running in another worker: its watchdog picks the request up from storage
+        db.request_cancel(job_id)
+        return jsonify({'job_id': job_id, 'status': 'cancelling'}), 202
+
+    if not _cancel(job_id, job):
+        return jsonify({'error': 'Job is already stopping', 'reason': job['control'].reason}), 409
+    return jsonify({'job_id': job_id, 'status': 'cancelled', 'stage': job['control'].stage})
+
+@app.route('/jobs/<job_id>/profile')
+def get_profile(job_id):
+    # ?format=prof (cProfile stats, default), txt (top functions) or json (per-stage spans)
+    fmt = request.args.get('format', 'prof')
+    path = profiling.profile_path(job_id, fmt)
+    if path is None:
+        return jsonify({'error': f"Invalid job ID or format. Choose from {list(profiling.PROFILE_FILES)}."}), 400
+    if not os.path.exists(path):
+        return jsonify({'error': 'No profile for this job'}), 404
+
+    if fmt == 'prof':
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=f"{job_id}.prof")
+    return send_file(os.path.abspath(path), mimetype='application/json' if fmt == 'json' else 'text/plain')
     
-def process_faq_generation(job_id, url, platform, language, faq_count):
+def process_faq_generation(job_id, url, platform, language, faq_count, refresh=False, control=None, profile=False, speculative=False, workspace=None):
+    if control is None:
+        control = JobControl(job_id)
+
+    def store_draft(faq_list):
+        # Served by /status until the full answer replaces it
+        db.store_result(job_id, {
+            'status': 'processing',
+            'progress': 90,
+            'message': 'Draft FAQs ready, the full answer is still being generated...',
+            'created_at': datetime.now().isoformat(),
+            'data': {
+                'draft': True,
+                'faq_content': generate_faq.format_faq_markdown(faq_list),
+                'url': url,
+                'language': language,
+                'platform': platform,
+                'faq_count': faq_count
+            },
+            'error': None
+        })
+
+    # Run the pipeline
+    output_dir = workspace.path if workspace else None
+    out_file = workspace.path_for('faq.md') if workspace else f"output_{job_id}_faq.md"
+    succeeded = False
+
     try:
         # Update progress
         db.store_result(job_id, {
@@ -123,16 +467,39 @@ def process_faq_generation(job_id, url, platform, language, faq_count):
             'error': None
         })
 
-        # Run the pipeline
-        out_file = f"output_{job_id}_faq.md"
+        timings = {}
+        refresh_report = None
 
-        success = run_pipeline(
-            url, 
-            plf=platform,
-            out_file=out_file,
-            language=language, 
-            faq_count=faq_count
-        )
+        # Profiled jobs are saved under profiles/<job_id>, see /jobs/<job_id>/profile
+        with profiling.profile_job(job_id, enabled=profile):
+            if refresh:
+                # Reuse the previous run and only regenerate what changed
+                refresh_report = run_refresh(
+                    url,
+                    plf=platform,
+                    out_file=out_file,
+                    language=language,
+                    faq_count=faq_count,
+                    output_dir=output_dir,
+                    control=control
+                )
+                success = refresh_report is not None
+            else:
+                success = run_pipeline(
+                    url, 
+                    plf=platform,
+                    out_file=out_file,
+                    language=language, 
+                    faq_count=faq_count,
+                    timings=timings,
+                    control=control,
+                    on_draft=store_draft if speculative else None,
+                    output_dir=output_dir
+                )
+
+        # The canceller (DELETE or the watchdog) has already recorded the outcome
+        if control.cancelled:
+            return
 
         if success:
             # Read the generated FAQ file
@@ -142,6 +509,12 @@ def process_faq_generation(job_id, url, platform, language, faq_count):
             # Clean up temporary file
             if os.path.exists(out_file):
                 os.remove(out_file)
+
+            # Keep the FAQs searchable and reusable after the job result expires
+            try:
+                faq_index.add(url, platform, language, faq_content, job_id=job_id)
+            except Exception as e:
+                print(f"Could not index FAQs of job {job_id}: {e}")
             
             db.store_result(job_id, {
                 'status': 'completed',
@@ -153,21 +526,28 @@ def process_faq_generation(job_id, url, platform, language, faq_count):
                     'url': url,
                     'language': language,
                     'platform': platform,
-                    'faq_count': faq_count
+                    'faq_count': faq_count,
+                    'timings': timings,
+                    'refresh': refresh_report,
+                    'profile': f'/jobs/{job_id}/profile' if profile else None
                 },
                 'error': None
             })
+            succeeded = True
         else:
             db.store_result(job_id, {
                 'status': 'failed',
                 'progress': 100,
                 'message': 'FAQ generation failed. Please check the URL and try again.',
                 'created_at': datetime.now().isoformat(),
-                'data': None,
+                'data': {'timings': timings, 'profile': f'/jobs/{job_id}/profile' if profile else None},
                 'error': 'FAQ generation failed'
             })
     
     except Exception as e:
+        if control.cancelled:
+            return
+
         error_details = traceback.format_exc()
         print(f"Error in process_faq_generation: {error_details}")
 
@@ -180,6 +560,12 @@ def process_faq_generation(job_id, url, platform, language, faq_count):
             'error': str(e)
         })
     finally:
+        if workspace:
+            # Deleted, or compacted and kept for a while if the job failed (WORKSPACE_KEEP)
+            workspace.close(succeeded)
+        elif control.cancelled and os.path.exists(out_file):
+            os.remove(out_file)
+
         # Clean up job tracking
         if job_id in background_jobs:
             del background_jobs[job_id]
@@ -0,0 +1,278 @@
+"""
+Micro-benchmarks for the pure-Python hot paths of the pipeline.
+
+Everything runs offline against the fixture corpus in benchmarks/fixtures:
+no browser is launched and no LLM is called. Results are written as JSON and
+can be compared against a stored baseline to catch regressions.
+
+    python benchmarks/bench.py --out bench_results.json
+    python benchmarks/bench.py --save-baseline
+    python benchmarks/bench.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+BASE_URLS = {
+    "facebook": "https://www.facebook.com/riversidebakery",
+    "instagram": "https://www.instagram.com/riversidebakery",
+    "x": "https://x.com/riversidebakery",
+    "default": "https://riversidebakery.example",
+}
+
+
+def load_llm_outputs():
+    with open(os.path.join(FIXTURES_DIR, "llm_outputs.jsonl"), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def measure(func, repeat, warmup=1):
+    """Run func repeat times and return timing statistics in milliseconds."""
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def bench_combine_html_files(repeat):
+    import scraper_ai
+
+    results = {}
+    for platform_name, base_url in BASE_URLS.items():
+        html_files = sorted(glob.glob(os.path.join(FIXTURES_DIR, "html", platform_name, "*.html")))
+        input_bytes = sum(os.path.getsize(f) for f in html_files)
+        output = scraper_ai.combine_html_files(html_files, base_url)
+
+        stats = measure(lambda: scraper_ai.combine_html_files(html_files, base_url), repeat)
+        stats.update({"input_bytes": input_bytes, "output_bytes": len(output.encode("utf-8"))})
+        results[f"combine_html_files[{platform_name}]"] = stats
+    return results
+
+
+def bench_html_cleaner(repeat):
+    """Compare html_cleaner against the scrapegraphai cleanup_html it replaced."""
+    import html_cleaner
+    from scrapegraphai.utils import cleanup_html
+
+    results = {}
+    for platform_name, base_url in BASE_URLS.items():
+        html_files = sorted(glob.glob(os.path.join(FIXTURES_DIR, "html", platform_name, "*.html")))
+        pages = []
+        for html_file in html_files:
+            with open(html_file, "r", encoding="utf-8") as f:
+                pages.append(f.read())
+
+        legacy_bytes = sum(len(cleanup_html(page, base_url)[1].encode("utf-8")) for page in pages)
+        new_bytes = sum(len(html_cleaner.clean_html(page, base_url)[1].encode("utf-8")) for page in pages)
+
+        legacy = measure(lambda: [cleanup_html(page, base_url) for page in pages], repeat)
+        serial = measure(lambda: [html_cleaner.clean_html(page, base_url) for page in pages], repeat)
+        pooled = measure(lambda: html_cleaner.clean_html_files(html_files, base_url), repeat)
+
+        results[f"html_cleaner[{platform_name}]"] = {
+            **pooled,
+            "files": len(html_files),
+            "input_bytes": sum(len(page.encode("utf-8")) for page in pages),
+            "legacy_output_bytes": legacy_bytes,
+            "output_bytes": new_bytes,
+            "legacy_median_ms": legacy["median_ms"],
+            "serial_median_ms": serial["median_ms"],
+            "time_saved_ms": round(legacy["median_ms"] - pooled["median_ms"], 3),
+            "bytes_saved": legacy_bytes - new_bytes,
+        }
+    return results
+
+
+def bench_format_content_for_prompt(repeat):
+    import generate_faq
+    import token_budget
+
+    results = {}
+    for platform_name in BASE_URLS:
+        with open(os.path.join(FIXTURES_DIR, "extracted", f"{platform_name}.json"), "r", encoding="utf-8") as f:
+            content = json.load(f)
+        output = generate_faq.format_content_for_prompt(content)
+
+        stats = measure(lambda: generate_faq.format_content_for_prompt(content), repeat)
+        stats["output_chars"] = len(output)
+        results[f"format_content_for_prompt[{platform_name}]"] = stats
+
+        packed = generate_faq.pack_content_for_prompt(content)
+        stats = measure(lambda: generate_faq.pack_content_for_prompt(content), repeat)
+        stats.update({"input_tokens": token_budget.estimate_tokens(output), "output_tokens": token_budget.estimate_tokens(packed)})
+        results[f"pack_content_for_prompt[{platform_name}]"] = stats
+    return results
+
+
+def bench_clean_json_response(repeat):
+    import generate_faq
+
+    outputs = load_llm_outputs()
+    parsed = 0
+    for item in outputs:
+        try:
+            json.loads(generate_faq.clean_json_response(item["text"]))
+            parsed += 1
+        except json.JSONDecodeError:
+            pass
+
+    def run():
+        for item in outputs:
+            generate_faq.clean_json_response(item["text"])
+
+    stats = measure(run, repeat)
+    stats.update({"documents": len(outputs), "parsed": parsed})
+    return {"clean_json_response[corpus]": stats}
+
+
+def bench_faq_fallback(repeat):
+    import generate_faq
+
+    outputs = load_llm_outputs()
+    expected = sum(item["expected"] for item in outputs)
+    recovered = sum(len(generate_faq.extract_faq_items(item["text"])) for item in outputs)
+
+    def run():
+        for item in outputs:
+            generate_faq.extract_faq_items(item["text"])
+
+    stats = measure(run, repeat)
+    stats.update({"expected_faqs": expected, "recovered_faqs": recovered})
+    return {"extract_faq_items[corpus]": stats}
+
+
+def bench_json_repair(repeat):
+    """
+    Compare json_repair against the legacy regex cleanup and fallback on the
+    bad-output corpus. An FAQ only counts as recovered if its answer parsed
+    to the expected text.
+    """
+    import json_repair
+    import legacy
+
+    outputs = load_llm_outputs()
+    expected = sum(item["expected"] for item in outputs)
+    results = {}
+    for name, parse in (
+        ("legacy", lambda text: [{"question": q, "answer": a} for q, a in legacy.parse_faqs(text)]),
+        ("json_repair", json_repair.extract_faq_objects),
+    ):
+        recovered, fully_recovered = 0, []
+        for item in outputs:
+            answers = {answer.strip() for answer in item["answers"]}
+            correct = len([faq for faq in parse(item["text"]) if faq["answer"] in answers])
+            # Unclamped, so recovering more FAQs than there are shows up too
+            recovered += correct
+            if correct == item["expected"]:
+                fully_recovered.append(item["name"])
+
+        stats = measure(lambda: [parse(item["text"]) for item in outputs], repeat)
+        stats.update({
+            "documents": len(outputs),
+            "documents_fully_recovered": len(fully_recovered),
+            "failed_documents": [item["name"] for item in outputs if item["name"] not in fully_recovered],
+            "expected_faqs": expected,
+            "recovered_faqs": recovered,
+            "recovery_rate": round(recovered / expected, 4) if expected else None,
+        })
+        results[f"parse_faqs[{name}]"] = stats
+    return results
+
+
+BENCHMARKS = {
+    "combine_html_files": bench_combine_html_files,
+    "html_cleaner": bench_html_cleaner,
+    "format_content_for_prompt": bench_format_content_for_prompt,
+    "clean_json_response": bench_clean_json_response,
+    "faq_fallback": bench_faq_fallback,
+    "json_repair": bench_json_repair,
+}
+
+
+def run_benchmarks(names=None, repeat=5):
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results.update(bench(repeat))
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of regressions where the median got slower than baseline by more than tolerance."""
+    regressions = []
+    for case, stats in report["results"].items():
+        base = baseline["results"].get(case)
+        if not base:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{status:>10}  {case}: {base['median_ms']:.3f}ms → {stats['median_ms']:.3f}ms ({ratio:.2f}x)", file=sys.stderr)
+        if status != "ok":
+            regressions.append({"case": case, "baseline_ms": base["median_ms"], "current_ms": stats["median_ms"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline micro-benchmarks")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS), help="Run only the given benchmark (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--out", help="Write results JSON to this file (default: stdout)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Store results as the baseline ({BASELINE_FILE})")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a case counts as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only, args.repeat)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report, baseline, args.tolerance)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            f.write(output)
+
+    exit(1 if report.get("regressions") else 0)
@@ -0,0 +1,98 @@
+"""
+Cold-start import report for the web app and the CLI pipeline.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+so nothing is cached between measurements. The report lists the total import
+time and the slowest modules by cumulative time, and checks that the heavy
+dependencies the pipeline loads on first use stay out of the startup path.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module app --max-ms 500
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_MODULES = ["app", "pipeline"]
+# Must not be imported at startup; each costs from a few hundred ms to seconds
+DEFERRED_MODULES = ["scrapegraphai", "langchain_core", "openai", "playwright", "redis"]
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module):
+    """Import module in a fresh interpreter and return its import time report"""
+    env = dict(os.environ)
+    # Keep the measurement off the network: sqlite storage needs no server
+    env.setdefault("FAQ_STORAGE", "sqlite")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True,
+    )
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2,
+            })
+
+    if completed.returncode != 0:
+        return {"module": module, "error": completed.stderr.strip().splitlines()[-1:]}
+
+    top_level = [item for item in imports if item["depth"] == 0]
+    loaded = {item["module"] for item in imports}
+    return {
+        "module": module,
+        "total_ms": round(sum(item["cumulative_ms"] for item in top_level), 1),
+        "modules_imported": len(imports),
+        "deferred_loaded": [name for name in DEFERRED_MODULES if name in loaded],
+        "slowest": [
+            {"module": item["module"], "cumulative_ms": round(item["cumulative_ms"], 1)}
+            for item in sorted(imports, key=lambda i: i["cumulative_ms"], reverse=True)[:15]
+        ],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start import time")
+    parser.add_argument("--module", action="append", help="Module to import (repeatable, default: app and pipeline)")
+    parser.add_argument("--max-ms", type=float, help="Fail if any module takes longer than this to import")
+    parser.add_argument("--out", help="Write the report JSON to this file (default: stdout)")
+    args = parser.parse_args()
+
+    report = [measure_import(module) for module in args.module or DEFAULT_MODULES]
+
+    failures = []
+    for result in report:
+        if "error" in result:
+            failures.append(f"{result['module']}: import failed: {result['error']}")
+            continue
+        print(f"{result['module']}: {result['total_ms']:.1f}ms, {result['modules_imported']} modules", file=sys.stderr)
+        if result["deferred_loaded"]:
+            failures.append(f"{result['module']}: loads {', '.join(result['deferred_loaded'])} at import")
+        if args.max_ms and result["total_ms"] > args.max_ms:
+            failures.append(f"{result['module']}: {result['total_ms']:.1f}ms is over the {args.max_ms:.0f}ms budget")
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for failure in failures:
+        print(f"FAIL  {failure}", file=sys.stderr)
+    exit(1 if failures else 0)
@@ -0,0 +1,40 @@
+"""
+Implementations that have been replaced, kept so the benchmarks can compare
+the current code against them.
+"""
+import json
+import re
+
+
+def clean_json_response(json_text):
+    """Regex chain used by generate_faq before json_repair"""
+    json_text = re.sub(r'^```json\s*', '', json_text)
+    json_text = re.sub(r'^```\s*', '', json_text)
+    json_text = re.sub(r'\s*```$', '', json_text)
+    json_text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', json_text)
+    json_text = re.sub(r',\s*([}\]])', r'\1', json_text)
+    json_text = re.sub(r'([{:,])\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1 "\2":', json_text)
+    return json_text.strip()
+
+
+def extract_faq_items(faq_json_text):
+    """Regex fallback used by generate_faq when the cleaned response was not valid JSON"""
+    faq_pattern = r'\{[^{}]*"question"\s*:\s*"[^"]*"[^{}]*"answer"\s*:\s*"[^"]*"[^{}]*\}'
+    items = []
+    for faq_match in re.findall(faq_pattern, faq_json_text, re.DOTALL):
+        question_match = re.search(r'"question"\s*:\s*"([^"]*)"', faq_match)
+        answer_match = re.search(r'"answer"\s*:\s*"([^"]*)"', faq_match)
+        if question_match and answer_match:
+            items.append((question_match.group(1), answer_match.group(1)))
+    return items
+
+
+def parse_faqs(text):
+    """The full legacy parse: cleanup, json.loads, regex fallback"""
+    cleaned = clean_json_response(text)
+    try:
+        parsed = json.loads(cleaned)
+        parsed = parsed if isinstance(parsed, list) else [parsed]
+        return [(f["question"], f["answer"]) for f in parsed if isinstance(f, dict) and "question" in f and "answer" in f]
+    except json.JSONDecodeError:
+        return extract_faq_items(cleaned)
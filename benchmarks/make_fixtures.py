@@ -0,0 +1,380 @@
+"""
+Generate the benchmark fixture corpus.
+
+The pages imitate what Playwright saves for each platform: deeply nested
+markup with hashed class names, inline JSON bootstrap scripts, styles, SVG
+icons and tracking attributes around a comparatively small amount of text.
+The output is deterministic for a given seed so the checked-in fixtures can
+be regenerated byte for byte.
+"""
+import argparse
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PAGE_NAME = "Riverside Bakery & Cafe"
+HANDLE = "riversidebakery"
+
+WORDS = (
+    "fresh bread pastry coffee morning bake sourdough croissant weekend market "
+    "open daily order delivery catering event cake birthday wedding gluten free "
+    "vegan option seasonal menu local farm organic flour butter roast espresso "
+    "latte community team hiring location parking reservation holiday hours "
+    "special offer loyalty card gift voucher review thank you visit today"
+).split()
+
+ABOUT_FIELDS = [
+    ("Category", "Bakery · Coffee shop · Caterer"),
+    ("Address", "12 Riverside Walk, Portland, OR 97201"),
+    ("Phone", "+1 503-555-0142"),
+    ("Email", "hello@riversidebakery.example"),
+    ("Website", "https://riversidebakery.example"),
+    ("Hours", "Mon-Fri 6:30-18:00, Sat-Sun 7:00-16:00"),
+    ("Price range", "$$"),
+    ("Services", "Dine-in · Takeaway · Delivery · Catering"),
+]
+
+
+def _class_names(rng, count=6):
+    return " ".join(
+        "x" + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(4, 8)))
+        for _ in range(count)
+    )
+
+
+def _sentence(rng, min_words=6, max_words=22):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def _svg_icon(rng):
+    path = " ".join(f"{rng.randint(0, 24)}.{rng.randint(0, 99)}" for _ in range(40))
+    return (
+        f'<svg viewBox="0 0 24 24" width="16" height="16" fill="currentColor" class="{_class_names(rng, 3)}">'
+        f'<g><path d="M{path}Z"></path></g></svg>'
+    )
+
+
+def _bootstrap_script(rng, size):
+    payload = {
+        "require": [
+            ["ScheduledServerJS", "handle", None, [{"__bbox": {"define": [
+                [f"Module{i}", [], {"token": "".join(rng.choice("ABCDEFabcdef0123456789") for _ in range(48))}, i]
+                for i in range(size)
+            ]}}]]
+        ]
+    }
+    return f'<script type="application/json" data-content-len="{size}" data-sjs>{json.dumps(payload)}</script>'
+
+
+def _style_block(rng, rules):
+    body = "".join(
+        f".{_class_names(rng, 1)}{{margin:{rng.randint(0, 16)}px;padding:{rng.randint(0, 16)}px;"
+        f"color:#{rng.randint(0, 0xFFFFFF):06x};display:flex}}"
+        for _ in range(rules)
+    )
+    return f"<style nonce=\"{rng.randint(10**8, 10**9)}\">{body}</style>"
+
+
+def _wrap(rng, inner, depth):
+    # Rendered social pages bury every text node under many anonymous divs
+    for _ in range(depth):
+        inner = (
+            f'<div class="{_class_names(rng)}" data-visualcompletion="ignore-dynamic" '
+            f'data-pagelet="{rng.choice(["ProfileTimeline", "FeedUnit", "Sidebar", "Header"])}_{rng.randint(0, 99)}">'
+            f"{inner}</div>"
+        )
+    return inner
+
+
+def _nav(rng):
+    links = "".join(
+        f'<a href="/{w}" role="link" tabindex="0" class="{_class_names(rng, 4)}">{_svg_icon(rng)}<span>{w.title()}</span></a>'
+        for w in ["home", "watch", "marketplace", "groups", "gaming", "notifications", "menu"]
+    )
+    return f'<div role="banner"><nav role="navigation" aria-label="Primary">{links}</nav></div>'
+
+
+def _footer(rng):
+    links = " · ".join(
+        f'<a href="/{w}" class="{_class_names(rng, 3)}">{w.title()}</a>'
+        for w in ["privacy", "terms", "advertising", "ad choices", "cookies", "more"]
+    )
+    return f'<footer role="contentinfo"><div>{links}</div><span>Meta © 2025</span></footer>'
+
+
+def _post(rng, index):
+    text = " ".join(_sentence(rng) for _ in range(rng.randint(1, 4)))
+    reactions = rng.randint(3, 9000)
+    return _wrap(
+        rng,
+        f'<div role="article" aria-posinset="{index}" data-ft=\'{{"tn":"K","mf_story_key":"{rng.randint(10**15, 10**16)}"}}\'>'
+        f'<h3><a href="/{HANDLE}">{PAGE_NAME}</a></h3>'
+        f'<span class="{_class_names(rng, 3)}">{rng.randint(1, 28)}d</span>'
+        f'<div dir="auto" style="text-align:start">{text}</div>'
+        f'<img src="https://scontent.example/v/t39/{rng.randint(10**9, 10**10)}_n.jpg?_nc_cat=1&amp;ccb=1-7" alt="" referrerpolicy="origin-when-cross-origin">'
+        f'<div aria-label="{reactions} reactions">{_svg_icon(rng)}<span>{reactions}</span></div>'
+        f"</div>",
+        rng.randint(6, 14),
+    )
+
+
+def _about_section(rng, fields):
+    rows = "".join(
+        _wrap(rng, f'{_svg_icon(rng)}<div><span dir="auto">{value}</span><span>{label}</span></div>', rng.randint(3, 8))
+        for label, value in fields
+    )
+    return f"<div data-pagelet=\"ProfileTilesFeed\">{rows}</div>"
+
+
+def _document(rng, title, body_parts, scripts, styles):
+    head = "".join(_style_block(rng, 120) for _ in range(styles))
+    head += "".join(_bootstrap_script(rng, rng.randint(80, 200)) for _ in range(scripts))
+    tail = "".join(_bootstrap_script(rng, rng.randint(80, 200)) for _ in range(scripts))
+    return (
+        '<!DOCTYPE html><html lang="en" dir="ltr"><head><meta charset="utf-8">'
+        f"<title>{title}</title>"
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f"{head}</head><body class=\"{_class_names(rng)}\">"
+        f"{_nav(rng)}<div id=\"mount_0_0_{rng.randint(0, 99)}\" role=\"main\">{''.join(body_parts)}</div>"
+        f"{_footer(rng)}{tail}</body></html>"
+    )
+
+
+def make_facebook_pages(rng):
+    intro = _wrap(
+        rng,
+        f"<h1>{PAGE_NAME}</h1><span>{rng.randint(10, 90)}K likes · {rng.randint(10, 90)}K followers</span>"
+        f"<div><span>Intro</span><div dir=\"auto\">{_sentence(rng, 20, 40)}</div></div>",
+        10,
+    )
+    return {
+        "main.html": _document(
+            rng, f"{PAGE_NAME} | Portland OR | Facebook",
+            [intro] + [_post(rng, i) for i in range(60)], scripts=14, styles=8,
+        ),
+        "about.html": _document(
+            rng, f"{PAGE_NAME} | About | Facebook",
+            [intro, _about_section(rng, ABOUT_FIELDS)], scripts=12, styles=8,
+        ),
+        "about_profile_transparency.html": _document(
+            rng, f"{PAGE_NAME} | Page transparency | Facebook",
+            [intro, _about_section(rng, [
+                ("Page ID", str(rng.randint(10**14, 10**15))),
+                ("Creation date", "March 3, 2014"),
+                ("Admin location", "United States (4)"),
+                ("Ads", "This Page is not currently running ads."),
+            ])], scripts=12, styles=8,
+        ),
+        "about_details.html": _document(
+            rng, f"{PAGE_NAME} | Details | Facebook",
+            [intro, _about_section(rng, [(f"Detail {i}", _sentence(rng, 10, 30)) for i in range(40)])],
+            scripts=12, styles=8,
+        ),
+    }
+
+
+def make_instagram_pages(rng):
+    header = _wrap(
+        rng,
+        f"<header><h2>{HANDLE}</h2><ul><li>{rng.randint(200, 900)} posts</li>"
+        f"<li>{rng.randint(10, 99)}.{rng.randint(0, 9)}K followers</li><li>{rng.randint(100, 900)} following</li></ul>"
+        f"<span>{PAGE_NAME}</span><div>{_sentence(rng, 12, 25)}</div>"
+        f'<a href="https://l.instagram.com/?u=https%3A%2F%2Friversidebakery.example&amp;e=AT0">riversidebakery.example</a></header>',
+        8,
+    )
+    grid = [
+        _wrap(rng, f'<a href="/p/{rng.randint(10**9, 10**10)}/"><img alt="{_sentence(rng)}" '
+                   f'src="https://scontent.cdninstagram.example/{rng.randint(10**9, 10**10)}.jpg"></a>', 6)
+        for _ in range(90)
+    ]
+    return {"main.html": _document(rng, f"{PAGE_NAME} (@{HANDLE}) • Instagram", [header] + grid, scripts=16, styles=6)}
+
+
+def make_x_pages(rng):
+    header = _wrap(
+        rng,
+        f"<div data-testid=\"UserName\"><span>{PAGE_NAME}</span><span>@{HANDLE}</span></div>"
+        f"<div data-testid=\"UserDescription\">{_sentence(rng, 12, 25)}</div>"
+        f"<span>Joined March 2014</span><a href=\"/{HANDLE}/following\">{rng.randint(100, 900)} Following</a>"
+        f"<a href=\"/{HANDLE}/verified_followers\">{rng.randint(10, 99)}K Followers</a>",
+        9,
+    )
+    tweets = [
+        _wrap(rng, f'<article data-testid="tweet" tabindex="0"><div data-testid="tweetText" lang="en">'
+                   f"{_sentence(rng, 8, 40)}</div><time datetime=\"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}\">"
+                   f"{rng.randint(1, 28)}d</time>{_svg_icon(rng)}{_svg_icon(rng)}{_svg_icon(rng)}</article>", 12)
+        for _ in range(80)
+    ]
+    return {"main.html": _document(rng, f"{PAGE_NAME} (@{HANDLE}) / X", [header] + tweets, scripts=10, styles=10)}
+
+
+def make_default_pages(rng):
+    sections = [
+        f"<section><h2>{rng.choice(WORDS).title()}</h2>" + "".join(f"<p>{_sentence(rng, 15, 40)}</p>" for _ in range(6)) + "</section>"
+        for _ in range(30)
+    ]
+    return {"main.html": _document(rng, PAGE_NAME, sections, scripts=6, styles=4)}
+
+
+def make_extracted_content(rng, platform):
+    """Mimic the JSON SmartScraperGraph writes for each platform, including deep nesting."""
+    def nested(depth):
+        if depth == 0:
+            return _sentence(rng)
+        return {f"{rng.choice(WORDS)}_{i}": nested(depth - 1) for i in range(3)}
+
+    return {
+        "page_description": _sentence(rng, 20, 40),
+        "categories": ["Bakery", "Coffee shop", "Caterer"],
+        "contact_info": {label.lower().replace(" ", "_"): value for label, value in ABOUT_FIELDS},
+        "platform": platform,
+        "recent_posts": [
+            {"text": _sentence(rng, 10, 40), "reactions": rng.randint(1, 9000), "comments": [_sentence(rng) for _ in range(3)]}
+            for _ in range(40)
+        ],
+        "details": nested(6),
+    }
+
+
+def _faq_items(rng, count):
+    return [
+        {"question": f"Do you offer {rng.choice(WORDS)} {rng.choice(WORDS)}?", "answer": _sentence(rng, 10, 30)}
+        for _ in range(count)
+    ]
+
+
+def _complete_faqs(text):
+    """Number of complete question/answer objects in text, each parsed with json"""
+    decoder = json.JSONDecoder()
+    count = 0
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, end = decoder.raw_decode(text, pos)
+        except ValueError:
+            # The cut-off object; anything after it is cut off too
+            break
+        if isinstance(value, dict) and "question" in value and "answer" in value:
+            count += 1
+        pos = text.find("{", end)
+    return count
+
+
+def make_llm_outputs(rng):
+    """
+    Malformed responses seen from the FAQ model, each with the number of FAQs
+    it really contains and the answers they should parse to.
+    """
+    outputs = []
+
+    def add(name, text, expected, items):
+        answers = [item["answer"] for item in items][:expected]
+        outputs.append({"name": name, "text": text, "expected": expected, "answers": answers})
+
+    for count in (10, 50):
+        items = _faq_items(rng, count)
+        body = json.dumps(items, ensure_ascii=False, indent=2)
+        add(f"valid_{count}", body, count, items)
+        add(f"fenced_{count}", f"```json\n{body}\n```", count, items)
+        add(f"trailing_commas_{count}", body.replace("}\n", "},\n").replace('"\n  }', '",\n  }'), count, items)
+        add(f"unquoted_keys_{count}", body.replace('"question":', "question:").replace('"answer":', "answer:"), count, items)
+        truncated = body[: int(len(body) * 0.8)]
+        add(f"truncated_{count}", truncated, _complete_faqs(truncated), items)
+        add(f"control_chars_{count}", body.replace(". ", ".\x0b ").replace("?", "?\x07"), count, items)
+        add(f"prose_wrapped_{count}", f"Here are the FAQs you asked for:\n\n{body}\n\nLet me know if you need more!", count, items)
+
+    colon_items = [
+        {"question": "What are your opening hours?", "answer": "Opening hours: weekdays 6:30-18:00, weekend 7:00-16:00."},
+        {"question": "How do I order a cake?", "answer": "Cake orders need 48 hours notice, tip: call us or email."},
+    ]
+    add("colon_in_answer", json.dumps(colon_items, ensure_ascii=False), len(colon_items), colon_items)
+    single = _faq_items(rng, 1)
+    add("single_object", json.dumps(single[0]), 1, single)
+
+    quoted_items = [
+        {"question": "Is the sourdough vegan?", "answer": 'Yes, our "house" sourdough is flour, water and salt only.'},
+        {"question": "Do you deliver?", "answer": 'We deliver within 5 km, see "Delivery" on our page.'},
+    ]
+    body = "[" + ", ".join(f'{{"question": "{i["question"]}", "answer": "{i["answer"]}"}}' for i in quoted_items) + "]"
+    add("unescaped_quotes", body, len(quoted_items), quoted_items)
+
+    # An inner quote followed by a comma, so the quote alone looks like the end of the string
+    comma_items = [
+        {"question": "Can I cancel an order?", "answer": 'Say "yes", or no, when we call to confirm it.'},
+        {"question": "Do you bake to order?", "answer": 'Ask for a "custom", we need 3 days.'},
+    ]
+    body = "[" + ", ".join(f'{{"question":"{i["question"]}","answer":"{i["answer"]}"}}' for i in comma_items) + "]"
+    add("unescaped_quote_before_comma", body, len(comma_items), comma_items)
+
+    # Bracketed asides in the prose before the array, valid JSON themselves
+    aside_items = [
+        {"question": "Where is the shop?", "answer": "At 12 Market Street, next to the station."},
+        {"question": "Do you take cards?", "answer": "Yes, all major cards and contactless."},
+    ]
+    body = json.dumps(aside_items, ensure_ascii=False)
+    add("bracketed_count_in_prose", f"Here are [{len(aside_items)}] FAQs: {body}", len(aside_items), aside_items)
+    add("bracketed_citation_in_prose", f"Based on the content [1], here: {body}", len(aside_items), aside_items)
+
+    missing_items = [
+        {"question": "Is there parking?", "answer": "Yes, behind the shop."},
+        {"question": "Are you open on holidays?", "answer": "Only on the mornings of public holidays."},
+    ]
+    body = "[" + ", ".join(f'{{"question": "{i["question"]}" "answer": "{i["answer"]}"}}' for i in missing_items) + "]"
+    add("missing_commas", body, len(missing_items), missing_items)
+
+    items = _faq_items(rng, 5)
+    body = "\n\n".join(json.dumps(item, ensure_ascii=False, indent=2) for item in items)
+    add("separate_objects", f"FAQ 1-5:\n\n{body}", len(items), items)
+
+    items = _faq_items(rng, 5)
+    add("wrapped_in_key", json.dumps({"faqs": items}, ensure_ascii=False, indent=2), len(items), items)
+
+    items = _faq_items(rng, 5)
+    body = json.dumps(items, ensure_ascii=False, indent=2)
+    truncated = body[: body.rfind('"answer"') + 30]
+    add("truncated_in_string", truncated, _complete_faqs(truncated), items)
+
+    items = _faq_items(rng, 3)
+    add("single_quotes", repr(items), len(items), items)
+    return outputs
+
+
+GENERATORS = {
+    "facebook": make_facebook_pages,
+    "instagram": make_instagram_pages,
+    "x": make_x_pages,
+    "default": make_default_pages,
+}
+
+
+def generate(output_dir=FIXTURES_DIR, seed=42):
+    rng = random.Random(seed)
+
+    for platform, generator in GENERATORS.items():
+        platform_dir = os.path.join(output_dir, "html", platform)
+        os.makedirs(platform_dir, exist_ok=True)
+        for filename, html in generator(rng).items():
+            with open(os.path.join(platform_dir, filename), "w", encoding="utf-8") as f:
+                f.write(html)
+
+    extracted_dir = os.path.join(output_dir, "extracted")
+    os.makedirs(extracted_dir, exist_ok=True)
+    for platform in GENERATORS:
+        with open(os.path.join(extracted_dir, f"{platform}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_extracted_content(rng, platform), f, ensure_ascii=False, indent=2)
+
+    with open(os.path.join(output_dir, "llm_outputs.jsonl"), "w", encoding="utf-8") as f:
+        for item in make_llm_outputs(rng):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate benchmark fixtures")
+    parser.add_argument("--out", default=FIXTURES_DIR, help="Fixture output directory")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    generate(args.out, args.seed)
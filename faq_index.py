@@ -0,0 +1,213 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import generate_faq
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Persistent store of generated FAQs with an SQLite FTS5 index. Job results
+# expire with the 24h storage TTL; the latest FAQ set of each (url, platform,
+# language) is kept here until it is replaced by a newer run.
+FAQ_INDEX_DB = os.getenv("FAQ_INDEX_DB", os.path.join(os.path.dirname(__file__), "faq_index.db"))
+# unicode61 splits on spaces and punctuation, so a run of Chinese or Japanese
+# text is a single token; use "trigram" to search those languages by substring
+FAQ_INDEX_TOKENIZER = os.getenv("FAQ_INDEX_TOKENIZER", "unicode61 remove_diacritics 2")
+SEARCH_MAX_LIMIT = 100
+
+# One FAQ as written by generate_faq.format_faq_markdown
+FAQ_MARKDOWN = re.compile(r"^\*\*Q\d+\. (.+?)\*\*\n\n(.*?)(?=\n\n\*\*Q\d+\. |\Z)", re.S | re.M)
+QUERY_TERM = re.compile(r"\w+")
+
+
+def normalize_url(url):
+    """Key under which a page's FAQs are stored: lowercase host without www., no trailing slash or fragment"""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = f"{host}{parsed.path.rstrip('/')}"
+    return f"{key}?{parsed.query}" if parsed.query else key
+
+
+def parse_faq_markdown(text):
+    """The FAQs in markdown written by generate_faq, as question/answer dicts"""
+    return [
+        {"question": question.strip(), "answer": answer.strip()}
+        for question, answer in FAQ_MARKDOWN.findall(text or "")
+    ]
+
+
+def fts_query(text, prefix=True):
+    """
+    Turn free text into an FTS5 query matching all of its words, so user
+    input can never be a syntax error. The last word also matches as a prefix.
+    """
+    terms = QUERY_TERM.findall(text or "")
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class FAQIndex:
+    def __init__(self, db_path=FAQ_INDEX_DB, tokenizer=FAQ_INDEX_TOKENIZER):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.available = self._init_db(tokenizer)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self, tokenizer):
+        try:
+            with self._connect() as conn:
+                conn.executescript(f'''
+                    CREATE TABLE IF NOT EXISTS faq_sets (
+                        id INTEGER PRIMARY KEY,
+                        url_key TEXT NOT NULL,
+                        url TEXT NOT NULL,
+                        platform TEXT NOT NULL,
+                        language TEXT NOT NULL,
+                        faq_count INTEGER NOT NULL,
+                        job_id TEXT,
+                        created_at TIMESTAMP NOT NULL,
+                        UNIQUE (url_key, platform, language)
+                    );
+                    CREATE TABLE IF NOT EXISTS faqs (
+                        id INTEGER PRIMARY KEY,
+                        set_id INTEGER NOT NULL REFERENCES faq_sets(id) ON DELETE CASCADE,
+                        position INTEGER NOT NULL,
+                        question TEXT NOT NULL,
+                        answer TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS faqs_set ON faqs (set_id, position);
+                    CREATE VIRTUAL TABLE IF NOT EXISTS faqs_fts USING fts5(
+                        question, answer, content='faqs', content_rowid='id', tokenize='{tokenizer}'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS faqs_ai AFTER INSERT ON faqs BEGIN
+                        INSERT INTO faqs_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS faqs_ad AFTER DELETE ON faqs BEGIN
+                        INSERT INTO faqs_fts (faqs_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+                    END;
+                ''')
+            return True
+        except sqlite3.Error as e:
+            # e.g. SQLite built without FTS5: generation keeps working without the index
+            logger.error(f"FAQ index disabled, could not open {self.db_path}: {e}")
+            return False
+
+    def add(self, url, platform, language, faq_content, job_id=None):
+        """Store the FAQs of a completed job, replacing the previous set for the page. Returns the number indexed."""
+        faqs = parse_faq_markdown(faq_content)
+        if not self.available or not faqs:
+            return 0
+
+        with self.lock:
+            with self._connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                url_key = normalize_url(url)
+                conn.execute(
+                    'DELETE FROM faq_sets WHERE url_key = ? AND platform = ? AND language = ?',
+                    (url_key, platform, language)
+                )
+                cursor = conn.execute(
+                    'INSERT INTO faq_sets (url_key, url, platform, language, faq_count, job_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url_key, url, platform, language, len(faqs), job_id, datetime.now().isoformat())
+                )
+                conn.executemany(
+                    'INSERT INTO faqs (set_id, position, question, answer) VALUES (?, ?, ?, ?)',
+                    [(cursor.lastrowid, i, faq["question"], faq["answer"]) for i, faq in enumerate(faqs, 1)]
+                )
+                conn.commit()
+
+        logger.info(f"Indexed {len(faqs)} FAQ(s) for {url} ({platform}, {language})")
+        return len(faqs)
+
+    def lookup(self, url, platform, language, faq_count, max_age_s):
+        """
+        The indexed FAQs of a page if they were generated within max_age_s and
+        there are at least faq_count of them, trimmed to faq_count. Returns a
+        dict with faq_content, job_id and created_at, or None.
+        """
+        if not self.available or max_age_s <= 0:
+            return None
+
+        oldest = (datetime.now() - timedelta(seconds=max_age_s)).isoformat()
+        with self._connect() as conn:
+            faq_set = conn.execute(
+                'SELECT id, job_id, created_at FROM faq_sets '
+                'WHERE url_key = ? AND platform = ? AND language = ? AND faq_count >= ? AND created_at >= ?',
+                (normalize_url(url), platform, language, faq_count, oldest)
+            ).fetchone()
+            if not faq_set:
+                return None
+            rows = conn.execute(
+                'SELECT question, answer FROM faqs WHERE set_id = ? ORDER BY position LIMIT ?',
+                (faq_set["id"], faq_count)
+            ).fetchall()
+
+        return {
+            "faq_content": generate_faq.format_faq_markdown([dict(row) for row in rows]),
+            "job_id": faq_set["job_id"],
+            "created_at": faq_set["created_at"],
+        }
+
+    def search(self, query=None, url=None, platform=None, language=None, limit=20, offset=0):
+        """
+        FAQs matching query (all words, best match first) and the optional
+        filters. Without a query, the FAQs of the matching pages in order.
+        """
+        if not self.available:
+            return []
+
+        filters, params = [], []
+        for column, value in (("s.url_key", url and normalize_url(url)), ("s.platform", platform), ("s.language", language)):
+            if value:
+                filters.append(f"{column} = ?")
+                params.append(value)
+
+        match = fts_query(query)
+        if match:
+            sql = (
+                "SELECT f.question, f.answer, s.url, s.platform, s.language, s.job_id, s.created_at, "
+                "snippet(faqs_fts, 1, '**', '**', '…', 16) AS snippet, bm25(faqs_fts, 2.0, 1.0) AS score "
+                "FROM faqs_fts JOIN faqs f ON f.id = faqs_fts.rowid JOIN faq_sets s ON s.id = f.set_id "
+                f"WHERE faqs_fts MATCH ? {''.join(' AND ' + f for f in filters)} "
+                "ORDER BY score LIMIT ? OFFSET ?"
+            )
+            params.insert(0, match)
+        else:
+            sql = (
+                "SELECT f.question, f.answer, s.url, s.platform, s.language, s.job_id, s.created_at "
+                "FROM faqs f JOIN faq_sets s ON s.id = f.set_id "
+                f"{'WHERE ' + ' AND '.join(filters) if filters else ''} "
+                "ORDER BY s.created_at DESC, f.position LIMIT ? OFFSET ?"
+            )
+        params += [max(1, min(limit, SEARCH_MAX_LIMIT)), max(0, offset)]
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            if "score" in result:
+                # bm25 is lower for better matches; report higher-is-better
+                result["score"] = round(-result["score"], 4)
+            results.append(result)
+        return results
+
+
+# Singleton instance
+faq_index = FAQIndex()
@@ -1,12 +1,18 @@
 import json
 import os
 import logging
-import re
-from openai import OpenAI
+import threading
 from dotenv import load_dotenv
 
+import json_repair
+import token_budget
+import model_router
+from job_control import JobControl, JobCancelled
+import profiling
+
 load_dotenv()
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai/v1")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,28 +65,26 @@ def get_language_specific_prompt(language):
 
 def clean_json_response(json_text):
     """
-    Clean JSON response by removing invalid control characters and markdown formatting
+    Clean JSON response by repairing it into valid JSON: strips markdown
+    formatting and surrounding text, control characters, trailing commas and
+    unquoted keys. Returns the text unchanged if no JSON can be found.
     """
-    # Remove markdown code block formatting
-    json_text = re.sub(r'^```json\s*', '', json_text)
-    json_text = re.sub(r'^```\s*', '', json_text)
-    json_text = re.sub(r'\s*```$', '', json_text)
-    
-    # Remove invalid control characters
-    json_text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', json_text)
-
-    # Remove trailing commas
-    json_text = re.sub(r',\s*([}\]])', r'\1', json_text)
+    try:
+        return json.dumps(json_repair.repair_json(json_text), ensure_ascii=False)
+    except ValueError:
+        return json_text.strip()
 
-    # Ensure proper quoting
-    json_text = re.sub(r'([{:,])\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1 "\2":', json_text)
-    
-    return json_text.strip()
+def extract_faq_items(faq_json_text):
+    """
+    Extract (question, answer) pairs from a response that is not valid JSON
+    """
+    return [(faq["question"], faq["answer"]) for faq in json_repair.extract_faq_objects(faq_json_text)]
 
-def format_content_for_prompt(content, max_depth=3, current_depth=0):
+def format_content_for_prompt(content, max_depth=10, current_depth=0):
     """
     Recursively format JSON content into a readable string for the prompt
-    Handles any JSON structure dynamically
+    Handles any JSON structure dynamically. The size of the result is bounded
+    by pack_content_for_prompt, not by the depth.
     """
     if current_depth > max_depth:
         return "[Content too deep to display]"
@@ -125,67 +129,113 @@ def format_content_for_prompt(content, max_depth=3, current_depth=0):
     
     return formatted_text
 
-def run_faq(json_file, out_file, platform, language="en", faq_count=10):
-    try:
-        # Validate platform
-        valid_platforms = ["facebook", "instagram", "x", "default"]
-        if platform not in valid_platforms:
-            logger.error(f"Invalid platform '{platform}'. Choose from {valid_platforms}.")
-            return False
-        
-        # Validate FAQ count
-        if not isinstance(faq_count, int) or faq_count < 1 or faq_count > 50:
-            logger.error("FAQ count must be an integer between 1 and 50, got {faq_count}")
-            return False
-        
-        if not os.path.exists(json_file):
-            logger.error(f"JSON file not found: {json_file}")
-            return False
+def group_prompt_lines(formatted_content, max_tokens=256):
+    """
+    Split formatted content into blocks of "Key:" header lines plus the lines
+    under them, so packing keeps values together with their keys. Blocks over
+    max_tokens are split and the headers repeated on each part.
+    """
+    groups = []
+    headers, lines = [], []
 
-        with open(json_file, "r", encoding="utf-8") as f:
-            content = json.load(f)
+    def flush():
+        if not lines:
+            return
+        part, part_tokens = [], 0
+        for line in lines:
+            line_tokens = token_budget.estimate_tokens(line) + 1
+            if part and part_tokens + line_tokens > max_tokens:
+                groups.append("\n".join(headers + part))
+                part, part_tokens = [], 0
+            part.append(line)
+            part_tokens += line_tokens
+        groups.append("\n".join(headers + part))
 
-        # Format the content for the prompt
-        formatted_content = format_content_for_prompt(content)
-
-        platform_context = {
-            "facebook": {
-                "en": "Facebook page", 
-                "vi": "Trang Facebook",
-                "fr": "Page Facebook",
-                "es": "Página de Facebook",
-                "de": "Facebook-Seite",
-                "zh": "Facebook页面",
-                "ja": "Facebookページ",
-                "ko": "Facebook 페이지"
-            },
-            "instagram": {
-                "en": "Instagram profile", 
-                "vi": "Hồ sơ Instagram", 
-                "fr": "Profil Instagram",
-                "es": "Perfil de Instagram",
-                "de": "Instagram-Profil",
-                "zh": "Instagram个人资料",
-                "ja": "Instagramプロファイル",
-                "ko": "Instagram 프로필"
-            },
-            "x": {
-                "en": "X (Twitter) profile", 
-                "vi": "Hồ sơ X (Twitter)",
-                "fr": "Profil X (Twitter)",
-                "es": "Perfil de X (Twitter)",
-                "de": "X (Twitter)-Profil",
-                "zh": "X（Twitter）个人资料",
-                "ja": "X（Twitter）プロファイル",
-                "ko": "X (Twitter) 프로필"
-            }
-        }
+    for line in formatted_content.split("\n"):
+        if not line.strip():
+            continue
+        if line.rstrip().endswith(":"):
+            if lines:
+                flush()
+                headers, lines = [], []
+            headers.append(line)
+        else:
+            lines.append(line)
+    flush()
+    return groups
+
+def pack_content_for_prompt(content, token_budget_limit=token_budget.FAQ_TOKEN_BUDGET):
+    """
+    Format content and pack it into the FAQ prompt budget, dropping duplicate
+    and, if it is still too big, the least informative blocks
+    """
+    formatted_content = format_content_for_prompt(content)
+    if token_budget.estimate_tokens(formatted_content) <= token_budget_limit:
+        return formatted_content
+
+    kept, stats = token_budget.pack_blocks(group_prompt_lines(formatted_content), token_budget_limit)
+    logger.info(
+        f"Packed FAQ content into {stats['output_tokens']}/{token_budget_limit} tokens "
+        f"(from {stats['input_tokens']}, {stats['duplicates']} duplicate and {stats['dropped']} low-value blocks dropped)"
+    )
+    return "\n".join(kept)
+
+PLATFORM_CONTEXT = {
+    "facebook": {
+        "en": "Facebook page", 
+        "vi": "Trang Facebook",
+        "fr": "Page Facebook",
+        "es": "Página de Facebook",
+        "de": "Facebook-Seite",
+        "zh": "Facebook页面",
+        "ja": "Facebookページ",
+        "ko": "Facebook 페이지"
+    },
+    "instagram": {
+        "en": "Instagram profile", 
+        "vi": "Hồ sơ Instagram", 
+        "fr": "Profil Instagram",
+        "es": "Perfil de Instagram",
+        "de": "Instagram-Profil",
+        "zh": "Instagram个人资料",
+        "ja": "Instagramプロファイル",
+        "ko": "Instagram 프로필"
+    },
+    "x": {
+        "en": "X (Twitter) profile", 
+        "vi": "Hồ sơ X (Twitter)",
+        "fr": "Profil X (Twitter)",
+        "es": "Perfil de X (Twitter)",
+        "de": "X (Twitter)-Profil",
+        "zh": "X（Twitter）个人资料",
+        "ja": "X（Twitter）プロファイル",
+        "ko": "X (Twitter) 프로필"
+    }
+}
+
+def build_faq_prompt(content, platform, language="en", faq_count=10, sections=None):
+    """
+    Build the (system, user) prompt pair for FAQ generation. If sections is
+    given, each FAQ is asked to name the top-level content section it is
+    based on in a "section" field.
+    """
+    # Format the content for the prompt
+    formatted_content = pack_content_for_prompt(content)
 
-        lang_prompt = get_language_specific_prompt(language)
-        platform_context_text = platform_context.get(platform, {}).get(language, "social media page")
-        count_instruction = lang_prompt['count'].format(count=faq_count)
+    lang_prompt = get_language_specific_prompt(language)
+    platform_context_text = PLATFORM_CONTEXT.get(platform, {}).get(language, "social media page")
+    count_instruction = lang_prompt['count'].format(count=faq_count)
 
-        prompt = f"""
+    section_instruction = ""
+    example = '{ "question": "Q1", "answer": "A1" }'
+    if sections:
+        section_names = ", ".join(f'"{section}"' for section in sections)
+        section_instruction = (
+            f'\n        - Add a "section" field to each FAQ with the content section it is based on, one of: {section_names}.'
+        )
+        example = '{ "question": "Q1", "answer": "A1", "section": "..." }'
+
+    prompt = f"""
         You are a social media assistant. Based on the following {platform_context_text} content, generate a list of {faq_count} relevant FAQs and answers a visitor might ask.
         
         IMPORTANT:
@@ -193,94 +243,252 @@ def run_faq(json_file, out_file, platform, language="en", faq_count=10):
         - {count_instruction}
         - Generate questions that can be answered based on the content provided below.
         - Make answers concise but informative, drawing directly from the provided content.
-        - Ensure questions are natural and likely to be asked by real users
+        - Ensure questions are natural and likely to be asked by real users{section_instruction}
 
         Content:
         {formatted_content}
 
         Format your output as a JSON array like this:
         [
-        {{ "question": "Q1", "answer": "A1" }},
+        {example},
         ...
         ]
         Only return JSON, no other text.
         """
 
-        # Choose the LLM
-        client = OpenAI(
-            base_url="https://api.mistral.ai/v1",
-            api_key=MISTRAL_API_KEY,
-        )
+    return lang_prompt['system'], prompt
 
-        response = client.chat.completions.create(
-            model="mistral-small-2501",
-            messages=[
-                {"role": "system", "content": lang_prompt['system']},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-        )
+def _abortable_http_client():
+    """
+    An httpx client and an abort() that shuts down its sockets. Closing the
+    client alone does not wake a thread blocked reading the response, so a
+    cancelled request would run on until its timeout.
+    """
+    import socket
+    import httpx
+    import httpcore
+
+    sockets = []
+
+    class TrackingBackend(httpcore.SyncBackend):
+        def connect_tcp(self, *args, **kwargs):
+            stream = super().connect_tcp(*args, **kwargs)
+            sockets.append(stream.get_extra_info("socket"))
+            return stream
+
+    client = httpx.Client()
+    # httpx does not expose the network backend; without it abort() only closes the client
+    for transport in [client._transport, *client._mounts.values()]:
+        pool = getattr(transport, "_pool", None)
+        if hasattr(pool, "_network_backend"):
+            pool._network_backend = TrackingBackend()
+
+    def abort():
+        for sock in list(sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        client.close()
+
+    return client, abort
+
+def _complete(system_prompt, prompt, decision, control, draft=False):
+    """Run one chat completion as routed by decision. Returns (text, usage or None)."""
+    # openai is imported on first use, it is slow to import
+    from openai import OpenAI
+    http_client, abort = _abortable_http_client()
+    client = OpenAI(
+        base_url=MISTRAL_BASE_URL,
+        api_key=MISTRAL_API_KEY,
+        timeout=control.timeout(decision["timeout"]),
+        http_client=http_client,
+    )
 
-        # Parse the output
-        faq_json_text = response.choices[0].message.content.strip()
+    # Cancelling the job tears the in-flight request down
+    control.add_cleanup(abort)
+    try:
+        with control.slot("llm"), model_router.timed(decision, draft=draft) as entry:
+            response = control.call(
+                client.chat.completions.create,
+                model=decision["model"],
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=decision["max_tokens"],
+            )
+            if response.usage:
+                entry["actual_prompt_tokens"] = response.usage.prompt_tokens
+                entry["completion_tokens"] = response.usage.completion_tokens
+    finally:
+        control.remove_cleanup(abort)
+        http_client.close()
+
+    return response.choices[0].message.content.strip(), response.usage
+
+def _parse_faqs(faq_json_text, faq_count):
+    """Parse the output, repairing malformed JSON and keeping every complete FAQ"""
+    faq_list = json_repair.extract_faq_objects(faq_json_text)
+    if not faq_list:
+        logger.error(f"No FAQ content found in response: {faq_json_text[:500]}")
+        return None
 
-        # Clean the JSON response
-        faq_json_text = clean_json_response(faq_json_text)
+    logger.info(f"Parsed {len(faq_list)} FAQ(s) from API response")
 
-        logger.info(f"Cleaned API response: {faq_json_text}")
+    if len(faq_list) > faq_count:
+        faq_list = faq_list[:faq_count]
+        logger.info(f"Limited FAQ list to {faq_count} items.")
+    return faq_list
+
+def _start_draft(system_prompt, prompt, decision, faq_count, control, on_draft, full_done, lock):
+    """
+    Generate a draft on the faster route in a background thread and hand it
+    to on_draft, unless the full answer has landed first (full_done is set
+    under lock). control is a child control of the job, cancelled when the
+    full answer lands so the draft frees its LLM slot and request at once.
+    Returns the thread and a list that will hold the draft FAQs.
+    """
+    profile = profiling.current()
+    drafts = []
 
-        # Try to parse the JSON
+    def run():
         try:
-            faq_list = json.loads(faq_json_text)
-            if len(faq_list) > faq_count:
-                faq_list = faq_list[:faq_count]
-                logger.info(f"Limited FAQ list to {faq_count} items.")
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            logger.info("Extract FAQ content without JSON parsing...")
+            with profiling.span("generate.llm.draft", profile):
+                text, _ = _complete(system_prompt, prompt, decision, control, draft=True)
+            faq_list = _parse_faqs(text, faq_count)
+            if faq_list:
+                drafts.append(faq_list)
+                with lock:
+                    if not full_done.is_set():
+                        on_draft(faq_list)
+        except JobCancelled as e:
+            logger.info(f"Draft FAQ generation stopped: {e.reason}")
+        except Exception as e:
+            logger.warning(f"Draft FAQ generation failed: {e}")
+        finally:
+            control.detach()
+
+    thread = threading.Thread(target=run, name=f"job-{control.job_id}-draft", daemon=True)
+    thread.start()
+    return thread, drafts
+
+def generate_faq_items(content, platform, language="en", faq_count=10, sections=None, usage=None, control=None, on_draft=None):
+    """
+    Ask the LLM for FAQs about content. Returns a list of dicts with
+    "question" and "answer" (and "section" when sections is given), or None
+    if nothing could be parsed. If a usage dict is given, the prompt and
+    completion token counts are recorded in it. A JobControl bounds the
+    request by the job's deadline and stops the wait if the job is cancelled.
+
+    The model, max_tokens and timeout are picked by model_router. With
+    on_draft, a quick draft is also requested from the fast route and passed
+    to on_draft(faq_list) if it arrives before the full answer; the draft is
+    returned if the full request fails.
+    """
+    if control is None:
+        control = JobControl.unbounded()
+
+    with profiling.span("generate.format_prompt"):
+        system_prompt, prompt = build_faq_prompt(content, platform, language, faq_count, sections)
+
+    estimated_tokens = token_budget.estimate_tokens(system_prompt) + token_budget.estimate_tokens(prompt)
+    decision = model_router.route("faq", estimated_tokens, faq_count)
+    logger.info(f"Generating FAQ with ~{estimated_tokens} prompt tokens on {decision['model']}")
+
+    draft_thread, drafts, draft_control = None, [], None
+    full_done, draft_lock = threading.Event(), threading.Lock()
+    draft_decision = model_router.draft_route("faq", estimated_tokens, faq_count) if on_draft else None
+    if draft_decision:
+        draft_control = control.child()
+        draft_thread, drafts = _start_draft(system_prompt, prompt, draft_decision, faq_count, draft_control, on_draft, full_done, draft_lock)
+
+    try:
+        with profiling.span("generate.llm"):
+            faq_json_text, response_usage = _complete(system_prompt, prompt, decision, control)
+    except Exception as e:
+        if draft_thread is None or control.cancelled:
+            raise
+        # Fall back to the draft, which is bounded by its own timeout
+        logger.warning(f"Full FAQ generation failed, waiting for the draft: {e}")
+        while draft_thread.is_alive():
+            control.sleep(0.25)
+        if not drafts:
+            raise
+        return drafts[0]
+    finally:
+        with draft_lock:
+            full_done.set()
+        # A draft still running is of no use any more
+        if draft_thread is not None and draft_thread.is_alive():
+            draft_control.cancel("full answer arrived first")
+
+    if usage is not None:
+        usage["prompt_tokens"] = response_usage.prompt_tokens if response_usage else estimated_tokens
+        usage["completion_tokens"] = response_usage.completion_tokens if response_usage else 0
+
+    if response_usage:
+        logger.info(
+            f"FAQ call used {response_usage.prompt_tokens} prompt + {response_usage.completion_tokens} completion tokens"
+        )
+
+    with profiling.span("generate.parse"):
+        faq_list = _parse_faqs(faq_json_text, faq_count)
+
+    if faq_list is None and drafts:
+        logger.warning("Full FAQ answer could not be parsed, keeping the draft")
+        return drafts[0]
+    return faq_list
+
+def format_faq_markdown(faq_list):
+    """FAQs as markdown"""
+    parts = ["### Frequently Asked Questions\n\n"]
+    for i, faq in enumerate(faq_list, 1):
+        parts.append(f"**Q{i}. {faq['question']}**\n\n")
+        parts.append(f"{faq['answer']}\n\n")
+    return "".join(parts)
+
+def write_faq_markdown(faq_list, out_file):
+    """Save FAQs as markdown"""
+    with open(out_file, "w", encoding="utf-8") as f:
+        f.write(format_faq_markdown(faq_list))
+
+def run_faq(json_file, out_file, platform, language="en", faq_count=10, control=None, on_draft=None):
+    try:
+        # Validate platform
+        valid_platforms = ["facebook", "instagram", "x", "default"]
+        if platform not in valid_platforms:
+            logger.error(f"Invalid platform '{platform}'. Choose from {valid_platforms}.")
+            return False
+        
+        # Validate FAQ count
+        if not isinstance(faq_count, int) or faq_count < 1 or faq_count > 50:
+            logger.error("FAQ count must be an integer between 1 and 50, got {faq_count}")
+            return False
         
-            faq_pattern = r'\{[^{}]*"question"\s*:\s*"[^"]*"[^{}]*"answer"\s*:\s*"[^"]*"[^{}]*\}'
-            faq_matches = re.findall(faq_pattern, faq_json_text, re.DOTALL)
+        if not os.path.exists(json_file):
+            logger.error(f"JSON file not found: {json_file}")
+            return False
 
-            if not faq_matches:
-                logger.error("No FAQ content found in response")
-                return False
-            
-            # Save output as markdown directly from the raw text
-            with open(out_file, "w", encoding="utf-8") as f:
-                f.write("### Frequently Asked Questions\n\n")
-                
-                question_pattern = r'"question"\s*:\s*"([^"]*)"'
-                answer_pattern = r'"answer"\s*:\s*"([^"]*)"'
-                
-                for i, faq_match in enumerate(faq_matches, 1):
-                    question_match = re.search(question_pattern, faq_match)
-                    answer_match = re.search(answer_pattern, faq_match)
-                    
-                    if question_match and answer_match:
-                        question = question_match.group(1)
-                        answer = answer_match.group(1)
-                        f.write(f"**Q{i}. {question}**\n\n")
-                        f.write(f"{answer}\n\n")
-                    else:
-                        logger.warning(f"Could not extract content from FAQ item {i}")
-            
-            logger.info(f"Successfully generated FAQ in {language}: {out_file}")
-            return True
+        with open(json_file, "r", encoding="utf-8") as f:
+            content = json.load(f)
+
+        faq_list = generate_faq_items(content, platform, language, faq_count, control=control, on_draft=on_draft)
+        if not faq_list:
+            return False
 
         # Save output as markdown
-        with open(out_file, "w", encoding="utf-8") as f:
-            f.write(f"### Frequently Asked Questions\n\n")
-            for i, faq in enumerate(faq_list, 1):
-                f.write(f"**Q{i}. {faq['question']}**\n\n")
-                f.write(f"{faq['answer']}\n\n")
+        write_faq_markdown(faq_list, out_file)
 
         logger.info(f"Successfully generated FAQ in {language}: {out_file}")
         return True
 
     except Exception as e:
-        logger.error(f"Error in run_faq: {e}")
+        if control is not None and control.cancelled:
+            logger.warning(f"FAQ generation stopped: {control.reason}")
+        else:
+            logger.error(f"Error in run_faq: {e}")
         return False
 
 if __name__ == "__main__":
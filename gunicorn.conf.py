@@ -0,0 +1,31 @@
+import os
+
+# Gunicorn settings, picked up automatically when gunicorn runs from this
+# directory. Command-line flags override them.
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 600))
+
+# Import the app once in the master and fork workers from it, so a new
+# worker starts serving without paying for the imports again
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# With preload, also import the dependencies the pipeline loads lazily
+# (scrapegraphai, openai, playwright); set to 0 to keep the master small
+warmup = os.getenv("GUNICORN_WARMUP", "1") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    if preload_app and warmup:
+        import app
+        app.warmup()
+
+
+def worker_exit(server, worker):
+    # Runs in the exiting worker: stop its render workers and their browsers
+    import sys
+    render_worker = sys.modules.get("render_worker")
+    if render_worker is not None:
+        render_worker.shutdown()
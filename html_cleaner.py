@@ -0,0 +1,277 @@
+import os
+import re
+import html
+import logging
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Elements dropped together with everything inside them
+DROP_TAGS = {"script", "style", "svg", "noscript", "template", "iframe", "canvas", "object", "video", "audio", "map"}
+
+# Boilerplate blocks (site navigation, footers, cookie banners)
+BOILERPLATE_TAGS = {"nav", "footer", "aside"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog"}
+
+# Elements kept in the output, everything else is unwrapped to its content
+KEEP_TAGS = {
+    "a", "img", "h1", "h2", "h3", "h4", "h5", "h6", "p", "ul", "ol", "li", "dl", "dt", "dd",
+    "table", "tr", "td", "th", "time", "article", "section", "header", "main", "blockquote",
+    "strong", "em", "b", "i", "br",
+}
+
+# Elements that start a new line, whether kept or unwrapped
+BLOCK_TAGS = {
+    "div", "p", "ul", "ol", "li", "dl", "dt", "dd", "table", "tr", "article", "section", "header",
+    "main", "blockquote", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr", "form", "fieldset", "figure",
+}
+
+VOID_TAGS = {"img", "br", "hr", "meta", "link", "input", "source", "wbr", "area", "base", "col", "embed", "param", "track"}
+
+# Attributes kept per element; hrefs and srcs are made absolute
+KEEP_ATTRS = {
+    "a": ("href",),
+    "img": ("src", "alt"),
+    "time": ("datetime",),
+}
+
+TRACKING_PARAMS = re.compile(r"^(utm_|fbclid$|gclid$|igshid$|__cft__|__tn__|_nc_|ref$|ref_src$|mibextid$)")
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def strip_tracking(url):
+    """Remove tracking query parameters from a URL"""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMS.match(k)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class _Cleaner(HTMLParser):
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ""
+        self.out = []
+        # Number of text nodes and images emitted so far
+        self.content = 0
+        # (tag, output index, content count) at open for kept elements, used to drop empty ones
+        self.open = []
+        self.skip_tag = None
+        self.skip_depth = 0
+        self.in_title = False
+
+    # -- output helpers -------------------------------------------------
+    def _newline(self):
+        if self.out and not self.out[-1].endswith("\n"):
+            self.out.append("\n")
+
+    def _space(self):
+        if not self.out:
+            return
+        last = self.out[-1]
+        # No space right after an opening tag
+        if last[-1:].isspace() or (last.startswith("<") and not last.startswith("</") and last.endswith(">")):
+            return
+        self.out.append(" ")
+
+    # -- parser callbacks -----------------------------------------------
+    def handle_starttag(self, tag, attrs):
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+            return
+
+        if tag == "title":
+            self.in_title = True
+            return
+
+        attrs = dict(attrs)
+        if tag in DROP_TAGS or tag in BOILERPLATE_TAGS or attrs.get("role") in BOILERPLATE_ROLES or "hidden" in attrs:
+            if tag not in VOID_TAGS:
+                self.skip_tag, self.skip_depth = tag, 1
+            return
+
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+        if tag not in KEEP_TAGS:
+            # Unwrapped inline elements (mostly spans) still separate words
+            if tag not in BLOCK_TAGS:
+                self._space()
+            return
+
+        kept = []
+        for name in KEEP_ATTRS.get(tag, ()):
+            value = attrs.get(name)
+            if not value:
+                continue
+            if name in ("href", "src"):
+                if value.startswith(("javascript:", "data:", "#")):
+                    continue
+                value = strip_tracking(urljoin(self.base_url, value))
+            kept.append(f' {name}="{html.escape(value, quote=True)}"')
+
+        if tag == "img" and not attrs.get("alt"):
+            return
+
+        self.out.append(f"<{tag}{''.join(kept)}>")
+        if tag == "img":
+            self.content += 1
+        elif tag not in VOID_TAGS:
+            self.open.append((tag, len(self.out) - 1, self.content))
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags never open a skipped block
+        if self.skip_tag or tag in DROP_TAGS or tag in BOILERPLATE_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if self.skip_depth == 0:
+                    self.skip_tag = None
+            return
+
+        if tag == "title":
+            self.in_title = False
+            return
+
+        if tag in KEEP_TAGS and tag not in VOID_TAGS:
+            # Close the innermost matching element, tolerating misnested markup
+            for index in range(len(self.open) - 1, -1, -1):
+                if self.open[index][0] == tag:
+                    _, start, content = self.open[index]
+                    del self.open[index:]
+                    if self.content == content:
+                        del self.out[start:]
+                    else:
+                        self.out.append(f"</{tag}>")
+                    break
+
+        if tag in BLOCK_TAGS:
+            self._newline()
+        elif tag not in KEEP_TAGS:
+            self._space()
+
+    def handle_data(self, data):
+        if self.skip_tag:
+            return
+        if self.in_title:
+            self.title += data
+            return
+
+        text = WHITESPACE.sub(" ", data)
+        if not text.strip():
+            if text:
+                self._space()
+            return
+
+        if text[0] == " ":
+            self._space()
+        self.out.append(html.escape(text.strip(), quote=False))
+        self.content += 1
+        if text[-1] == " ":
+            self.out.append(" ")
+
+    def result(self):
+        body = "".join(self.out)
+        body = re.sub(r" *\n[ \n]*", "\n", body)
+        return WHITESPACE.sub(" ", self.title).strip(), body.strip()
+
+
+def clean_html(html_content, base_url):
+    """
+    Minimize rendered HTML for the LLM: drop scripts, styles, SVG, boilerplate
+    navigation/footer blocks and tracking attributes, unwrap layout-only
+    elements and collapse whitespace. Returns (title, minimized_body).
+    """
+    cleaner = _Cleaner(base_url)
+    cleaner.feed(html_content)
+    cleaner.close()
+    return cleaner.result()
+
+
+def clean_html_file(html_file, base_url):
+    """Read and clean one file; runs inside the worker processes"""
+    with open(html_file, "r", encoding="utf-8") as f:
+        html_content = f.read()
+    title, body = clean_html(html_content, base_url)
+    return title, body, len(html_content.encode("utf-8"))
+
+
+# Cleaning is CPU bound, so multi-file jobs use a shared process pool. It is
+# created on first use with the spawn start method, which is safe to use from
+# the threads that run the web jobs.
+HTML_CLEAN_WORKERS = int(os.getenv("HTML_CLEAN_WORKERS", min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=HTML_CLEAN_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def clean_html_files(html_files, base_url):
+    """
+    Clean several files, in parallel when there is more than one and
+    HTML_CLEAN_WORKERS > 1. Returns a list aligned with html_files holding
+    (title, body, input_bytes) or the exception raised for that file.
+    """
+    if len(html_files) < 2 or HTML_CLEAN_WORKERS < 2:
+        return [_clean_or_error(html_file, base_url) for html_file in html_files]
+
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(clean_html_file, html_file, base_url) for html_file in html_files]
+    except Exception as e:
+        # e.g. a broken pool after a worker was killed, or no process support
+        logger.warning(f"Process pool unavailable, cleaning serially: {e}")
+        _reset_pool()
+        return [_clean_or_error(html_file, base_url) for html_file in html_files]
+
+    results = []
+    for html_file, future in zip(html_files, futures):
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            _reset_pool()
+            results.append(_clean_or_error(html_file, base_url))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _clean_or_error(html_file, base_url):
+    try:
+        return clean_html_file(html_file, base_url)
+    except Exception as e:
+        return e
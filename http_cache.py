@@ -0,0 +1,156 @@
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Responses for completed jobs never change, so they carry validators, a
+# long-lived Cache-Control and are kept in a small in-process LRU in front of
+# storage. Responses for running jobs are revalidated on every poll and
+# answered with 304 while nothing changed.
+
+# How long clients and the LRU may keep a completed result; matches the 24h storage TTL
+RESULT_MAX_AGE_S = int(os.getenv("RESULT_MAX_AGE_S", 86400))
+# Rendered result pages and status bodies of completed jobs kept in memory
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 256))
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain")
+
+
+def _parse_accept_encoding(header):
+    """Encodings the client accepts, i.e. listed without q=0"""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def parse_timestamp(value):
+    """created_at (ISO format, local time when naive) as an aware UTC datetime, or None"""
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+class CachedBody:
+    """
+    A response body with its validators. Compressed variants are built the
+    first time a client asks for them and kept with the body.
+    """
+
+    __slots__ = ("body", "mimetype", "etag", "last_modified", "immutable", "_encoded", "_lock")
+
+    def __init__(self, body, mimetype, last_modified=None, immutable=False):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.last_modified = last_modified
+        self.immutable = immutable
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def choose_encoding(self, accept_encoding):
+        if len(self.body) < COMPRESS_MIN_BYTES or not self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return None
+        accepted = _parse_accept_encoding(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def encoded(self, encoding):
+        if encoding is None:
+            return self.body
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == "br":
+                    data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                self._encoded[encoding] = data
+        return data
+
+
+def respond(entry, req):
+    """
+    Build the response for entry: negotiate the encoding, set the validators
+    and caching headers, and turn it into a 304 if the client's copy is current.
+    """
+    encoding = entry.choose_encoding(req.headers.get("Accept-Encoding"))
+    response = Response(entry.encoded(encoding), mimetype=entry.mimetype)
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.content_encoding = encoding
+
+    # Each encoding is a different representation, so it gets its own ETag
+    response.set_etag(f"{entry.etag}-{encoding}" if encoding else entry.etag)
+    if entry.last_modified:
+        response.last_modified = entry.last_modified
+
+    if entry.immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = RESULT_MAX_AGE_S
+        response.cache_control.immutable = True
+    else:
+        # Clients may keep it but must check back, and get a 304 while unchanged
+        response.cache_control.no_cache = True
+
+    return response.make_conditional(req)
+
+
+class ResponseCache:
+    """Thread-safe LRU of CachedBody entries keyed by (kind, job_id), each kept for at most max_age_s"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_age_s=RESULT_MAX_AGE_S):
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.max_age_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, job_id):
+        """Drop every cached response of a job"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == job_id]:
+                del self._entries[key]
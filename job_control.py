@@ -0,0 +1,282 @@
+import os
+import time
+import logging
+import threading
+from contextlib import nullcontext
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Deadlines in seconds, 0 disables. A stage deadline applies from the moment
+# the job enters that stage, the job deadline from the moment it was started.
+JOB_DEADLINE_S = int(os.getenv("JOB_DEADLINE_S", 900))
+STAGE_DEADLINES_S = {
+    "render": int(os.getenv("RENDER_DEADLINE_S", 300)),
+    "extract": int(os.getenv("EXTRACT_DEADLINE_S", 300)),
+    "generate": int(os.getenv("GENERATE_DEADLINE_S", 180)),
+}
+
+# A running job that has not reported progress for this long is considered stuck
+HEARTBEAT_TIMEOUT_S = int(os.getenv("JOB_HEARTBEAT_TIMEOUT_S", 120))
+WATCHDOG_INTERVAL_S = float(os.getenv("JOB_WATCHDOG_INTERVAL_S", 5))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled or has timed out"""
+
+    def __init__(self, reason, stage=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.stage = stage
+
+
+class JobControl:
+    """
+    Cancellation, deadlines and heartbeat for one job.
+
+    The worker calls enter_stage() and check() as it goes; check() raises
+    JobCancelled once the job is cancelled and otherwise counts as a
+    heartbeat. Resources that can hang (a browser, an HTTP client) register a
+    cleanup that cancel() runs from the cancelling thread to tear them down.
+    Guards (e.g. a disk quota) are checked by the watchdog with the deadlines.
+
+    A job created as queued has no deadlines until start() is called, when
+    the scheduler takes it off the queue.
+    """
+
+    def __init__(self, job_id=None, deadline_s=JOB_DEADLINE_S, stage_deadlines_s=None, heartbeat_timeout_s=HEARTBEAT_TIMEOUT_S):
+        now = time.monotonic()
+        self.job_id = job_id
+        self.deadline_s = deadline_s
+        self.stage_deadlines_s = dict(STAGE_DEADLINES_S if stage_deadlines_s is None else stage_deadlines_s)
+        self.heartbeat_timeout_s = heartbeat_timeout_s
+        self.started_at = now
+        self.stage = "queued"
+        self.stage_started_at = now
+        self.last_heartbeat = now
+        self.reason = None
+        self.cancelled_at = None
+        self._cancelled = threading.Event()
+        self._cleanups = []
+        self._guards = []
+        self._lock = threading.Lock()
+        # Browser and LLM slots of the job's tenant, set by the scheduler
+        self.slots = None
+        # Set on a child control, see child()
+        self.parent = None
+
+    @classmethod
+    def unbounded(cls):
+        """A control with no deadlines, for runs outside the web app"""
+        return cls(deadline_s=0, stage_deadlines_s={}, heartbeat_timeout_s=0)
+
+    def start(self):
+        """Start the clocks: deadlines and the heartbeat run from when the job leaves the queue"""
+        now = time.monotonic()
+        self.started_at = self.stage_started_at = self.last_heartbeat = now
+        self.stage = "starting"
+
+    def child(self):
+        """
+        A control for a side task of the job (e.g. a speculative request)
+        that can be cancelled on its own. It shares the job's slots and
+        deadlines and is cancelled with the job; detach() it when done.
+        """
+        child = JobControl(self.job_id, deadline_s=0, stage_deadlines_s={}, heartbeat_timeout_s=0)
+        child.stage = self.stage
+        child.slots = self.slots
+        child.parent = self
+        self.add_cleanup(child._cancel_with_parent)
+        return child
+
+    def _cancel_with_parent(self):
+        self.cancel(self.parent.reason)
+
+    def detach(self):
+        """Stop following the parent's cancellation"""
+        if self.parent is not None:
+            self.parent.remove_cleanup(self._cancel_with_parent)
+
+    def slot(self, kind):
+        """Context manager holding one of the tenant's kind ("browser", "llm") slots; a no-op without a scheduler"""
+        if self.slots is None:
+            return nullcontext()
+        return self.slots.hold(kind, self)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def heartbeat(self):
+        self.last_heartbeat = time.monotonic()
+
+    def check(self):
+        """Raise JobCancelled if the job was cancelled, otherwise record a heartbeat"""
+        if self._cancelled.is_set():
+            raise JobCancelled(self.reason, self.stage)
+        self.heartbeat()
+
+    def enter_stage(self, stage):
+        self.check()
+        self.stage = stage
+        self.stage_started_at = time.monotonic()
+
+    def remaining(self):
+        """Seconds left before the nearer of the stage and job deadlines, None if neither is set"""
+        if self.parent is not None:
+            return self.parent.remaining()
+        now = time.monotonic()
+        limits = []
+        if self.deadline_s:
+            limits.append(self.started_at + self.deadline_s - now)
+        stage_deadline = self.stage_deadlines_s.get(self.stage)
+        if stage_deadline:
+            limits.append(self.stage_started_at + stage_deadline - now)
+        return max(0.0, min(limits)) if limits else None
+
+    def timeout(self, default):
+        """default, capped to the time remaining; for passing to blocking calls"""
+        remaining = self.remaining()
+        return default if remaining is None else max(1.0, min(default, remaining))
+
+    def sleep(self, seconds):
+        """Sleep, heartbeating, and raise JobCancelled as soon as the job is cancelled"""
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self._cancelled.wait(min(left, 1.0))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run a blocking call (an HTTP request) in a helper thread and return its
+        result, raising JobCancelled as soon as the job is cancelled. A call
+        given up on this way is left to finish in the background, so it must
+        be bounded by its own timeout.
+        """
+        self.check()
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=run, name=f"job-{self.job_id}-call", daemon=True).start()
+        while not done.wait(0.25):
+            self.check()
+        self.check()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def add_cleanup(self, func):
+        """Register func to run on cancel; runs it right away if already cancelled"""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._cleanups.append(func)
+                return func
+        self._run_cleanup(func)
+        return func
+
+    def remove_cleanup(self, func):
+        with self._lock:
+            if func in self._cleanups:
+                self._cleanups.remove(func)
+
+    def add_guard(self, func):
+        """Register func() returning a reason to stop the job, or None; checked by expired()"""
+        self._guards.append(func)
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the job and run its cleanups. Returns False if it was already cancelled."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = time.monotonic()
+            self._cancelled.set()
+            cleanups, self._cleanups = self._cleanups, []
+
+        # A side task being cancelled (see child()) is routine
+        log = logger.info if self.parent is not None else logger.warning
+        log(f"Cancelling job {self.job_id} in stage '{self.stage}': {reason}")
+        for func in reversed(cleanups):
+            self._run_cleanup(func)
+        return True
+
+    def _run_cleanup(self, func):
+        try:
+            func()
+        except Exception as e:
+            logger.warning(f"Cleanup for job {self.job_id} failed: {e}")
+
+    def expired(self):
+        """Why the job should be stopped (a deadline passed, the heartbeat stopped or a guard tripped), or None"""
+        if self.stage == "queued":
+            return None
+        now = time.monotonic()
+        if self.deadline_s and now - self.started_at > self.deadline_s:
+            return f"job deadline of {self.deadline_s}s exceeded"
+        stage_deadline = self.stage_deadlines_s.get(self.stage)
+        if stage_deadline and now - self.stage_started_at > stage_deadline:
+            return f"{self.stage} stage deadline of {stage_deadline}s exceeded"
+        if self.heartbeat_timeout_s and now - self.last_heartbeat > self.heartbeat_timeout_s:
+            return f"no progress for {self.heartbeat_timeout_s}s"
+        for guard in self._guards:
+            try:
+                reason = guard()
+            except Exception as e:
+                logger.warning(f"Guard of job {self.job_id} failed: {e}")
+                continue
+            if reason:
+                return reason
+        return None
+
+
+class Watchdog:
+    """
+    Background thread that cancels expired jobs. get_controls returns the
+    JobControl of every running job; on_expired(control) is called after a
+    job was cancelled by the watchdog, to record the failure. on_sweep(), if
+    given, runs first on every sweep (e.g. to act on cancel requests).
+    """
+
+    def __init__(self, get_controls, on_expired, interval_s=WATCHDOG_INTERVAL_S, on_sweep=None):
+        self.get_controls = get_controls
+        self.on_expired = on_expired
+        self.interval_s = interval_s
+        self.on_sweep = on_sweep
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread if it is not running yet; safe to call on every request"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="job-watchdog", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_s)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Job watchdog sweep failed: {e}")
+
+    def sweep(self):
+        if self.on_sweep:
+            self.on_sweep()
+        for control in self.get_controls():
+            if control.cancelled:
+                continue
+            reason = control.expired()
+            if reason and control.cancel(reason):
+                self.on_expired(control)
@@ -0,0 +1,310 @@
+import json
+import re
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tolerant, single-pass JSON reader for LLM output. Handles prose and code
+# fences around the JSON, trailing or missing commas, unquoted or single-quoted
+# keys and strings, raw control characters, unescaped quotes inside strings
+# and output truncated mid-way. Every character is looked at a bounded number
+# of times, so the cost is linear in the size of the response.
+
+MAX_DEPTH = 100
+
+# Next character that needs attention inside a string
+STRING_SPECIAL = {
+    '"': re.compile(r'["\\\x00-\x1f]'),
+    "'": re.compile(r"['\\\x00-\x1f]"),
+}
+WHITESPACE = re.compile(r"[\s\x00-\x1f\x7f]*")
+BARE_WORD = re.compile(r"[^\s,:{}\[\]\"']+")
+NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+CONTAINER_START = re.compile(r"[\[{]")
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "'": "'"}
+LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+
+
+class Truncated(Exception):
+    """The input ended inside a value"""
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.end = len(text)
+
+    def skip(self):
+        self.pos = WHITESPACE.match(self.text, self.pos).end()
+        # Line comments occasionally appear in model output
+        while self.text.startswith("//", self.pos):
+            newline = self.text.find("\n", self.pos)
+            self.pos = self.end if newline == -1 else newline
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+
+    def value(self, depth=0):
+        if depth > MAX_DEPTH:
+            raise ValueError("JSON nested too deeply")
+        self.skip()
+        if self.pos >= self.end:
+            raise Truncated()
+
+        char = self.text[self.pos]
+        if char == "{":
+            return self.object(depth)
+        if char == "[":
+            return self.array(depth)
+        if char in "\"'":
+            return self.string(char)
+
+        number = NUMBER.match(self.text, self.pos)
+        word = BARE_WORD.match(self.text, self.pos)
+        if number and (not word or word.end() == number.end()):
+            self.pos = number.end()
+            return json.loads(number.group())
+        if word:
+            self.pos = word.end()
+            return LITERALS.get(word.group(), word.group())
+
+        # A stray delimiter where a value should be: consume it and give up on this value
+        self.pos += 1
+        return None
+
+    def key(self):
+        self.skip()
+        if self.pos >= self.end:
+            raise Truncated()
+        char = self.text[self.pos]
+        if char in "\"'":
+            return self.string(char)
+        word = BARE_WORD.match(self.text, self.pos)
+        if not word:
+            self.pos += 1
+            return None
+        self.pos = word.end()
+        return word.group()
+
+    def object(self, depth):
+        self.pos += 1
+        result = {}
+        while True:
+            self.skip()
+            if self.pos >= self.end:
+                raise Truncated(result)
+            char = self.text[self.pos]
+            if char == "}":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                continue
+            if char == "]":
+                # Mismatched closer: treat it as the end of this object
+                return result
+
+            key = self.key()
+            self.skip()
+            if self.pos < self.end and self.text[self.pos] in ":=":
+                self.pos += 1
+            elif self.pos >= self.end:
+                raise Truncated(result)
+
+            try:
+                value = self.value(depth + 1)
+            except Truncated as e:
+                # Keep what was complete inside a cut-off container; a cut-off string is dropped
+                if key is not None and e.args:
+                    result[str(key)] = e.args[0]
+                raise Truncated(result)
+            if key is not None:
+                result[str(key)] = value
+
+    def array(self, depth):
+        self.pos += 1
+        result = []
+        while True:
+            self.skip()
+            if self.pos >= self.end:
+                raise Truncated(result)
+            char = self.text[self.pos]
+            if char == "]":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                continue
+            if char == "}":
+                return result
+
+            try:
+                result.append(self.value(depth + 1))
+            except Truncated as e:
+                if e.args:
+                    result.append(e.args[0])
+                raise Truncated(result)
+
+    def string(self, quote):
+        self.pos += 1
+        special = STRING_SPECIAL[quote]
+        parts = []
+        while True:
+            match = special.search(self.text, self.pos)
+            if not match:
+                raise Truncated()
+            parts.append(self.text[self.pos:match.start()])
+            char = match.group()
+            self.pos = match.end()
+
+            if char == quote:
+                if self._closes_string():
+                    return "".join(parts)
+                parts.append(char)
+            elif char == "\\":
+                if self.pos >= self.end:
+                    raise Truncated()
+                escape = self.text[self.pos]
+                if escape == "u" and re.match(r"[0-9a-fA-F]{4}", self.text[self.pos + 1:self.pos + 5]):
+                    parts.append(chr(int(self.text[self.pos + 1:self.pos + 5], 16)))
+                    self.pos += 5
+                else:
+                    parts.append(ESCAPES.get(escape, escape))
+                    self.pos += 1
+            elif char in "\n\t":
+                parts.append(char)
+            elif char == "\r":
+                continue
+            # Other raw control characters are dropped
+
+    def _key_follows(self, pos):
+        """Whether a quoted or bare key and its colon start at pos"""
+        if self.text[pos] in "\"'":
+            close = self.text.find(self.text[pos], pos + 1)
+            if close == -1 or "\n" in self.text[pos:close]:
+                return False
+            end = close + 1
+        else:
+            word = BARE_WORD.match(self.text, pos)
+            if not word:
+                return False
+            end = word.end()
+        after = WHITESPACE.match(self.text, end).end()
+        return after < self.end and self.text[after] in ":="
+
+    def _closes_string(self):
+        """
+        Whether the unescaped quote just read ends the string: a delimiter, a
+        line break or the next key (a missing comma) must follow it. After a
+        comma, the text must go on with a key or a value (as in
+        "Say "yes", no" it goes on with prose).
+        """
+        after = WHITESPACE.match(self.text, self.pos).end()
+        if after >= self.end or "\n" in self.text[self.pos:after]:
+            return True
+        char = self.text[after]
+        if char in ":}]":
+            return True
+        if char != ",":
+            return self._key_follows(after)
+
+        following = WHITESPACE.match(self.text, after + 1).end()
+        if following >= self.end or "\n" in self.text[after + 1:following] or self.text[following] in "\"'{}[]":
+            return True
+        # A bare key or value is followed by a delimiter, prose by more words
+        word = BARE_WORD.match(self.text, following)
+        if not word:
+            return True
+        next_char = WHITESPACE.match(self.text, word.end()).end()
+        return next_char >= self.end or self.text[next_char] in ",:=}]"
+
+
+def iter_values(text):
+    """
+    Yield each top-level JSON value found in text, skipping any prose around
+    them. A value cut off by the end of the text is yielded with whatever was
+    complete inside it.
+    """
+    parser = _Parser(text)
+    while True:
+        start = CONTAINER_START.search(text, parser.pos)
+        if not start:
+            return
+        parser.pos = start.start()
+        try:
+            yield parser.value()
+        except Truncated as e:
+            if e.args:
+                yield e.args[0]
+            return
+
+
+def repair_json(text):
+    """
+    Parse possibly malformed JSON from an LLM response. Valid JSON (optionally
+    inside a code fence or prose) takes the fast path through json.loads.
+    Raises ValueError if no JSON object or array is found.
+    """
+    start = CONTAINER_START.search(text)
+    if not start:
+        raise ValueError("No JSON object or array found")
+
+    end = max(text.rfind("]"), text.rfind("}"))
+    if end > start.start():
+        try:
+            return json.loads(text[start.start():end + 1])
+        except json.JSONDecodeError:
+            pass
+
+    for value in iter_values(text):
+        return value
+    raise ValueError("No JSON object or array found")
+
+
+def _faq_object(item):
+    if not isinstance(item, dict):
+        return None
+    question, answer = item.get("question"), item.get("answer")
+    if question in (None, "") or answer in (None, ""):
+        return None
+    faq = dict(item)
+    faq["question"], faq["answer"] = str(question).strip(), str(answer).strip()
+    return faq
+
+
+def extract_faq_objects(text):
+    """
+    Return every complete FAQ object (a dict with a question and an answer)
+    in an LLM response, in order. Objects whose question or answer was cut
+    off by truncation are dropped.
+    """
+    try:
+        value = repair_json(text)
+    except ValueError:
+        return []
+
+    faqs = _walk_faqs([value]) if isinstance(value, list) else []
+    if not faqs:
+        # The fast path may have stopped at the first value, or parsed a
+        # bracketed aside ("Here are [10] FAQs: [...]"); the tolerant path
+        # picks up every top-level value and partial arrays
+        faqs = _walk_faqs(list(iter_values(text)))
+    return faqs
+
+
+def _walk_faqs(values):
+    """FAQ objects in values, found depth-first in order"""
+    faqs = []
+    stack = list(reversed(values))
+    while stack:
+        value = stack.pop()
+        faq = _faq_object(value)
+        if faq:
+            faqs.append(faq)
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+        elif isinstance(value, dict):
+            # e.g. {"faqs": [...]}
+            stack.extend(reversed([v for v in value.values() if isinstance(v, (list, dict))]))
+    return faqs
@@ -0,0 +1,74 @@
+"""
+Local stand-in for the target social sites.
+
+Serves the benchmark fixture pages so that save_multiple_pages can render
+them with a real browser without touching the network:
+
+    /facebook/<page>                          → html/facebook/main.html
+    /facebook/<page>/about_details            → html/facebook/about_details.html
+    /instagram/<page>, /x/<page>, /default/<page>
+
+Any page name works; unknown sub-paths fall back to main.html.
+
+    python loadtest/fixture_site.py --port 8091
+"""
+import argparse
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "html")
+
+
+def resolve_fixture(path):
+    parts = [p for p in path.split("?", 1)[0].split("/") if p]
+    if not parts or parts[0] not in os.listdir(FIXTURES_DIR):
+        return None
+
+    platform_dir = os.path.join(FIXTURES_DIR, parts[0])
+    name = parts[2] if len(parts) > 2 else "main"
+    candidate = os.path.join(platform_dir, f"{name}.html")
+    return candidate if os.path.exists(candidate) else os.path.join(platform_dir, "main.html")
+
+
+def make_handler(latency_ms):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            fixture = resolve_fixture(self.path)
+            if fixture is None:
+                self.send_error(404)
+                return
+
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+
+            with open(fixture, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8091, latency_ms=0):
+    server = ThreadingHTTPServer((host, port), make_handler(latency_ms))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixture site server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before each page is served")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency_ms)
+    print(f"Fixture site listening on http://{args.host}:{args.port}/", flush=True)
+    server.serve_forever()
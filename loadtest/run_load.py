@@ -0,0 +1,280 @@
+"""
+End-to-end load test for the web app.
+
+Submits jobs to /generate at a configurable Poisson arrival rate, polls
+/status until each job finishes and reports throughput, job latency
+percentiles, per-stage breakdowns and peak RSS of the app process tree.
+
+With --spawn the harness starts everything locally: the LLM stub, the fixture
+site and the app (gunicorn by default) pointed at both, so a run needs no
+network access and no API key:
+
+    python loadtest/run_load.py --spawn --rate 0.5 --duration 120 --out load_report.json
+    python loadtest/run_load.py --spawn --app-cmd "gunicorn -b 127.0.0.1:5055 -w 4 --threads 8 app:app"
+
+Without --spawn it targets an already running app and site (pass --app-pid to
+get memory numbers).
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(LOADTEST_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, LOADTEST_DIR)
+
+import proc_stats
+import fixture_site
+import stub_llm
+
+PLATFORM_PATHS = {"fb": "facebook", "ig": "instagram", "x": "x", "df": "default"}
+STAGES = ["render", "extract", "generate"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return round(values[index], 3)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+class RssSampler(threading.Thread):
+    """Sample the RSS of a process tree and keep the peak."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak_kb = max(self.peak_kb, proc_stats.tree_rss_kb(self.pid))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return {
+            "peak_tree_rss_mb": round(self.peak_kb / 1024, 1),
+            "peak_app_rss_mb": round(proc_stats.peak_rss_kb(self.pid) / 1024, 1),
+        }
+
+
+def run_job(args, index, records, lock):
+    plf = args.platforms[index % len(args.platforms)]
+    target = f"{args.site.rstrip('/')}/{PLATFORM_PATHS[plf]}/loadtest{index}"
+    # Tenant 0 submits the bulk share of the jobs, the others interactive jobs
+    tenant = index % args.tenants
+    priority = "bulk" if tenant == 0 and args.tenants > 1 else "interactive"
+    record = {"index": index, "platform": plf, "tenant": tenant, "priority": priority, "submitted_at": time.time()}
+
+    try:
+        start = time.perf_counter()
+        response = requests.post(
+            f"{args.app.rstrip('/')}/generate",
+            json={"url": target, "platform": plf, "language": args.language, "faq_count": args.faq_count, "priority": priority},
+            headers={"X-API-Key": f"loadtest-tenant-{tenant}"},
+            timeout=30,
+        )
+        record["submit_latency"] = time.perf_counter() - start
+
+        if response.status_code != 200:
+            record.update({"status": "rejected", "http_status": response.status_code})
+            return
+
+        job_id = response.json()["job_id"]
+        record["job_id"] = job_id
+        status_latencies = []
+        deadline = time.perf_counter() + args.job_timeout
+
+        while time.perf_counter() < deadline:
+            time.sleep(args.poll_interval)
+            poll_start = time.perf_counter()
+            status = requests.get(f"{args.app.rstrip('/')}/status/{job_id}", timeout=30)
+            status_latencies.append(time.perf_counter() - poll_start)
+            result = status.json()
+
+            if result.get("status") in ("completed", "failed", "cancelled"):
+                record["status"] = result["status"]
+                record["job_latency"] = time.perf_counter() - start
+                record["timings"] = (result.get("data") or {}).get("timings", {})
+                break
+        else:
+            record["status"] = "timeout"
+
+        record["status_latencies"] = status_latencies
+
+    except requests.RequestException as e:
+        record.update({"status": "error", "error": str(e)})
+    finally:
+        with lock:
+            records.append(record)
+
+
+def drive(args):
+    records, lock, workers = [], threading.Lock(), []
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    index = 0
+
+    # Open-loop arrivals: submission times do not depend on how fast jobs finish
+    while time.perf_counter() - start < args.duration:
+        worker = threading.Thread(target=run_job, args=(args, index, records, lock), daemon=True)
+        worker.start()
+        workers.append(worker)
+        index += 1
+        time.sleep(rng.expovariate(args.rate))
+
+    for worker in workers:
+        worker.join(args.job_timeout + 60)
+
+    return records, time.perf_counter() - start
+
+
+def build_report(args, records, wall_time, memory):
+    completed = [r for r in records if r.get("status") == "completed"]
+    statuses = {}
+    for record in records:
+        statuses[record.get("status", "unknown")] = statuses.get(record.get("status", "unknown"), 0) + 1
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "config": {
+            "rate": args.rate, "duration": args.duration, "platforms": args.platforms,
+            "faq_count": args.faq_count, "app_cmd": args.app_cmd if args.spawn else None,
+            "llm_latency_ms": args.llm_latency_ms, "llm_rate_429": args.llm_rate_429, "tenants": args.tenants,
+        },
+        "jobs": {"submitted": len(records), "statuses": statuses},
+        "wall_time_s": round(wall_time, 3),
+        "throughput_jobs_per_min": round(len(completed) / wall_time * 60, 3) if wall_time else 0,
+        "job_latency_s": summarize([r["job_latency"] for r in completed]),
+        "submit_latency_s": summarize([r["submit_latency"] for r in records if "submit_latency" in r]),
+        "status_latency_s": summarize([lat for r in records for lat in r.get("status_latencies", [])]),
+        "stages_s": {
+            stage: summarize([r["timings"][stage] for r in completed if stage in r.get("timings", {})])
+            for stage in STAGES
+        },
+        "memory": memory,
+        "render_peak_rss_mb": summarize([r["timings"]["render_peak_rss_mb"] for r in records if "render_peak_rss_mb" in r.get("timings", {})]),
+        "job_latency_by_tenant_s": {
+            f"{tenant} ({'bulk' if tenant == 0 and args.tenants > 1 else 'interactive'})": summarize(
+                [r["job_latency"] for r in completed if r["tenant"] == tenant]
+            )
+            for tenant in range(args.tenants)
+        },
+    }
+
+
+def wait_for_app(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(0.5)
+    return False
+
+
+def spawn_environment(args):
+    llm = stub_llm.serve(port=args.llm_port, latency_ms=args.llm_latency_ms,
+                         jitter_ms=args.llm_jitter_ms, rate_429=args.llm_rate_429, seed=args.seed)
+    site = fixture_site.serve(port=args.site_port, latency_ms=args.site_latency_ms)
+    for server in (llm, site):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ)
+    # The default Redis backend would need a server; SQLite keeps the run self-contained
+    env.setdefault("FAQ_STORAGE", "sqlite")
+    # Only known API keys make their own tenant
+    env.setdefault("API_KEYS", ",".join(f"loadtest-tenant-{tenant}" for tenant in range(args.tenants)))
+    env.update({
+        "MISTRAL_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "MISTRAL_API_KEY": env.get("MISTRAL_API_KEY", "loadtest"),
+        "RENDER_WAIT_MS": str(args.render_wait_ms),
+    })
+    app = subprocess.Popen(shlex.split(args.app_cmd), cwd=ROOT_DIR, env=env)
+    args.site = f"http://127.0.0.1:{args.site_port}"
+
+    if not wait_for_app(args.app):
+        app.terminate()
+        raise RuntimeError(f"App did not come up at {args.app}")
+    return app, [llm, site]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test for /generate and /status")
+    parser.add_argument("--app", default="http://127.0.0.1:5055", help="Base URL of the app")
+    parser.add_argument("--site", default="http://127.0.0.1:8091", help="Base URL of the fixture site")
+    parser.add_argument("--rate", type=float, default=0.2, help="Job arrivals per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to keep submitting jobs")
+    parser.add_argument("--platforms", nargs="+", default=["fb", "ig", "x", "df"], choices=list(PLATFORM_PATHS))
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--faq-count", type=int, default=10)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--job-timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tenants", type=int, default=1, help="Spread jobs over this many API keys; with more than one, tenant 0 submits bulk jobs")
+    parser.add_argument("--out", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--app-pid", type=int, help="PID of an already running app, for memory stats")
+
+    spawn = parser.add_argument_group("local environment (--spawn)")
+    spawn.add_argument("--spawn", action="store_true", help="Start the LLM stub, fixture site and app locally")
+    spawn.add_argument("--app-cmd", default="gunicorn -b 127.0.0.1:5055 -w 2 --threads 4 --timeout 600 app:app")
+    spawn.add_argument("--llm-port", type=int, default=8090)
+    spawn.add_argument("--llm-latency-ms", type=float, default=800)
+    spawn.add_argument("--llm-jitter-ms", type=float, default=200)
+    spawn.add_argument("--llm-rate-429", type=float, default=0.0)
+    spawn.add_argument("--site-port", type=int, default=8091)
+    spawn.add_argument("--site-latency-ms", type=float, default=0)
+    spawn.add_argument("--render-wait-ms", type=int, default=500, help="RENDER_WAIT_MS passed to the app")
+    args = parser.parse_args()
+
+    app_process, servers = (None, [])
+    if args.spawn:
+        app_process, servers = spawn_environment(args)
+
+    pid = app_process.pid if app_process else args.app_pid
+    sampler = RssSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+
+    try:
+        records, wall_time = drive(args)
+    finally:
+        memory = sampler.stop() if sampler else None
+        if app_process:
+            app_process.terminate()
+            app_process.wait(30)
+        for server in servers:
+            server.shutdown()
+
+    output = json.dumps(build_report(args, records, wall_time, memory), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
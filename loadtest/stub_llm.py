@@ -0,0 +1,159 @@
+"""
+Local OpenAI-compatible stand-in for the Mistral API.
+
+Serves POST /v1/chat/completions with canned responses: FAQ prompts get a
+JSON array with the requested number of FAQs, everything else (the
+SmartScraperGraph extraction calls) gets a small extracted-content object.
+Latency and the share of 429 responses are configurable so the load test can
+reproduce a slow or rate-limited provider. Latency can be set per model, to
+see the effect of model routing and speculative drafts.
+
+    python loadtest/stub_llm.py --port 8090 --latency-ms 800 --jitter-ms 300 --rate-429 0.05
+    python loadtest/stub_llm.py --latency-ms 3000 --model-latency ministral-8b-latest=600
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAQ_COUNT_PATTERN = re.compile(r"generate a list of (\d+) relevant FAQs")
+
+EXTRACTED_CONTENT = {
+    "page_name": "Riverside Bakery & Cafe",
+    "description": "Neighbourhood bakery and coffee shop baking sourdough and pastries every morning.",
+    "categories": ["Bakery", "Coffee shop", "Caterer"],
+    "contact_info": {
+        "address": "12 Riverside Walk, Portland, OR 97201",
+        "phone": "+1 503-555-0142",
+        "website": "https://riversidebakery.example",
+    },
+    "hours": "Mon-Fri 6:30-18:00, Sat-Sun 7:00-16:00",
+    "services": ["Dine-in", "Takeaway", "Delivery", "Catering"],
+}
+
+
+class StubState:
+    def __init__(self, latency_ms, jitter_ms, rate_429, seed=None, model_latency_ms=None):
+        self.latency_ms = latency_ms
+        self.model_latency_ms = model_latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"extract": 0, "faq": 0, "429": 0}
+
+    def next_delay(self, model=None):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            latency_ms = self.model_latency_ms.get(model, self.latency_ms)
+            return max(0.0, (latency_ms + jitter) / 1000)
+
+    def should_throttle(self):
+        with self.lock:
+            throttled = self.random.random() < self.rate_429
+            if throttled:
+                self.counts["429"] += 1
+            return throttled
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+
+def faq_response(count):
+    return json.dumps([
+        {"question": f"Question {i} about Riverside Bakery?", "answer": f"Answer {i}: fresh bread is baked every morning."}
+        for i in range(1, count + 1)
+    ])
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with state.lock:
+                    self._send_json(200, dict(state.counts))
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            time.sleep(state.next_delay(request.get("model")))
+
+            if state.should_throttle():
+                self._send_json(429, {"error": {"message": "Requests rate limit exceeded", "type": "rate_limited", "code": "1300"}})
+                return
+
+            prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+            match = FAQ_COUNT_PATTERN.search(prompt)
+            if match:
+                state.count("faq")
+                content = faq_response(int(match.group(1)))
+            else:
+                state.count("extract")
+                content = json.dumps({"content": EXTRACTED_CONTENT})
+
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            })
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8090, latency_ms=800, jitter_ms=0, rate_429=0.0, seed=None, model_latency_ms=None):
+    state = StubState(latency_ms, jitter_ms, rate_429, seed, model_latency_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform jitter added to the latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=MS", help="Mean latency for one model (repeatable)")
+    args = parser.parse_args()
+
+    model_latency_ms = {}
+    for item in args.model_latency:
+        model, _, ms = item.partition("=")
+        model_latency_ms[model.split("/")[-1]] = float(ms)
+
+    server = serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.seed, model_latency_ms)
+    print(f"LLM stub listening on http://{args.host}:{args.port}/v1", flush=True)
+    server.serve_forever()
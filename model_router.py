@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import argparse
+import logging
+import statistics
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import token_budget
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Picks the model, max_tokens and timeout of each LLM call from the size of
+# its prompt and, for FAQ generation, the number of FAQs asked for. Small
+# requests go to a fast model, prompts that do not fit the default model's
+# context to a long-context one. Every call is logged with its latency.
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+
+FAST_MODEL = os.getenv("FAST_MODEL", "ministral-8b-latest")  # empty disables the fast route
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "mistral-small-2501")
+LONG_MODEL = os.getenv("LONG_MODEL", "mistral-large-latest")  # empty disables the long route
+
+# The fast route only takes requests this small
+FAST_MAX_PROMPT_TOKENS = int(os.getenv("FAST_MAX_PROMPT_TOKENS", 4000))
+FAST_MAX_FAQS = int(os.getenv("FAST_MAX_FAQS", 10))
+
+# Completion budget: per FAQ asked for, plus room for the JSON around them
+TOKENS_PER_FAQ = int(os.getenv("TOKENS_PER_FAQ", 200))
+FAQ_OVERHEAD_TOKENS = 256
+EXTRACTION_MAX_TOKENS = int(os.getenv("EXTRACTION_MAX_TOKENS", 4096))
+
+# Timeout = (base + prompt / prefill speed + max_tokens / decode speed) * factor, within these bounds
+TIMEOUT_BASE_S = 5
+TIMEOUT_FACTOR = float(os.getenv("ROUTER_TIMEOUT_FACTOR", 2.0))
+MIN_TIMEOUT_S = int(os.getenv("ROUTER_MIN_TIMEOUT_S", 30))
+MAX_TIMEOUT_S = int(os.getenv("ROUTER_MAX_TIMEOUT_S", 600))
+
+# Append every call (decision, latency, token counts) as a JSON line to this file
+MODEL_ROUTING_LOG = os.getenv("MODEL_ROUTING_LOG", "")
+
+# Smallest first. Throughputs are rough tokens/second, only used for timeouts.
+ROUTES = [
+    {"name": "fast", "model": FAST_MODEL, "context_tokens": int(os.getenv("FAST_CONTEXT_TOKENS", 32000)), "prefill_tps": 4000, "decode_tps": 150},
+    {"name": "default", "model": DEFAULT_MODEL, "context_tokens": token_budget.MODEL_TOKENS, "prefill_tps": 3000, "decode_tps": 80},
+    {"name": "long", "model": LONG_MODEL, "context_tokens": int(os.getenv("LONG_CONTEXT_TOKENS", 128000)), "prefill_tps": 2000, "decode_tps": 40},
+]
+ROUTES_BY_NAME = {route["name"]: route for route in ROUTES}
+
+_log_lock = threading.Lock()
+
+
+def completion_tokens(task, faq_count=None):
+    """Completion budget for a task"""
+    if task == "faq":
+        return FAQ_OVERHEAD_TOKENS + TOKENS_PER_FAQ * (faq_count or 10)
+    return EXTRACTION_MAX_TOKENS
+
+
+def _decision(route, task, prompt_tokens, max_tokens, reason):
+    # Never ask for more completion than the context leaves
+    max_tokens = max(256, min(max_tokens, route["context_tokens"] - prompt_tokens))
+    expected_s = TIMEOUT_BASE_S + prompt_tokens / route["prefill_tps"] + max_tokens / route["decode_tps"]
+    return {
+        "task": task,
+        "route": route["name"],
+        "model": route["model"],
+        "context_tokens": route["context_tokens"],
+        "prompt_tokens": prompt_tokens,
+        "max_tokens": max_tokens,
+        "timeout": round(min(MAX_TIMEOUT_S, max(MIN_TIMEOUT_S, expected_s * TIMEOUT_FACTOR))),
+        "reason": reason,
+    }
+
+
+def route(task, prompt_tokens, faq_count=None):
+    """
+    Decide how to run one LLM call. task is "faq" or "extract". Returns a
+    dict with the route name, model, context_tokens, max_tokens, timeout
+    (seconds, before any job deadline) and the reason for the choice.
+    """
+    wanted = completion_tokens(task, faq_count)
+    default = ROUTES_BY_NAME["default"]
+
+    if not MODEL_ROUTING:
+        return _decision(default, task, prompt_tokens, wanted, "routing disabled")
+
+    fast = ROUTES_BY_NAME["fast"]
+    if (
+        fast["model"]
+        and prompt_tokens <= FAST_MAX_PROMPT_TOKENS
+        and (task != "faq" or (faq_count or 0) <= FAST_MAX_FAQS)
+        and prompt_tokens + wanted <= fast["context_tokens"]
+    ):
+        return _decision(fast, task, prompt_tokens, wanted, f"prompt ≤ {FAST_MAX_PROMPT_TOKENS} tokens")
+
+    long = ROUTES_BY_NAME["long"]
+    if prompt_tokens + wanted > default["context_tokens"] and long["model"]:
+        return _decision(long, task, prompt_tokens, wanted, f"prompt + completion > {default['context_tokens']} tokens")
+
+    return _decision(default, task, prompt_tokens, wanted, "default")
+
+
+def draft_route(task, prompt_tokens, faq_count=None):
+    """
+    The faster configuration for a speculative draft, or None when the
+    request is already on the fast route or does not fit it.
+    """
+    fast = ROUTES_BY_NAME["fast"]
+    full = route(task, prompt_tokens, faq_count)
+    if not fast["model"] or full["route"] == "fast" or full["model"] == fast["model"]:
+        return None
+    wanted = completion_tokens(task, faq_count)
+    if prompt_tokens + wanted > fast["context_tokens"]:
+        return None
+    return _decision(fast, task, prompt_tokens, wanted, "speculative draft")
+
+
+def record(entry):
+    """Log a finished call; entry is a decision with latency_s and outcome added"""
+    status = "ok" if entry.get("ok") else f"failed ({entry.get('error')})"
+    logger.info(
+        f"LLM {entry['task']} call on {entry['route']} route ({entry['model']}, {entry['reason']}): "
+        f"{entry['latency_s']:.1f}s, ~{entry['prompt_tokens']} prompt tokens, "
+        f"max_tokens {entry['max_tokens']}, timeout {entry['timeout']}s, {status}"
+    )
+    if not MODEL_ROUTING_LOG:
+        return
+    try:
+        with _log_lock, open(MODEL_ROUTING_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write routing log {MODEL_ROUTING_LOG}: {e}")
+
+
+@contextmanager
+def timed(decision, **fields):
+    """
+    Time the LLM call made inside the block and record it. Yields the log
+    entry, so the caller can add the actual token counts.
+    """
+    entry = dict(decision, **fields)
+    entry["at"] = datetime.now().isoformat()
+    start = time.perf_counter()
+    try:
+        yield entry
+        entry["ok"] = True
+    except BaseException as e:
+        entry["ok"] = False
+        entry["error"] = type(e).__name__
+        raise
+    finally:
+        entry["latency_s"] = round(time.perf_counter() - start, 3)
+        record(entry)
+
+
+def summarize(entries):
+    """Latency and token statistics per task, route and model"""
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry["task"], entry["route"], entry["model"], entry.get("draft", False)), []).append(entry)
+
+    summary = []
+    for (task, route_name, model, draft), group in sorted(groups.items()):
+        latencies = sorted(e["latency_s"] for e in group if e.get("ok"))
+        completions = [e["completion_tokens"] for e in group if e.get("completion_tokens")]
+        summary.append({
+            "task": task,
+            "route": route_name,
+            "model": model,
+            "draft": draft,
+            "calls": len(group),
+            "failed": len([e for e in group if not e.get("ok")]),
+            "p50_s": round(statistics.median(latencies), 2) if latencies else None,
+            "p95_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else None,
+            "mean_prompt_tokens": round(statistics.mean(e["prompt_tokens"] for e in group)),
+            "mean_completion_tokens": round(statistics.mean(completions)) if completions else None,
+            "timeouts_hit": len([e for e in group if e.get("error") in ("APITimeoutError", "TimeoutError", "ReadTimeout")]),
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the model routing log")
+    parser.add_argument("log", nargs="?", default=MODEL_ROUTING_LOG or None, help="Routing log (JSON lines), default MODEL_ROUTING_LOG")
+    args = parser.parse_args()
+
+    if not args.log:
+        parser.error("no routing log given and MODEL_ROUTING_LOG is not set")
+    with open(args.log, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(summarize(entries), indent=2))
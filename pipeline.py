@@ -2,9 +2,14 @@ import argparse
 import save_url_to_html
 import scraper_ai
 import generate_faq
+import refresh
+from job_control import JobControl
+import profiling
 import logging
+import json
 import os
 import time
+from datetime import datetime
 from urllib.parse import urlparse
 
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +24,25 @@ PLATFORM_MAP = {
 
 SUPPORTED_LANGUAGES = ["en", "vi", "es", "fr", "de", "zh", "ja", "ko"]
 
-def run_pipeline(url, plf, out_file=None, language="en", faq_count=10):
+def run_pipeline(url, plf, out_file=None, language="en", faq_count=10, timings=None, control=None, on_draft=None, output_dir=None):
+    """
+    Run render → extract → generate for one URL.
+
+    If a timings dict is given, the wall time of each stage in seconds is
+    recorded in it under "render", "extract" and "generate", along with the
+    highest browser RSS of any page as "render_peak_rss_mb". A JobControl
+    lets the caller cancel the run and enforce per-stage deadlines; without
+    one the run is unbounded. on_draft(faq_list), if given, receives a quick
+    draft of the FAQs while the full answer is still being generated.
+
+    Rendered pages and extracted data go to output_dir, by default a
+    directory named after the page in the working directory.
+    """
+    if timings is None:
+        timings = {}
+    if control is None:
+        control = JobControl.unbounded()
+
     # Validate platform
     valid_platforms = ["fb", "ig", "x", "df"]
     if plf not in valid_platforms:
@@ -41,21 +64,31 @@ def run_pipeline(url, plf, out_file=None, language="en", faq_count=10):
     # 1. Save HTML
     parsed_url = urlparse(url)
     page_name = parsed_url.path.strip("/").split("/")[-1] if parsed_url.path else parsed_url.netloc.replace("www.", "")
-    output_dir = page_name
+    if output_dir is None:
+        output_dir = page_name
+        json_file = f"{output_dir}_{plf}.json"
+    else:
+        json_file = os.path.join(output_dir, f"{page_name}_{plf}.json")
     os.makedirs(output_dir, exist_ok=True)
 
     logger.info(f"[1/3] Saving rendered HTML from {url} → {output_dir}")
-    results = save_url_to_html.save_multiple_pages(url, output_dir=output_dir, headless=True, platform=platform)
+    control.enter_stage("render")
+    stage_start = time.perf_counter()
+    with profiling.span("render"):
+        results = save_url_to_html.save_multiple_pages(url, output_dir=output_dir, headless=True, platform=platform, control=control)
+    timings["render"] = round(time.perf_counter() - stage_start, 3)
+    peaks = [data["peak_rss_mb"] for data in results.values() if "peak_rss_mb" in data]
+    if peaks:
+        timings["render_peak_rss_mb"] = max(peaks)
 
     if not all(data["success"] for data in results.values()):
         logger.error("Failed to save some HTML pages")
         logger.error("Results: %s", results)
         return False
     
-    time.sleep(3)
+    control.sleep(3)
 
     # 2. Scrape + clean
-    json_file = f"{output_dir}_{plf}.json"
     logger.info(f"[2/3] Extracting structured data → {json_file}")
 
     html_files = []
@@ -68,11 +101,17 @@ def run_pipeline(url, plf, out_file=None, language="en", faq_count=10):
             logger.error(f"HTML file not found: {html_file}")
             return False
 
-    if not scraper_ai.run_scraper(html_files, url, json_file, platform=platform, language=language):
+    control.enter_stage("extract")
+    stage_start = time.perf_counter()
+    with profiling.span("extract"):
+        extracted = scraper_ai.run_scraper(html_files, url, json_file, platform=platform, language=language, control=control)
+    timings["extract"] = round(time.perf_counter() - stage_start, 3)
+
+    if not extracted:
         logger.error("Failed to extract data")
         return False
     
-    time.sleep(3)
+    control.sleep(3)
 
     # 3. Generate FAQ
     if out_file is None:
@@ -84,7 +123,13 @@ def run_pipeline(url, plf, out_file=None, language="en", faq_count=10):
         logger.error(f"JSON file not found: {json_file}")
         return False
 
-    if not generate_faq.run_faq(json_file, out_file, platform=platform, language=language, faq_count=faq_count):
+    control.enter_stage("generate")
+    stage_start = time.perf_counter()
+    with profiling.span("generate"):
+        generated = generate_faq.run_faq(json_file, out_file, platform=platform, language=language, faq_count=faq_count, control=control, on_draft=on_draft)
+    timings["generate"] = round(time.perf_counter() - stage_start, 3)
+
+    if not generated:
         logger.error("Failed to generate FAQ")
         return False
 
@@ -99,8 +144,19 @@ if __name__ == "__main__":
     parser.add_argument("--out", required=False, help="Output markdown file (page name without extension)")
     parser.add_argument("--lang", required=False, default="en", help="Language code (en, vi, fr, es, de, zh, ja, ko)")
     parser.add_argument("--cnt", required=False, type=int, default=10, help="Number of FAQs to generate (1-50)")
+    parser.add_argument("--refresh", action="store_true", help="Only regenerate FAQs for content that changed since the last run")
+    parser.add_argument("--profile", action="store_true", help=f"Profile the run and save it under {profiling.PROFILE_DIR}/")
 
     args = parser.parse_args()
+    run_id = f"cli-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+    if args.refresh:
+        with profiling.profile_job(run_id, enabled=args.profile or profiling.FAQ_PROFILE):
+            report = refresh.run_refresh(args.url, args.plf, args.out, args.lang, args.cnt)
+        if report:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        exit(0 if report else 1)
 
-    success = run_pipeline(args.url, args.plf, args.out, args.lang, args.cnt)
+    with profiling.profile_job(run_id, enabled=args.profile or profiling.FAQ_PROFILE):
+        success = run_pipeline(args.url, args.plf, args.out, args.lang, args.cnt)
     exit(0 if success else 1)
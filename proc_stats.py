@@ -0,0 +1,70 @@
+import os
+
+# Process memory statistics read from /proc. On platforms without /proc every
+# function returns 0 so callers can treat the numbers as best-effort.
+
+def _read_status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+def _parent_map():
+    parents = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return parents
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+            # The command name may contain spaces, the ppid follows the closing paren
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            parents.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return parents
+
+def process_tree(pid):
+    """Return pid and the pids of all its descendants. Scans all of /proc, so callers sampling several stats should build it once."""
+    children = _parent_map()
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def rss_kb(pid):
+    """Current resident set size of a single process in KB"""
+    return _read_status_kb(pid, "VmRSS")
+
+def peak_rss_kb(pid):
+    """High-water mark of the resident set size of a single process in KB"""
+    return _read_status_kb(pid, "VmHWM")
+
+def tree_rss_kb(pid, tree=None):
+    """Current resident set size of a process and all its descendants in KB; tree is process_tree(pid) if already built"""
+    return sum(rss_kb(p) for p in (tree or process_tree(pid)))
+
+def cpu_seconds(pid):
+    """User plus system CPU time used by a single process, in seconds"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 of stat, in clock ticks
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def tree_cpu_seconds(pid, tree=None):
+    """CPU time used by a process and its live descendants, in seconds; tree is process_tree(pid) if already built"""
+    return sum(cpu_seconds(p) for p in (tree or process_tree(pid)))
@@ -0,0 +1,192 @@
+import os
+import re
+import io
+import json
+import time
+import random
+import shutil
+import pstats
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Opt-in job profiling: a request flag, FAQ_PROFILE=1 for every job, or a
+# sampled fraction of jobs. Jobs that are not profiled only pay for a
+# thread-local lookup per span.
+FAQ_PROFILE = os.getenv("FAQ_PROFILE", "0") == "1"
+FAQ_PROFILE_SAMPLE_RATE = float(os.getenv("FAQ_PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Saved profiles older than this, or beyond the newest PROFILE_MAX_COUNT, are deleted (0 disables either)
+PROFILE_MAX_AGE_S = int(os.getenv("PROFILE_MAX_AGE_S", 7 * 86400))
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", 200))
+
+# Files written per profiled job, by download format
+PROFILE_FILES = {
+    "prof": "profile.prof",   # cProfile stats, for pstats / snakeviz
+    "txt": "profile.txt",     # top functions by cumulative time
+    "json": "spans.json",     # per-stage spans
+}
+
+JOB_ID_PATTERN = re.compile(r"^[\w-]+$")
+
+_local = threading.local()
+_NULL_SPAN = nullcontext()
+
+
+def should_profile(requested=False):
+    """Whether to profile a job, given the request's own flag"""
+    if requested or FAQ_PROFILE:
+        return True
+    return FAQ_PROFILE_SAMPLE_RATE > 0 and random.random() < FAQ_PROFILE_SAMPLE_RATE
+
+
+class JobProfile:
+    """
+    cProfile data and named spans for one job. cProfile only sees the thread
+    that runs the job; work handed to other threads (map-reduce chunks, LLM
+    calls) shows up as time spent waiting on them, and in their spans.
+    """
+
+    def __init__(self, job_id, output_dir=PROFILE_DIR):
+        self.job_id = job_id
+        self.output_dir = os.path.join(output_dir, job_id)
+        self.profiler = cProfile.Profile()
+        self.spans = []
+        self.started_at = None
+        self.wall_s = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except ValueError as e:
+            # Python 3.12+ allows one active cProfile per process; keep the spans
+            logger.warning(f"cProfile unavailable for job {self.job_id}, recording spans only: {e}")
+            self.profiler = None
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.wall_s = round(time.perf_counter() - self.started_at, 3)
+
+    def add_span(self, name, start, end, depth):
+        self.spans.append({
+            "name": name,
+            "start_s": round(start - self.started_at, 3),
+            "duration_s": round(end - start, 3),
+            "depth": depth,
+            "thread": threading.current_thread().name,
+        })
+
+    def summary(self, limit=40):
+        if self.profiler is None:
+            return "cProfile was not available for this job, see spans.json\n"
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(self.output_dir, PROFILE_FILES["prof"]))
+        with open(os.path.join(self.output_dir, PROFILE_FILES["txt"]), "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        with open(os.path.join(self.output_dir, PROFILE_FILES["json"]), "w", encoding="utf-8") as f:
+            json.dump({
+                "job_id": self.job_id,
+                "wall_s": self.wall_s,
+                "spans": sorted(self.spans, key=lambda s: (s["start_s"], s["depth"])),
+            }, f, indent=2)
+        logger.info(f"Saved profile of job {self.job_id} to {self.output_dir}")
+
+
+class _Span:
+    __slots__ = ("profile", "name", "start", "depth")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        # Nesting depth is tracked per thread
+        self.depth = getattr(_local, "depth", 0)
+        _local.depth = self.depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _local.depth = self.depth
+        self.profile.add_span(self.name, self.start, time.perf_counter(), self.depth)
+        return False
+
+
+def current():
+    """The JobProfile of the job running in this thread, or None"""
+    return getattr(_local, "profile", None)
+
+
+def span(name, profile=None):
+    """
+    Context manager timing a named span of the current job. A no-op unless
+    the job is being profiled. Pass profile explicitly from worker threads.
+    """
+    profile = profile or getattr(_local, "profile", None)
+    return _NULL_SPAN if profile is None else _Span(profile, name)
+
+
+@contextmanager
+def profile_job(job_id, enabled=True, output_dir=PROFILE_DIR):
+    """
+    Profile the code run inside the block as job_id and save the results to
+    output_dir/job_id. Yields the JobProfile, or None when not enabled.
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = JobProfile(job_id, output_dir)
+    _local.profile = profile
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _local.profile = None
+        try:
+            profile.save()
+        except OSError as e:
+            logger.warning(f"Could not save profile of job {job_id}: {e}")
+        # Each saved profile is the only thing that grows the directory, so sweep here
+        sweep(output_dir)
+
+
+def sweep(output_dir=PROFILE_DIR, max_age_s=PROFILE_MAX_AGE_S, max_count=PROFILE_MAX_COUNT):
+    """Delete saved profiles past max_age_s, then the oldest beyond max_count; returns how many were removed"""
+    try:
+        entries = [e for e in os.scandir(output_dir) if e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return 0
+
+    now = time.time()
+    profiles = sorted(((e.stat().st_mtime, e.path) for e in entries), reverse=True)
+    expired = [
+        path for i, (mtime, path) in enumerate(profiles)
+        if (max_age_s and now - mtime > max_age_s) or (max_count and i >= max_count)
+    ]
+    for path in expired:
+        shutil.rmtree(path, ignore_errors=True)
+    if expired:
+        logger.info(f"Deleted {len(expired)} old profile(s) from {output_dir}")
+    return len(expired)
+
+
+def profile_path(job_id, fmt="prof", output_dir=PROFILE_DIR):
+    """Path of a saved profile file, or None for an invalid job ID or format"""
+    if fmt not in PROFILE_FILES or not JOB_ID_PATTERN.match(job_id):
+        return None
+    return os.path.join(output_dir, job_id, PROFILE_FILES[fmt])
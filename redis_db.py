@@ -1,20 +1,40 @@
-import redis
 import json
 import os
+import time
 from datetime import timedelta
 
+# Drops expired leases, then adds the job's lease if the tenant holds fewer
+# than the limit; atomic, so workers cannot both take the last one
+ACQUIRE_LEASE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if not redis.call('ZSCORE', KEYS[1], ARGV[3]) and redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
 class RedisStorage:
     def __init__(self):
-        self.redis_client = redis.Redis(
-            host=os.getenv('REDIS_HOST', 'localhost'),
-            port=int(os.getenv('REDIS_PORT', 6379)),
-            password=os.getenv('REDIS_PASSWORD', None),
-            db=int(os.getenv('REDIS_DB', 0)),
-            decode_responses=True
-        )
+        self._redis_client = None
         # Set default TTL to 24 hours
         self.default_ttl = timedelta(hours=24)
 
+    @property
+    def redis_client(self):
+        """Created on first use, so importing this module neither loads redis nor connects"""
+        if self._redis_client is None:
+            import redis
+            self._redis_client = redis.Redis(
+                host=os.getenv('REDIS_HOST', 'localhost'),
+                port=int(os.getenv('REDIS_PORT', 6379)),
+                password=os.getenv('REDIS_PASSWORD', None),
+                db=int(os.getenv('REDIS_DB', 0)),
+                decode_responses=True
+            )
+        return self._redis_client
+
     def store_result(self, job_id, result):
         """Store result with expiration"""
         self.redis_client.setex(
@@ -32,6 +52,45 @@ class RedisStorage:
         """Delete result by job ID"""
         self.redis_client.delete(f"faq_job:{job_id}")
 
+    def request_cancel(self, job_id):
+        """Ask whichever process runs the job to cancel it"""
+        self.redis_client.setex(f"faq_job_cancel:{job_id}", self.default_ttl, 1)
+
+    def pop_cancel_request(self, job_id):
+        """True (once) if cancelling the job was requested"""
+        return self.redis_client.delete(f"faq_job_cancel:{job_id}") > 0
+
+    def acquire_tenant_lease(self, tenant, job_id, limit, ttl_s):
+        """Take one of the tenant's `limit` running leases shared by all workers; False if all are taken"""
+        now = time.time()
+        return bool(self.redis_client.eval(
+            ACQUIRE_LEASE, 1, f"faq_tenant_leases:{tenant}", now, limit, job_id, now + ttl_s, int(ttl_s)
+        ))
+
+    def refresh_tenant_leases(self, leases, ttl_s):
+        """Keep the (tenant, job_id) leases of running jobs from expiring"""
+        pipe = self.redis_client.pipeline()
+        for tenant, job_id in leases:
+            pipe.zadd(f"faq_tenant_leases:{tenant}", {job_id: time.time() + ttl_s})
+            pipe.expire(f"faq_tenant_leases:{tenant}", int(ttl_s))
+        pipe.execute()
+
+    def release_tenant_lease(self, tenant, job_id):
+        self.redis_client.zrem(f"faq_tenant_leases:{tenant}", job_id)
+
+    def publish_scheduler_stats(self, worker_id, stats, ttl_s):
+        """Share one worker's scheduler stats for aggregating across workers"""
+        self.redis_client.setex(f"faq_scheduler_stats:{worker_id}", int(ttl_s), json.dumps(stats))
+
+    def get_scheduler_stats(self):
+        """worker_id -> stats of every worker that published recently"""
+        keys = list(self.redis_client.scan_iter(match="faq_scheduler_stats:*"))
+        values = self.redis_client.mget(keys) if keys else []
+        return {
+            key.split(":", 1)[1]: json.loads(value)
+            for key, value in zip(keys, values) if value
+        }
+
     def cleanup_expired(self):
         """Clean up expired jobs (Redis handles this automatically with TTL)"""
         pass
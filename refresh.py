@@ -0,0 +1,239 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from urllib.parse import urlparse
+
+import save_url_to_html
+import scraper_ai
+import generate_faq
+import html_cleaner
+import token_budget
+from job_control import JobControl
+import profiling
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where the previous run of each (url, platform, language) is remembered
+FAQ_STATE_DIR = os.getenv("FAQ_STATE_DIR", "faq_state")
+
+# Extracted content that is not a JSON object is treated as one section
+WHOLE_CONTENT = "content"
+
+
+def content_hash(value):
+    """Stable hash of a JSON value or string"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def section_hashes(content):
+    """Hash each top-level section of the extracted content"""
+    if isinstance(content, dict):
+        return {key: content_hash(value) for key, value in content.items()}
+    return {WHOLE_CONTENT: content_hash(content)}
+
+
+def _normalize_section(name):
+    return "_".join(str(name).lower().replace("-", " ").split())
+
+
+def _state_file(url, plf, language, state_dir):
+    parsed_url = urlparse(url)
+    page_name = parsed_url.path.strip("/").split("/")[-1] if parsed_url.path else parsed_url.netloc.replace("www.", "")
+    key = hashlib.sha1(f"{url.rstrip('/')}|{plf}|{language}".encode("utf-8")).hexdigest()[:10]
+    return os.path.join(state_dir, f"{page_name or 'page'}_{plf}_{language}_{key}.json")
+
+
+def load_state(url, plf, language, state_dir=FAQ_STATE_DIR):
+    path = _state_file(url, plf, language, state_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable refresh state {path}: {e}")
+        return None
+
+
+def save_state(state, state_dir=FAQ_STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_file(state["url"], state["plf"], state["language"], state_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _extraction_tokens(source_tokens):
+    """Estimated prompt tokens the extraction step sends for a source of this size"""
+    if source_tokens > scraper_ai.MAP_REDUCE_THRESHOLD_TOKENS:
+        return min(source_tokens, scraper_ai.MAP_REDUCE_CHUNK_TOKENS * scraper_ai.MAP_REDUCE_MAX_CHUNKS)
+    return min(source_tokens, token_budget.EXTRACTION_TOKEN_BUDGET)
+
+
+def _faq_tokens(content, platform, language, faq_count, sections=None):
+    """Estimated prompt tokens of an FAQ call, without making it"""
+    system_prompt, prompt = generate_faq.build_faq_prompt(content, platform, language, faq_count, sections)
+    return token_budget.estimate_tokens(system_prompt) + token_budget.estimate_tokens(prompt)
+
+
+def _tag_sections(faqs, sections):
+    """Map the "section" the model named for each FAQ back to a content key"""
+    lookup = {_normalize_section(section): section for section in sections}
+    for faq in faqs:
+        faq["section"] = lookup.get(_normalize_section(faq.get("section", "")))
+    return faqs
+
+
+def run_refresh(url, plf, out_file=None, language="en", faq_count=10, state_dir=FAQ_STATE_DIR, output_dir=None, control=None):
+    """
+    Refresh the FAQ for a page, reusing the previous run where possible.
+
+    Pages are always re-rendered and hashed after cleaning. If no page changed,
+    the stored FAQs are written out with no LLM call. Otherwise the content
+    is re-extracted and hashed per top-level section; only the FAQs tied to
+    changed or removed sections are regenerated, the rest are kept.
+
+    Returns a report dict (what changed, LLM calls made, tokens sent and
+    avoided) or None on failure. control is a JobControl, as for run_pipeline.
+    """
+    if control is None:
+        control = JobControl.unbounded()
+
+    platform = {"fb": "facebook", "ig": "instagram", "x": "x", "df": "default"}.get(plf)
+    if platform is None:
+        logger.error(f"Invalid platform '{plf}'.")
+        return None
+
+    parsed_url = urlparse(url)
+    page_name = parsed_url.path.strip("/").split("/")[-1] if parsed_url.path else parsed_url.netloc.replace("www.", "")
+    output_dir = output_dir or page_name
+    os.makedirs(output_dir, exist_ok=True)
+    if out_file is None:
+        out_file = f"{output_dir}_{plf}_{language}_faq.md"
+
+    previous = load_state(url, plf, language, state_dir)
+    report = {
+        "url": url,
+        "first_run": previous is None,
+        "pages_changed": [],
+        "changed_sections": [],
+        "removed_sections": [],
+        "unchanged_sections": [],
+        "llm_calls": {"extract": False, "faq": False},
+        "faqs_kept": 0,
+        "faqs_regenerated": 0,
+        "tokens_sent": 0,
+        "tokens_avoided": 0,
+    }
+
+    # 1. Render and hash the cleaned pages
+    logger.info(f"[1/3] Saving rendered HTML from {url} → {output_dir}")
+    control.enter_stage("render")
+    with profiling.span("render"):
+        results = save_url_to_html.save_multiple_pages(url, output_dir=output_dir, headless=True, platform=platform, control=control)
+    if not all(data["success"] for data in results.values()):
+        logger.error("Failed to save some HTML pages")
+        return None
+
+    html_files = [data["file"] for data in results.values()]
+    source_hashes, source_tokens = {}, 0
+    for html_file, cleaned in zip(html_files, html_cleaner.clean_html_files(html_files, url)):
+        if isinstance(cleaned, Exception):
+            logger.error(f"Error processing {html_file}: {cleaned}")
+            return None
+        source_hashes[os.path.basename(html_file)] = content_hash(cleaned[1])
+        source_tokens += token_budget.estimate_tokens(cleaned[1])
+
+    extract_tokens = _extraction_tokens(source_tokens)
+    previous_sources = (previous or {}).get("source_hashes", {})
+    report["pages_changed"] = sorted(
+        name for name in set(source_hashes) | set(previous_sources)
+        if source_hashes.get(name) != previous_sources.get(name)
+    )
+
+    # 2. Extract, unless no page changed since the last run
+    if previous and not report["pages_changed"] and previous.get("content") is not None:
+        logger.info("[2/3] No page changed, reusing extracted content")
+        content = previous["content"]
+        report["tokens_avoided"] += extract_tokens
+    else:
+        json_file = os.path.join(output_dir, f"{page_name}_{plf}.json")
+        logger.info(f"[2/3] Extracting structured data → {json_file}")
+        control.enter_stage("extract")
+        with profiling.span("extract"):
+            extracted = scraper_ai.run_scraper(html_files, url, json_file, platform=platform, language=language, control=control)
+        if not extracted:
+            logger.error("Failed to extract data")
+            return None
+        with open(json_file, "r", encoding="utf-8") as f:
+            content = json.load(f)
+        report["llm_calls"]["extract"] = True
+        report["tokens_sent"] += extract_tokens
+
+    # 3. Regenerate the FAQs of changed sections only
+    hashes = section_hashes(content)
+    previous_hashes = (previous or {}).get("section_hashes", {})
+    previous_faqs = (previous or {}).get("faqs", [])
+    reusable = previous and previous.get("faq_count") == faq_count and previous_faqs
+
+    report["changed_sections"] = [s for s in hashes if previous_hashes.get(s) != hashes[s]]
+    report["removed_sections"] = [s for s in previous_hashes if s not in hashes]
+    report["unchanged_sections"] = [s for s in hashes if previous_hashes.get(s) == hashes[s]]
+
+    full_faq_tokens = _faq_tokens(content, platform, language, faq_count, list(hashes))
+    kept = [faq for faq in previous_faqs if faq.get("section") in report["unchanged_sections"]] if reusable else []
+    missing = faq_count - len(kept)
+
+    if reusable and (missing <= 0 or not report["changed_sections"] and not report["removed_sections"]):
+        logger.info("[3/3] FAQ content unchanged, reusing previous FAQs")
+        faqs = previous_faqs if missing > 0 else kept[:faq_count]
+        report["tokens_avoided"] += full_faq_tokens
+    else:
+        if reusable:
+            # Only show the model the sections whose FAQs are being replaced
+            sections = report["changed_sections"] or list(hashes)
+            changed_content = {s: content[s] for s in sections} if isinstance(content, dict) else content
+        else:
+            kept, missing, sections, changed_content = [], faq_count, list(hashes), content
+
+        logger.info(f"[3/3] Generating {missing} FAQ(s) for section(s): {', '.join(sections)}")
+        usage = {}
+        control.enter_stage("generate")
+        with profiling.span("generate"):
+            generated = generate_faq.generate_faq_items(changed_content, platform, language, missing, sections, usage, control)
+        if not generated:
+            logger.error("Failed to generate FAQ")
+            return None
+
+        faqs = kept + _tag_sections(generated, sections)
+        report["llm_calls"]["faq"] = True
+        report["tokens_sent"] += usage.get("prompt_tokens", 0)
+        report["tokens_avoided"] += max(0, full_faq_tokens - usage.get("prompt_tokens", 0))
+
+    report["faqs_kept"] = len([faq for faq in faqs if faq in kept])
+    report["faqs_regenerated"] = len(faqs) - report["faqs_kept"]
+
+    generate_faq.write_faq_markdown(faqs, out_file)
+    save_state({
+        "url": url,
+        "plf": plf,
+        "language": language,
+        "faq_count": faq_count,
+        "updated_at": datetime.now().isoformat(),
+        "source_hashes": source_hashes,
+        "section_hashes": hashes,
+        "content": content,
+        "faqs": faqs,
+    }, state_dir)
+
+    logger.info(
+        f"Refresh finished: {len(report['changed_sections'])} changed section(s), "
+        f"{report['faqs_regenerated']} FAQ(s) regenerated, ~{report['tokens_avoided']} tokens avoided"
+    )
+    return report
@@ -0,0 +1,309 @@
+import os
+import time
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+
+import proc_stats
+from job_control import JobControl
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pages are rendered in supervised worker processes, each owning one browser.
+# The job thread only waits on the worker, sampling the memory and CPU of its
+# process tree; a render over its limits is killed and fails that page alone.
+
+# Kill a render whose worker (Python, Playwright driver and browser processes) exceeds this RSS
+RENDER_MAX_RSS_MB = int(os.getenv("RENDER_MAX_RSS_MB", 1536))
+# Kill a render that uses more CPU time than this across its process tree
+RENDER_MAX_CPU_S = int(os.getenv("RENDER_MAX_CPU_S", 120))
+# V8 heap limit per page, passed to Chromium. RLIMIT_AS is not usable for
+# this: Chromium reserves far more address space than it ever touches.
+RENDER_JS_HEAP_MB = int(os.getenv("RENDER_JS_HEAP_MB", 512))
+
+# A worker is retired after this many renders, or when it idles above this RSS
+RENDER_RECYCLE_AFTER = int(os.getenv("RENDER_RECYCLE_AFTER", 20))
+RENDER_RECYCLE_RSS_MB = int(os.getenv("RENDER_RECYCLE_RSS_MB", 768))
+# Idle workers kept for reuse; more are started when jobs render concurrently
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", 2))
+
+RENDER_POLL_S = 0.25
+NAVIGATION_TIMEOUT_MS = 60000
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+class RenderError(Exception):
+    pass
+
+
+def kill_tree(pid):
+    """SIGKILL a process and all its descendants"""
+    for child in reversed(proc_stats.process_tree(pid)):
+        try:
+            os.kill(child, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+# -- worker process ------------------------------------------------------
+
+def _prefer_for_oom_kill():
+    """Make the kernel OOM killer pick this process tree before the web workers"""
+    try:
+        with open("/proc/self/oom_score_adj", "w") as f:
+            f.write("1000")
+    except OSError:
+        pass
+
+
+def _launch_browser(p, headless):
+    try:
+        browser = p.chromium.launch(
+            headless=headless,
+            slow_mo=200,
+            args=[f"--js-flags=--max-old-space-size={RENDER_JS_HEAP_MB}"],
+        )
+        logger.info("Using Chromium browser")
+    except Exception as e:
+        logger.warning(f"Chromium launch failed, trying Firefox: {e}")
+        browser = p.firefox.launch(headless=headless, slow_mo=200)
+        logger.info("Using Firefox browser")
+    return browser
+
+
+def _render_page(browser, url, html_file, wait_ms):
+    context = browser.new_context(user_agent=USER_AGENT)
+    try:
+        page = context.new_page()
+        page.goto(url, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT_MS)
+        page.wait_for_timeout(wait_ms)
+        # page.wait_for_selector("[data_pagelet]", timeout=30000)
+        time.sleep(2)
+        html = page.content()
+    finally:
+        # A fresh context per page, so nothing carries over between jobs
+        context.close()
+
+    with open(html_file, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def _worker_main(conn, headless):
+    """Render requests from conn until it is closed; replies (ok, error message)"""
+    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+
+    _prefer_for_oom_kill()
+    with sync_playwright() as p:
+        browser = None
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+
+            url, html_file, wait_ms = request
+            try:
+                if browser is None:
+                    browser = _launch_browser(p, headless)
+                _render_page(browser, url, html_file, wait_ms)
+                conn.send((True, None))
+            except PlaywrightTimeoutError:
+                conn.send((False, f"Timeout when loading {url}"))
+            except Exception as e:
+                conn.send((False, str(e)))
+                # The browser may have crashed (e.g. a renderer killed for memory); start afresh next time
+                if browser is not None:
+                    try:
+                        browser.close()
+                    except Exception:
+                        pass
+                    browser = None
+
+        if browser is not None:
+            browser.close()
+
+
+# -- supervisor ----------------------------------------------------------
+
+class RenderWorker:
+    def __init__(self, headless=True):
+        context = multiprocessing.get_context("spawn")
+        self.headless = headless
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, headless), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.renders = 0
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def rss_mb(self, tree=None):
+        return proc_stats.tree_rss_kb(self.process.pid, tree) / 1024
+
+    def kill(self):
+        kill_tree(self.process.pid)
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=10)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+    def render(self, url, html_file, wait_ms, control, stats):
+        """
+        Render one page, enforcing the memory, CPU and time limits. Fills stats
+        with the page's peak RSS, CPU time and wall time. Raises RenderError if
+        the page failed or the worker had to be killed, JobCancelled if the job
+        was cancelled (the worker is killed then too).
+        """
+        pid = self.process.pid
+        start = time.monotonic()
+        cpu_start = proc_stats.tree_cpu_seconds(pid)
+        wall_limit = control.timeout(NAVIGATION_TIMEOUT_MS / 1000 + wait_ms / 1000 + 30)
+        peak_mb = self.rss_mb()
+        self.renders += 1
+
+        def record():
+            stats["peak_rss_mb"] = round(peak_mb, 1)
+            stats["cpu_s"] = round(max(0.0, proc_stats.tree_cpu_seconds(pid) - cpu_start), 2)
+            stats["seconds"] = round(time.monotonic() - start, 3)
+
+        self.conn.send((url, html_file, wait_ms))
+        try:
+            while not self.conn.poll(RENDER_POLL_S):
+                control.check()
+                # One scan of /proc per poll for both samples
+                tree = proc_stats.process_tree(pid)
+                rss_mb = self.rss_mb(tree)
+                peak_mb = max(peak_mb, rss_mb)
+                cpu_s = proc_stats.tree_cpu_seconds(pid, tree) - cpu_start
+
+                if not self.process.is_alive():
+                    # e.g. picked by the kernel OOM killer
+                    raise RenderError(f"render worker died (exit code {self.process.exitcode})")
+                if rss_mb > RENDER_MAX_RSS_MB:
+                    raise RenderError(f"render used {rss_mb:.0f} MB, over the {RENDER_MAX_RSS_MB} MB limit")
+                if cpu_s > RENDER_MAX_CPU_S:
+                    raise RenderError(f"render used {cpu_s:.0f}s of CPU, over the {RENDER_MAX_CPU_S}s limit")
+                if time.monotonic() - start > wall_limit:
+                    raise RenderError(f"render did not finish within {wall_limit:.0f}s")
+
+            ok, error = self.conn.recv()
+        except (RenderError, EOFError, OSError) as e:
+            record()
+            self.kill()
+            # The worker may have been killed by the job's cancellation
+            control.check()
+            raise RenderError(str(e) or "render worker exited") from e
+        except BaseException:
+            record()
+            self.kill()
+            raise
+
+        peak_mb = max(peak_mb, self.rss_mb())
+        record()
+        if not ok:
+            raise RenderError(error)
+
+
+_idle_workers = []
+_busy_workers = set()
+_pool_lock = threading.Lock()
+
+
+def _acquire(headless):
+    with _pool_lock:
+        while _idle_workers:
+            worker = _idle_workers.pop()
+            if worker.alive and worker.headless == headless:
+                _busy_workers.add(worker)
+                return worker
+            worker.stop()
+    worker = RenderWorker(headless)
+    with _pool_lock:
+        _busy_workers.add(worker)
+    return worker
+
+
+def _release(worker):
+    """Keep a healthy worker for reuse, retire it if it is due for recycling"""
+    with _pool_lock:
+        _busy_workers.discard(worker)
+    if not worker.alive:
+        return
+
+    reason = None
+    if worker.renders >= RENDER_RECYCLE_AFTER:
+        reason = f"after {worker.renders} renders"
+    else:
+        rss_mb = worker.rss_mb()
+        if rss_mb > RENDER_RECYCLE_RSS_MB:
+            reason = f"at {rss_mb:.0f} MB RSS"
+
+    if reason is None:
+        with _pool_lock:
+            if len(_idle_workers) < RENDER_POOL_SIZE:
+                _idle_workers.append(worker)
+                return
+        reason = "pool is full"
+
+    logger.info(f"Recycling render worker {worker.process.pid} {reason}")
+    worker.stop()
+
+
+def render(url, html_file, wait_ms, headless=True, control=None, stats=None):
+    """
+    Render url into html_file in a pooled worker process. Returns True on
+    success; stats (if given) gets peak_rss_mb, cpu_s, seconds and, on
+    failure, error. Raises JobCancelled if the job is cancelled.
+    """
+    if control is None:
+        control = JobControl.unbounded()
+    if stats is None:
+        stats = {}
+
+    control.check()
+    # Waits for one of the tenant's browser slots when jobs run under the scheduler
+    with control.slot("browser"):
+        worker = _acquire(headless)
+        kill_worker = control.add_cleanup(lambda: kill_tree(worker.process.pid))
+        try:
+            worker.render(url, html_file, wait_ms, control, stats)
+            return True
+        except RenderError as e:
+            stats["error"] = str(e)
+            logger.error(f"Rendering {url} failed: {e}")
+            return False
+        finally:
+            control.remove_cleanup(kill_worker)
+            _release(worker)
+
+
+def shutdown():
+    """Stop all idle workers and kill the busy ones with their browsers; run at exit and on gunicorn worker_exit"""
+    with _pool_lock:
+        idle, _idle_workers[:] = list(_idle_workers), []
+        busy = list(_busy_workers)
+        _busy_workers.clear()
+    for worker in busy:
+        kill_tree(worker.process.pid)
+    for worker in idle:
+        worker.stop()
+
+
+# Daemon worker processes are terminated at exit, but their browsers would be left behind
+atexit.register(shutdown)
@@ -1,12 +1,17 @@
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-import time
 import logging
 import os
 from urllib.parse import urlparse
 
+from job_control import JobControl
+import render_worker
+import profiling
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Time to let client-side rendering settle after the DOM is loaded
+RENDER_WAIT_MS = int(os.getenv("RENDER_WAIT_MS", 20000))
+
 # Platform-specific path configurations
 PLATFORM_PATHS = {
     "facebook": [
@@ -26,44 +31,24 @@ PLATFORM_PATHS = {
     ]
 }
 
-def save_rendered_html(url, html_file="page.html", headless=True):
-    try:
-        with sync_playwright() as p:
-            try:
-                browser = p.chromium.launch(headless=headless, slow_mo=200)
-                logger.info("Using Chromium browser")
-            except Exception as e:
-                logger.warning(f"Chromium launch failed, trying Firefox: {e}")
-                browser = p.firefox.launch(headless=headless, slow_mo=200)
-                logger.info("Using Firefox browser")
-
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            )
-            page = context.new_page()
-
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-
-                page.wait_for_timeout(20000)
-                # page.wait_for_selector("[data_pagelet]", timeout=30000)
-                time.sleep(2)
-
-                html = page.content()
-
-                with open(html_file, "w", encoding="utf-8") as f:
-                    f.write(html)
-                logger.info(f"Successfully saved rendered HTML to {html_file}")
-
-            except PlaywrightTimeoutError:
-                logger.error(f"Timeout when loading {url}")
-                return False
-            finally:
-                browser.close()
+def save_rendered_html(url, html_file="page.html", headless=True, control=None, stats=None):
+    """
+    Render url in a headless browser and save the HTML. The browser runs in
+    a supervised worker process (see render_worker) with memory and CPU
+    limits, so a page that blows up fails on its own. If a stats dict is
+    given, the page's peak_rss_mb, cpu_s, seconds and any error are recorded
+    in it.
+    """
+    if control is None:
+        control = JobControl.unbounded()
 
-        return True
+    try:
+        return render_worker.render(url, html_file, RENDER_WAIT_MS, headless, control, stats)
     except Exception as e:
-        logger.error(f"Error in save_rendered_html: {e}")
+        if control.cancelled:
+            logger.warning(f"Rendering {url} stopped: {control.reason}")
+        else:
+            logger.error(f"Error in save_rendered_html: {e}")
         return False
     
 def detect_platform_from_url(url):
@@ -88,17 +73,21 @@ def get_paths_for_platform(platform):
     """
     return PLATFORM_PATHS.get(platform, PLATFORM_PATHS['default'])
     
-def save_multiple_pages(base_url, paths=None, output_dir="html_pages", headless=True, platform=None):
+def save_multiple_pages(base_url, paths=None, output_dir=None, headless=True, platform=None, control=None):
     """
     Save multiple pages from the same domain to HTML files
     
     Args:
         base_url: The base URL (e.g., "https://www.facebook.com/diemthongnhat")
         paths: List of paths to scrape (e.g., ["", "/about", "/about_profile_transparency"])
-        output_dir: Directory to save HTML files
+        output_dir: Directory to save HTML files (default: named after the page)
         headless: Whether to run browser in headless mode
         platform: Platform name (optional, will auto-detect from URL if not provided)
+        control: JobControl used to stop between and during pages (optional)
     """
+    if control is None:
+        control = JobControl.unbounded()
+
     # Auto-detect platform if not provided
     if platform is None:
         platform = detect_platform_from_url(base_url)
@@ -113,8 +102,8 @@ def save_multiple_pages(base_url, paths=None, output_dir="html_pages", headless=
     parsed_url = urlparse(base_url)
     page_name = parsed_url.path.strip("/").split("/")[-1] if parsed_url.path else parsed_url.netloc.replace("www.", "")
     
-    # Create output directory using the page name
-    output_dir = page_name
+    # Create output directory, named after the page unless given
+    output_dir = output_dir or page_name
     os.makedirs(output_dir, exist_ok=True)
     
     results = {}
@@ -133,12 +122,17 @@ def save_multiple_pages(base_url, paths=None, output_dir="html_pages", headless=
             
         html_file = os.path.join(output_dir, f"{filename}.html")
         
+        control.check()
         logger.info(f"Scraping {full_url} → {html_file}")
-        success = save_rendered_html(full_url, html_file, headless)
-        results[full_url] = {"success": success, "file": html_file}
+        stats = {}
+        with profiling.span(f"render.page:{filename}"):
+            success = save_rendered_html(full_url, html_file, headless, control, stats)
+        results[full_url] = {"success": success, "file": html_file, **stats}
+        if "peak_rss_mb" in stats:
+            logger.info(f"Rendered {full_url} in {stats['seconds']}s, peak RSS {stats['peak_rss_mb']} MB")
         
         # Add a small delay between requests
-        time.sleep(2)
+        control.sleep(2)
     
     return results
 
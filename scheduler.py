@@ -0,0 +1,472 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Jobs wait in per-tenant queues and are started when a run slot is free.
+# Interactive jobs go before bulk ones; within a priority class, tenants are
+# served by smooth weighted round-robin, so one client's batch cannot starve
+# the others. Running jobs also take per-tenant browser and LLM slots around
+# each render and LLM call.
+#
+# Queues, SCHEDULER_MAX_RUNNING, the bulk limit and the slots are per app
+# process: with several gunicorn workers each has its own, and a job waits in
+# the queue of the worker that accepted it. TENANT_MAX_RUNNING holds across
+# workers when the scheduler is given the shared job store (see `leases`):
+# each running job holds one of its tenant's leases there.
+
+PRIORITIES = ["interactive", "bulk"]
+
+SCHEDULER_MAX_RUNNING = int(os.getenv("SCHEDULER_MAX_RUNNING", 4))
+# Bulk jobs never take the last slots, so an interactive job can start right away
+SCHEDULER_BULK_MAX_RUNNING = int(os.getenv("SCHEDULER_BULK_MAX_RUNNING", max(1, SCHEDULER_MAX_RUNNING - 1)))
+# A bulk job waiting this long is served with the interactive ones
+SCHEDULER_BULK_AGING_S = int(os.getenv("SCHEDULER_BULK_AGING_S", 300))
+TENANT_MAX_RUNNING = int(os.getenv("TENANT_MAX_RUNNING", 2))
+# A running job renews its tenant lease on every poll(); the lease of a worker
+# that died without releasing it expires after this long
+TENANT_LEASE_TTL_S = int(os.getenv("TENANT_LEASE_TTL_S", 60))
+
+# Slots held around each render and each LLM call: (all tenants, per tenant)
+SLOT_LIMITS = {
+    "browser": (int(os.getenv("BROWSER_SLOTS", 3)), int(os.getenv("TENANT_BROWSER_SLOTS", 1))),
+    "llm": (int(os.getenv("LLM_SLOTS", 8)), int(os.getenv("TENANT_LLM_SLOTS", 4))),
+}
+
+# "<api key or client IP>=<weight>,..."; tenants not listed have weight 1
+TENANT_WEIGHTS = os.getenv("TENANT_WEIGHTS", "")
+# API keys that make their own tenant, comma-separated; keys in TENANT_WEIGHTS count too.
+# Requests with any other key (or none) are scheduled by client IP.
+API_KEYS = os.getenv("API_KEYS", "")
+
+# Stats and slots of a tenant with no jobs are dropped once it has been idle this long
+TENANT_IDLE_S = int(os.getenv("TENANT_IDLE_S", 3600))
+TENANT_PRUNE_INTERVAL_S = 60
+
+# Queue waits kept per tenant and priority for the percentiles
+WAIT_SAMPLES = 500
+SLOT_POLL_S = 0.25
+
+
+def tenant_id(api_key=None, ip=None):
+    """Tenant of a request: its API key (hashed, never stored in clear) or else its client IP"""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return f"ip:{ip or 'unknown'}"
+
+
+def parse_keys(spec):
+    """Tenant IDs of a comma-separated list of API keys"""
+    return {tenant_id(api_key=key.strip()) for key in spec.split(",") if key.strip()}
+
+
+def parse_weights(spec):
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().rpartition("=")
+        if not name:
+            continue
+        try:
+            weight = max(1, int(weight))
+        except ValueError:
+            logger.warning(f"Ignoring tenant weight {item.strip()!r}")
+            continue
+        # Either an IP address or an API key
+        is_ip = name.replace(".", "").isdigit() or ":" in name
+        weights[f"ip:{name}" if is_ip else tenant_id(api_key=name)] = weight
+    return weights
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))], 3)
+
+
+class _Job:
+    __slots__ = ("job_id", "tenant", "priority", "func", "control", "on_drop", "submitted_at")
+
+    def __init__(self, job_id, tenant, priority, func, control, on_drop=None):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.priority = priority
+        self.func = func
+        self.control = control
+        self.on_drop = on_drop
+        self.submitted_at = time.monotonic()
+
+
+class _TenantStats:
+    def __init__(self):
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.removed = 0
+        self.last_active = time.monotonic()
+        self.waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self.slot_waits = {kind: deque(maxlen=WAIT_SAMPLES) for kind in SLOT_LIMITS}
+
+
+class TenantSlots:
+    """Browser and LLM slots of one tenant; JobControl.slot() holds one around a render or an LLM call"""
+
+    def __init__(self, scheduler, tenant):
+        self.scheduler = scheduler
+        self.tenant = tenant
+
+    @contextmanager
+    def hold(self, kind, control):
+        tenant_slots = self.scheduler._use_tenant_slots(self.tenant, kind)
+        global_slots = self.scheduler.global_slots[kind]
+        start = time.monotonic()
+
+        # Per-tenant first, so a tenant at its cap does not hold up the shared slots
+        acquired = []
+        try:
+            for semaphore in (tenant_slots, global_slots):
+                while not semaphore.acquire(timeout=SLOT_POLL_S):
+                    control.check()
+                acquired.append(semaphore)
+            self.scheduler._record_slot_wait(self.tenant, kind, time.monotonic() - start)
+            yield
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            self.scheduler._release_tenant_slots(self.tenant, kind)
+
+
+class Scheduler:
+    def __init__(self, max_running=SCHEDULER_MAX_RUNNING, bulk_max_running=SCHEDULER_BULK_MAX_RUNNING,
+                 tenant_max_running=TENANT_MAX_RUNNING, weights=None, api_keys=None, leases=None):
+        self.max_running = max_running
+        self.bulk_max_running = bulk_max_running
+        self.tenant_max_running = tenant_max_running
+        self.weights = parse_weights(TENANT_WEIGHTS) if weights is None else weights
+        self.api_keys = parse_keys(API_KEYS) if api_keys is None else api_keys
+        self.api_keys |= {tenant for tenant in self.weights if tenant.startswith("key:")}
+        self.lock = threading.Lock()
+        # priority -> tenant -> queued jobs, in arrival order
+        self.queues = {priority: {} for priority in PRIORITIES}
+        # Smooth weighted round-robin state, per priority and tenant
+        self.credit = {priority: {} for priority in PRIORITIES}
+        # Shared store with acquire/refresh/release_tenant_lease; None keeps tenant caps per process
+        self.leases = leases
+        self.running = {}
+        # job_id -> tenant of the jobs running here
+        self.running_jobs = {}
+        self.running_by_priority = {priority: 0 for priority in PRIORITIES}
+        self.stats_by_tenant = {}
+        self.global_slots = {kind: threading.BoundedSemaphore(limits[0]) for kind, limits in SLOT_LIMITS.items()}
+        # (tenant, kind) -> [semaphore, threads waiting for or holding it]
+        self._slots_by_tenant = {}
+        self.last_prune = time.monotonic()
+
+    def tenant(self, api_key=None, ip=None):
+        """
+        Tenant of a request. Only a known API key (API_KEYS or TENANT_WEIGHTS)
+        makes its own tenant, otherwise a client could send a new key with
+        every job to get more shares; all other requests go by client IP.
+        """
+        if api_key:
+            tenant = tenant_id(api_key=api_key)
+            if tenant in self.api_keys:
+                return tenant
+        return tenant_id(ip=ip)
+
+    def weight(self, tenant):
+        return self.weights.get(tenant, 1)
+
+    def _stats(self, tenant):
+        stats = self.stats_by_tenant.get(tenant)
+        if stats is None:
+            stats = self.stats_by_tenant[tenant] = _TenantStats()
+        return stats
+
+    def _use_tenant_slots(self, tenant, kind):
+        with self.lock:
+            entry = self._slots_by_tenant.get((tenant, kind))
+            if entry is None:
+                entry = self._slots_by_tenant[(tenant, kind)] = [threading.BoundedSemaphore(SLOT_LIMITS[kind][1]), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_tenant_slots(self, tenant, kind):
+        with self.lock:
+            entry = self._slots_by_tenant[(tenant, kind)]
+            entry[1] -= 1
+            if not entry[1]:
+                # Nobody waits for or holds it, so a fresh one would be the same
+                del self._slots_by_tenant[(tenant, kind)]
+
+    def _record_slot_wait(self, tenant, kind, seconds):
+        with self.lock:
+            stats = self._stats(tenant)
+            stats.slot_waits[kind].append(seconds)
+            stats.last_active = time.monotonic()
+
+    def _prune(self):
+        """Forget tenants with nothing queued or running that have been idle for TENANT_IDLE_S"""
+        now = time.monotonic()
+        if now - self.last_prune < TENANT_PRUNE_INTERVAL_S:
+            return
+        self.last_prune = now
+        busy = set(self.running)
+        for tenants in self.queues.values():
+            busy.update(tenants)
+        busy.update(tenant for tenant, _ in self._slots_by_tenant)
+        for tenant in [t for t, stats in self.stats_by_tenant.items() if t not in busy and now - stats.last_active > TENANT_IDLE_S]:
+            del self.stats_by_tenant[tenant]
+
+    def submit(self, job_id, func, control, tenant, priority="interactive", on_drop=None):
+        """
+        Queue func(), to run in its own thread once the scheduler picks it.
+        control gets the tenant's slots and is started when the job leaves
+        the queue. on_drop() is called instead of func() if the job is
+        cancelled before it starts. Returns the number of jobs queued ahead
+        in its class.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Invalid priority '{priority}'. Choose from {PRIORITIES}.")
+
+        control.slots = TenantSlots(self, tenant)
+        job = _Job(job_id, tenant, priority, func, control, on_drop)
+        with self.lock:
+            ahead = sum(len(queue) for queue in self.queues[priority].values())
+            self.queues[priority].setdefault(tenant, deque()).append(job)
+            stats = self._stats(tenant)
+            stats.submitted += 1
+            stats.last_active = time.monotonic()
+        self._dispatch()
+        return ahead
+
+    def remove(self, job_id):
+        """Drop a job that is still queued and call its on_drop; returns False if it is not queued"""
+        with self.lock:
+            job = self._take(job_id)
+        if job is None:
+            return False
+        self._drop(job)
+        return True
+
+    def _take(self, job_id):
+        for tenants in self.queues.values():
+            for tenant, queue in tenants.items():
+                for job in queue:
+                    if job.job_id == job_id:
+                        queue.remove(job)
+                        self._stats(tenant).removed += 1
+                        return job
+        return None
+
+    def _drop(self, job):
+        if job.on_drop:
+            try:
+                job.on_drop()
+            except Exception as e:
+                logger.error(f"Cleaning up dropped job {job.job_id} failed: {e}")
+
+    def _acquire_lease(self, job):
+        """Whether the tenant is under its cap counting its jobs on all workers"""
+        if self.leases is None:
+            return True
+        try:
+            return self.leases.acquire_tenant_lease(job.tenant, job.job_id, self.tenant_max_running, TENANT_LEASE_TTL_S)
+        except Exception as e:
+            logger.warning(f"Could not take a tenant lease, applying the tenant cap to this worker only: {e}")
+            return True
+
+    def _release_lease(self, job):
+        if self.leases is None:
+            return
+        try:
+            self.leases.release_tenant_lease(job.tenant, job.job_id)
+        except Exception as e:
+            # It expires after TENANT_LEASE_TTL_S
+            logger.warning(f"Could not release the tenant lease of job {job.job_id}: {e}")
+
+    def _can_run(self, tenant, priority):
+        if self.running.get(tenant, 0) >= self.tenant_max_running:
+            return False
+        return priority != "bulk" or self.running_by_priority["bulk"] < self.bulk_max_running
+
+    def _pick_from(self, priority, aged_only=False):
+        """Next job of a priority class by smooth weighted round-robin over the tenants that may run"""
+        now = time.monotonic()
+        eligible = [
+            tenant for tenant, queue in self.queues[priority].items()
+            if queue and self._can_run(tenant, priority)
+            and (not aged_only or now - queue[0].submitted_at > SCHEDULER_BULK_AGING_S)
+        ]
+        if not eligible:
+            return None
+
+        credit = self.credit[priority]
+        while eligible:
+            total = 0
+            for tenant in eligible:
+                credit[tenant] = credit.get(tenant, 0) + self.weight(tenant)
+                total += self.weight(tenant)
+            tenant = max(eligible, key=lambda t: credit[t])
+            queue = self.queues[priority][tenant]
+            if self._acquire_lease(queue[0]):
+                credit[tenant] -= total
+                return queue.popleft()
+            # At its cap through jobs on other workers: undo this round and pick among the rest
+            for t in eligible:
+                credit[t] -= self.weight(t)
+            eligible.remove(tenant)
+        return None
+
+    def _pick(self):
+        if sum(self.running.values()) >= self.max_running:
+            return None
+        # Bulk jobs that waited past the aging limit go first, then interactive, then bulk
+        return self._pick_from("bulk", aged_only=True) or self._pick_from("interactive") or self._pick_from("bulk")
+
+    def _dispatch(self):
+        """Start as many queued jobs as the limits allow"""
+        while True:
+            with self.lock:
+                job = self._pick()
+                if job is None:
+                    # Forget tenants with nothing queued
+                    for priority in PRIORITIES:
+                        for tenant in [t for t, q in self.queues[priority].items() if not q]:
+                            del self.queues[priority][tenant]
+                            self.credit[priority].pop(tenant, None)
+                    self._prune()
+                    return
+                dropped = job.control.cancelled
+                if dropped:
+                    self._stats(job.tenant).removed += 1
+                else:
+                    self.running[job.tenant] = self.running.get(job.tenant, 0) + 1
+                    self.running_jobs[job.job_id] = job.tenant
+                    self.running_by_priority[job.priority] += 1
+                    stats = self._stats(job.tenant)
+                    stats.started += 1
+                    stats.waits[job.priority].append(time.monotonic() - job.submitted_at)
+
+            if dropped:
+                # Cancelled while queued, and taken off the queue here before remove() got to it
+                self._release_lease(job)
+                self._drop(job)
+                continue
+            job.control.start()
+            threading.Thread(target=self._run, args=(job,), name=f"job-{job.job_id}", daemon=True).start()
+
+    def _run(self, job):
+        try:
+            job.func()
+        except Exception as e:
+            logger.error(f"Job {job.job_id} raised: {e}")
+        finally:
+            with self.lock:
+                self.running[job.tenant] -= 1
+                if not self.running[job.tenant]:
+                    del self.running[job.tenant]
+                del self.running_jobs[job.job_id]
+                self.running_by_priority[job.priority] -= 1
+                stats = self._stats(job.tenant)
+                stats.finished += 1
+                stats.last_active = time.monotonic()
+            self._release_lease(job)
+            self._dispatch()
+
+    def poll(self):
+        """
+        Periodic upkeep, well within TENANT_LEASE_TTL_S: renew the leases of
+        the jobs running here and start jobs that were held back because
+        their tenant was at its cap on other workers.
+        """
+        if self.leases is None:
+            return
+        with self.lock:
+            leases = [(tenant, job_id) for job_id, tenant in self.running_jobs.items()]
+        if leases:
+            try:
+                self.leases.refresh_tenant_leases(leases, TENANT_LEASE_TTL_S)
+            except Exception as e:
+                logger.warning(f"Could not renew tenant leases: {e}")
+        self._dispatch()
+
+    def stats(self):
+        """Queue length, running jobs and queue/slot wait times per tenant"""
+        now = time.monotonic()
+        with self.lock:
+            tenants = {}
+            for tenant, stats in self.stats_by_tenant.items():
+                queued = {p: list(self.queues[p].get(tenant, ())) for p in PRIORITIES}
+                waits = {}
+                for priority in PRIORITIES:
+                    samples = sorted(stats.waits[priority])
+                    waits[priority] = {
+                        "queued": len(queued[priority]),
+                        "oldest_queued_s": round(now - queued[priority][0].submitted_at, 3) if queued[priority] else None,
+                        "samples": len(samples),
+                        "p50_s": _percentile(samples, 0.5),
+                        "p95_s": _percentile(samples, 0.95),
+                        "max_s": round(samples[-1], 3) if samples else None,
+                    }
+                slot_waits = {}
+                for kind, samples in stats.slot_waits.items():
+                    samples = sorted(samples)
+                    slot_waits[kind] = {"samples": len(samples), "p50_s": _percentile(samples, 0.5), "p95_s": _percentile(samples, 0.95)}
+
+                tenants[tenant] = {
+                    "weight": self.weight(tenant),
+                    "running": self.running.get(tenant, 0),
+                    "submitted": stats.submitted,
+                    "started": stats.started,
+                    "finished": stats.finished,
+                    "removed": stats.removed,
+                    "queue_wait": waits,
+                    "slot_wait": slot_waits,
+                }
+
+            return {
+                "max_running": self.max_running,
+                "bulk_max_running": self.bulk_max_running,
+                "tenant_max_running": self.tenant_max_running,
+                "running": sum(self.running.values()),
+                "running_by_priority": dict(self.running_by_priority),
+                "queued": {p: sum(len(q) for q in self.queues[p].values()) for p in PRIORITIES},
+                "slots": {kind: {"total": limits[0], "per_tenant": limits[1]} for kind, limits in SLOT_LIMITS.items()},
+                "tenants": tenants,
+            }
+
+
+def merge_stats(by_worker):
+    """
+    Totals of the stats() of several workers (worker id -> stats). Counts
+    are summed; wait percentiles cannot be merged and stay per worker.
+    """
+    tenants = {}
+    for stats in by_worker.values():
+        for tenant, entry in stats["tenants"].items():
+            total = tenants.setdefault(tenant, {
+                "running": 0, "submitted": 0, "started": 0, "finished": 0, "removed": 0,
+                "queued": {p: 0 for p in PRIORITIES},
+            })
+            for key in ("running", "submitted", "started", "finished", "removed"):
+                total[key] += entry[key]
+            for priority in PRIORITIES:
+                total["queued"][priority] += entry["queue_wait"][priority]["queued"]
+
+    return {
+        "workers": len(by_worker),
+        "running": sum(stats["running"] for stats in by_worker.values()),
+        "running_by_priority": {p: sum(stats["running_by_priority"][p] for stats in by_worker.values()) for p in PRIORITIES},
+        "queued": {p: sum(stats["queued"][p] for stats in by_worker.values()) for p in PRIORITIES},
+        "tenants": tenants,
+        "by_worker": by_worker,
+    }
+
+# Singleton instance
+scheduler = Scheduler()
@@ -1,14 +1,31 @@
-from scrapegraphai.graphs import SmartScraperGraph
-from scrapegraphai.utils import cleanup_html
 import json
 import os
+import re
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+import html_cleaner
+import token_budget
+import model_router
+from job_control import JobControl
+import profiling
+
 load_dotenv()
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")
+
+# Sources above this size are extracted chunk by chunk and the results merged
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", token_budget.EXTRACTION_TOKEN_BUDGET))
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", 12000))
+MAP_REDUCE_MAX_CHUNKS = int(os.getenv("MAP_REDUCE_MAX_CHUNKS", 8))
+MAP_REDUCE_WORKERS = int(os.getenv("MAP_REDUCE_WORKERS", 4))
+
+SECTION_PATTERN = re.compile(r"(?=<!-- Content from [^>]*-->)")
+EMPTY_VALUES = (None, "", "NA", "N/A", "n/a", "null", [], {})
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -75,29 +92,194 @@ def get_platform_specific_prompt(platform, language="en"):
     return prompts.get(platform.lower(), f"{instruction} Extract key information from the page.")
 
 def combine_html_files(html_files, base_url):
-    combined_content = ""
-    
-    for html_file in html_files:
+    start = time.perf_counter()
+    parts = []
+    input_bytes = 0
+
+    # Clean up each HTML file (in parallel for multi-page platforms)
+    results = html_cleaner.clean_html_files(html_files, base_url)
+
+    for html_file, result in zip(html_files, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error processing {html_file}: {result}")
+            continue
+
+        title, minimized_body, file_bytes = result
+        input_bytes += file_bytes
+
+        # Add a separator with the filename
+        filename = os.path.basename(html_file)
+        parts.append(f"\n\n<!-- Content from {filename} -->\n{minimized_body}")
+
+    combined_content = "".join(parts)
+    logger.info(
+        f"Cleaned {len(html_files)} HTML file(s): {input_bytes} → {len(combined_content.encode('utf-8'))} bytes "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return combined_content
+
+def split_source(source, chunk_tokens=MAP_REDUCE_CHUNK_TOKENS, max_chunks=MAP_REDUCE_MAX_CHUNKS):
+    """
+    Split the combined source into at most max_chunks chunks of at most
+    chunk_tokens. Chunks are filled line by line across the per-file
+    "<!-- Content from ... -->" markers, so the rest of a file that did not
+    fit carries over into the next chunk instead of making a small one of
+    its own; each chunk repeats the marker of the file it starts in, so the
+    model knows which page a part came from. Chunks beyond max_chunks are
+    dropped (the source is packed to fit them beforehand).
+    """
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current).strip())
+        current, current_tokens = [], 0
+
+    for section in SECTION_PATTERN.split(source):
+        section = section.strip()
+        if not section:
+            continue
+        marker, _, body = section.partition("\n") if section.startswith("<!--") else ("", "", section)
+        marker_tokens = token_budget.estimate_tokens(marker) + 1 if marker else 0
+        lines = body.split("\n")
+
+        # Start a new chunk rather than end this one with a marker and nothing under it
+        first_tokens = marker_tokens + token_budget.estimate_tokens(lines[0]) + 1
+        if current and current_tokens + first_tokens > chunk_tokens:
+            flush()
+        if marker:
+            current.append(marker)
+            current_tokens += marker_tokens
+
+        for line in lines:
+            line_tokens = token_budget.estimate_tokens(line) + 1
+            if current_tokens + line_tokens > chunk_tokens and len(current) > (1 if marker else 0):
+                flush()
+                if marker:
+                    current.append(marker)
+                    current_tokens = marker_tokens
+            current.append(line)
+            current_tokens += line_tokens
+
+    flush()
+
+    if max_chunks and len(chunks) > max_chunks:
+        dropped = chunks[max_chunks:]
+        logger.warning(
+            f"Source needs {len(chunks)} chunks, dropping the last {len(dropped)} "
+            f"(~{sum(token_budget.estimate_tokens(c) for c in dropped)} tokens) to stay within MAP_REDUCE_MAX_CHUNKS={max_chunks}"
+        )
+        chunks = chunks[:max_chunks]
+    return chunks
+
+def _normalize_key(key):
+    return re.sub(r"[\s\-]+", "_", str(key).strip().lower())
+
+def _dedup_key(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+def merge_results(a, b):
+    """
+    Merge two partial extraction results field by field: dicts are merged
+    recursively (keys compared case- and separator-insensitively), lists are
+    concatenated without duplicates, empty values are filled from the other
+    side and conflicting scalars are kept as a list of distinct values.
+    """
+    if a in EMPTY_VALUES:
+        return b
+    if b in EMPTY_VALUES:
+        return a
+
+    if isinstance(a, dict) and isinstance(b, dict):
+        merged = dict(a)
+        keys = {_normalize_key(k): k for k in merged}
+        for key, value in b.items():
+            existing = keys.get(_normalize_key(key))
+            if existing is None:
+                merged[key] = value
+                keys[_normalize_key(key)] = key
+            else:
+                merged[existing] = merge_results(merged[existing], value)
+        return merged
+
+    items_a = a if isinstance(a, list) else [a]
+    items_b = b if isinstance(b, list) else [b]
+    merged, seen = [], set()
+    for item in items_a + items_b:
+        if item in EMPTY_VALUES:
+            continue
+        key = _dedup_key(item)
+        if key not in seen:
+            seen.add(key)
+            merged.append(item)
+
+    if len(merged) == 1 and not isinstance(a, list) and not isinstance(b, list):
+        return merged[0]
+    return merged
+
+def _run_graph(prompt, source, graph_config):
+    # Imported on first use: scrapegraphai pulls in langchain and takes seconds to import
+    from scrapegraphai.graphs import SmartScraperGraph
+
+    scraper = SmartScraperGraph(
+        prompt=prompt, 
+        source=source,
+        config=graph_config
+    )
+    return scraper.run()["content"]
+
+def run_map_reduce(prompt, source, graph_config, control=None, decision=None):
+    """Extract each chunk concurrently and merge the partial results"""
+    if control is None:
+        control = JobControl.unbounded()
+    if decision is None:
+        decision = model_router.route("extract", MAP_REDUCE_CHUNK_TOKENS)
+
+    # Drop duplicate blocks and cap the total at what the chunks can carry
+    with profiling.span("extract.pack_source"):
+        source, _ = token_budget.pack_html_source(source, MAP_REDUCE_CHUNK_TOKENS * MAP_REDUCE_MAX_CHUNKS)
+        chunks = split_source(source, MAP_REDUCE_CHUNK_TOKENS, MAP_REDUCE_MAX_CHUNKS)
+
+    # The chunks run in pool threads, which don't see the job's profile
+    profile = profiling.current()
+
+    logger.info(f"Map-reduce extraction over {len(chunks)} chunk(s) with {MAP_REDUCE_WORKERS} worker(s)")
+
+    def extract(indexed_chunk):
+        index, chunk = indexed_chunk
+        start = time.perf_counter()
         try:
-            with open(html_file, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            
-            # Clean up each HTML file
-            title, minimized_body, *_ = cleanup_html(
-                html_content=html_content,
-                base_url=base_url
-            )
-            
-            # Add a separator with the filename
-            filename = os.path.basename(html_file)
-            combined_content += f"\n\n<!-- Content from {filename} -->\n{minimized_body}"
-            
+            # Chunks still queued when the job is cancelled are not sent
+            with profiling.span(f"extract.llm.chunk[{index + 1}]", profile), control.slot("llm"), model_router.timed(decision, chunk=index + 1):
+                content = control.call(_run_graph, prompt, chunk, graph_config)
+            logger.info(f"Chunk {index + 1}/{len(chunks)} extracted in {time.perf_counter() - start:.1f}s")
+            return content
         except Exception as e:
-            logger.error(f"Error processing {html_file}: {e}")
-    
-    return combined_content
+            logger.error(f"Chunk {index + 1}/{len(chunks)} failed: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, MAP_REDUCE_WORKERS)) as pool:
+        partials = list(pool.map(extract, enumerate(chunks)))
+
+    control.check()
+    failures = [p for p in partials if isinstance(p, Exception)]
+    if len(failures) == len(partials):
+        raise failures[0]
+
+    merged = None
+    for partial in partials:
+        if not isinstance(partial, Exception):
+            merged = merge_results(merged, partial)
+    return merged
+
+def run_scraper_with_retry(html_files, base_url, json_file, platform="facebook", language="en", control=None):
+    if control is None:
+        control = JobControl.unbounded()
 
-def run_scraper_with_retry(html_files, base_url, json_file, platform="facebook", language="en"):
     try:
         # Validate platform
         valid_platforms = ["facebook", "x", "instagram", "default"]
@@ -112,7 +294,8 @@ def run_scraper_with_retry(html_files, base_url, json_file, platform="facebook",
                 return False
             
         # Combine all HTML files into a single source
-        combined_source = combine_html_files(html_files, base_url)
+        with profiling.span("extract.clean_html"):
+            combined_source = combine_html_files(html_files, base_url)
 
         if not combined_source:
             logger.error("No HTML content to process")
@@ -120,39 +303,62 @@ def run_scraper_with_retry(html_files, base_url, json_file, platform="facebook",
 
         prompt = get_platform_specific_prompt(platform, language)
 
+        source_tokens = token_budget.estimate_tokens(combined_source)
+        map_reduce = source_tokens > MAP_REDUCE_THRESHOLD_TOKENS
+        if not map_reduce:
+            # Keep the source within the prompt budget
+            with profiling.span("extract.pack_source"):
+                combined_source, _ = token_budget.pack_html_source(combined_source)
+
+        # Route on the largest prompt a single call will carry
+        prompt_tokens = token_budget.estimate_tokens(prompt) + (
+            MAP_REDUCE_CHUNK_TOKENS if map_reduce else token_budget.estimate_tokens(combined_source)
+        )
+        decision = model_router.route("extract", prompt_tokens)
         graph_config = {
             "llm": {
-                "model": "mistralai/mistral-small-2501",
+                "model": f"mistralai/{decision['model']}",
                 "api_key": MISTRAL_API_KEY,
-                # "model_tokens": 8192
+                "model_tokens": decision["context_tokens"],
+                "max_tokens": decision["max_tokens"]
             }
         }
 
+        # Point the graph at a different OpenAI-compatible endpoint (e.g. a local stub)
+        if MISTRAL_BASE_URL:
+            graph_config["llm"]["base_url"] = MISTRAL_BASE_URL
+
+        # Don't let an LLM call outlive the job's deadline
+        graph_config["llm"]["timeout"] = max(1, int(control.timeout(decision["timeout"])))
+
         # Run the scraper
-        logger.info(f"Running scraper for {platform} in {language}...")
-        scraper = SmartScraperGraph(
-            prompt=prompt, 
-            source=combined_source,
-            config=graph_config
-        )
-        result = scraper.run()
+        if map_reduce:
+            logger.info(f"Running map-reduce scraper for {platform} in {language} (~{source_tokens} source tokens)...")
+            content = run_map_reduce(prompt, combined_source, graph_config, control, decision)
+        else:
+            logger.info(f"Running scraper for {platform} in {language} (~{prompt_tokens} prompt tokens)...")
+            with profiling.span("extract.llm"), control.slot("llm"), model_router.timed(decision):
+                content = control.call(_run_graph, prompt, combined_source, graph_config)
 
         with open(json_file, "w", encoding="utf-8") as f:
-            json.dump(result["content"], f, ensure_ascii=False, indent=2)
+            json.dump(content, f, ensure_ascii=False, indent=2)
 
         logger.info(f"Successfully extracted data to {json_file}")
         return True
 
     except Exception as e:
+        if control.cancelled:
+            logger.warning(f"Extraction stopped: {control.reason}")
+            return False
         if "429" in str(e) or "capacity" in str(e).lower():
             logger.warning(f"Rate limit hit, retrying... Error: {e}")
         else:
             logger.error(f"Error in run_scraper: {e}")
             return False
 
-def run_scraper(html_files, base_url, json_file, platform="facebook", language="en"):
+def run_scraper(html_files, base_url, json_file, platform="facebook", language="en", control=None):
     """Wrapper function with retry logic"""
-    return run_scraper_with_retry(html_files, base_url, json_file, platform, language)
+    return run_scraper_with_retry(html_files, base_url, json_file, platform, language, control)
     
 if __name__ == "__main__":
     # run_scraper("diemthongnhat_fb.html", "https://www.facebook.com/diemthongnhat", "diemthongnhat_fb.json", "facebook")
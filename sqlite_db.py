@@ -3,6 +3,7 @@ import json
 import os
 from datetime import datetime, timedelta
 import threading
+import time
 
 class SQLiteStorage:
     def __init__(self):
@@ -20,6 +21,26 @@ class SQLiteStorage:
                     expires_at TIMESTAMP
                 )
             ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cancel_requests (
+                    job_id TEXT PRIMARY KEY,
+                    expires_at TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tenant_leases (
+                    job_id TEXT PRIMARY KEY,
+                    tenant TEXT,
+                    expires_at REAL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS scheduler_stats (
+                    worker_id TEXT PRIMARY KEY,
+                    stats TEXT,
+                    expires_at REAL
+                )
+            ''')
             conn.commit()
 
     def store_result(self, job_id, result):
@@ -60,5 +81,91 @@ class SQLiteStorage:
                 )
                 conn.commit()
 
+    def request_cancel(self, job_id):
+        """Ask whichever process runs the job to cancel it"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    'DELETE FROM cancel_requests WHERE expires_at < ?',
+                    (datetime.now().isoformat(),)
+                )
+                expires_at = datetime.now() + timedelta(hours=24)
+                conn.execute(
+                    'INSERT OR REPLACE INTO cancel_requests (job_id, expires_at) VALUES (?, ?)',
+                    (job_id, expires_at.isoformat())
+                )
+                conn.commit()
+
+    def pop_cancel_request(self, job_id):
+        """True (once) if cancelling the job was requested"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute(
+                    'DELETE FROM cancel_requests WHERE job_id = ?',
+                    (job_id,)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+
+    def acquire_tenant_lease(self, tenant, job_id, limit, ttl_s):
+        """Take one of the tenant's `limit` running leases shared by all workers; False if all are taken"""
+        with self.lock:
+            # Autocommit connection so BEGIN IMMEDIATE locks out other processes for the count and insert
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                now = time.time()
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM tenant_leases WHERE expires_at < ?', (now,))
+                held = conn.execute(
+                    'SELECT COUNT(*) FROM tenant_leases WHERE tenant = ? AND job_id != ?',
+                    (tenant, job_id)
+                ).fetchone()[0]
+                if held >= limit:
+                    conn.execute('ROLLBACK')
+                    return False
+                conn.execute(
+                    'INSERT OR REPLACE INTO tenant_leases (job_id, tenant, expires_at) VALUES (?, ?, ?)',
+                    (job_id, tenant, now + ttl_s)
+                )
+                conn.execute('COMMIT')
+                return True
+            finally:
+                conn.close()
+
+    def refresh_tenant_leases(self, leases, ttl_s):
+        """Keep the (tenant, job_id) leases of running jobs from expiring"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO tenant_leases (job_id, tenant, expires_at) VALUES (?, ?, ?)',
+                    [(job_id, tenant, time.time() + ttl_s) for tenant, job_id in leases]
+                )
+                conn.commit()
+
+    def release_tenant_lease(self, tenant, job_id):
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('DELETE FROM tenant_leases WHERE job_id = ?', (job_id,))
+                conn.commit()
+
+    def publish_scheduler_stats(self, worker_id, stats, ttl_s):
+        """Share one worker's scheduler stats for aggregating across workers"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO scheduler_stats (worker_id, stats, expires_at) VALUES (?, ?, ?)',
+                    (worker_id, json.dumps(stats), time.time() + ttl_s)
+                )
+                conn.commit()
+
+    def get_scheduler_stats(self):
+        """worker_id -> stats of every worker that published recently"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('DELETE FROM scheduler_stats WHERE expires_at < ?', (time.time(),))
+                conn.commit()
+                rows = conn.execute('SELECT worker_id, stats FROM scheduler_stats').fetchall()
+                return {worker_id: json.loads(stats) for worker_id, stats in rows}
+
 # Singleton instance
 db = SQLiteStorage()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import os
+import re
+import math
+import hashlib
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Prompt budgets in (approximate) tokens. The extraction budget leaves room in
+# the 32k context of mistral-small for the graph's own instructions and the answer.
+MODEL_TOKENS = int(os.getenv("MODEL_TOKENS", 32000))
+EXTRACTION_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", 24000))
+FAQ_TOKEN_BUDGET = int(os.getenv("FAQ_TOKEN_BUDGET", 12000))
+
+# CJK, kana and hangul are roughly one token per character, everything else
+# about four characters per token for the Mistral/Llama style tokenizers
+WIDE_CHARS = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+TAGS = re.compile(r"<[^>]+>")
+WORDS = re.compile(r"\w+")
+SIGNALS = re.compile(r"\d|@|https?://")
+HEADINGS = re.compile(r"\s*<h[1-3]\b")
+# Link targets, image sources and alt texts: what tells apart blocks that are only markup
+ATTR_VALUES = re.compile(r"""\b(?:href|src|alt)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+
+SECTION_MARKER = "<!-- Content from "
+
+
+def estimate_tokens(text):
+    """Approximate token count of text without a tokenizer"""
+    if not text:
+        return 0
+    wide = len(WIDE_CHARS.findall(text))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _attr_text(block):
+    return " ".join("".join(values) for values in ATTR_VALUES.findall(block))
+
+
+def _normalize(block):
+    return " ".join(TAGS.sub(" ", block).lower().split())
+
+
+def _dedup_key(block):
+    """
+    Key under which a block counts as a duplicate: its text (ignoring markup,
+    case and whitespace) plus its href/src/alt values. None for a block with
+    no text, which is never dropped as a duplicate.
+    """
+    text = _normalize(block)
+    if not text:
+        return None
+    return hashlib.blake2b(f"{text}\x00{_attr_text(block)}".encode("utf-8"), digest_size=16).digest()
+
+
+def _score(block, tokens, position, total):
+    """
+    Higher is more useful: wordy text, contact-like details, earlier on the
+    page. Divided by a weak power of the size so a few long blocks do not
+    crowd out many short, dense ones.
+    """
+    text = TAGS.sub(" ", block)
+    # Icon links (social profiles, contact) have no text, only href/src/alt
+    attrs = _attr_text(block)
+    words = WORDS.findall(f"{text} {attrs}")
+    if not words:
+        return 0.0
+    text_ratio = len(text.strip()) / max(len(block), 1)
+    unique_ratio = len(set(w.lower() for w in words)) / len(words)
+    score = math.log1p(len(words)) * (0.5 + text_ratio) * (0.5 + unique_ratio)
+    if SIGNALS.search(text) or SIGNALS.search(attrs):
+        score += 0.5
+    if HEADINGS.match(block):
+        score += 2.0
+    # Earlier blocks (profile header, intro, about) matter more than the tail of a feed
+    return score / tokens ** 0.25 * (1.5 - position / max(total, 1))
+
+
+def pack_blocks(blocks, budget, pinned=None):
+    """
+    Pick blocks to fit in budget tokens. Blank blocks and exact duplicates
+    (see _dedup_key) are dropped, the rest are ranked by _score and taken
+    greedily; blocks for which pinned(block) is true are always kept. The
+    selected blocks are returned in their original order with stats.
+    """
+    seen = set()
+    candidates = []
+    duplicates = 0
+    input_tokens = 0
+
+    for position, block in enumerate(blocks):
+        tokens = estimate_tokens(block) + 1
+        input_tokens += tokens
+        is_pinned = pinned is not None and pinned(block)
+
+        if not is_pinned:
+            key = _dedup_key(block)
+            if not block.strip() or (key is not None and key in seen):
+                duplicates += 1
+                continue
+            if key is not None:
+                seen.add(key)
+
+        candidates.append((position, block, tokens, is_pinned))
+
+    used = sum(tokens for _, _, tokens, is_pinned in candidates if is_pinned)
+    chosen = {position for position, _, _, is_pinned in candidates if is_pinned}
+
+    ranked = sorted(
+        (c for c in candidates if not c[3]),
+        key=lambda c: _score(c[1], c[2], c[0], len(blocks)),
+        reverse=True,
+    )
+    for position, block, tokens, _ in ranked:
+        if used + tokens <= budget:
+            chosen.add(position)
+            used += tokens
+
+    kept = [block for position, block, _, _ in candidates if position in chosen]
+    stats = {
+        "input_tokens": input_tokens,
+        "output_tokens": used,
+        "blocks": len(blocks),
+        "kept": len(kept),
+        "duplicates": duplicates,
+        "dropped": len(candidates) - len(kept),
+    }
+    return kept, stats
+
+
+def pack_text(text, budget, pinned=None):
+    """Pack newline-separated blocks of text into budget tokens; returns (text, stats). Text that fits is returned as is."""
+    tokens = estimate_tokens(text)
+    if budget is None or budget <= 0 or tokens <= budget:
+        return text, {"input_tokens": tokens, "output_tokens": tokens, "duplicates": 0, "dropped": 0}
+
+    kept, stats = pack_blocks(text.split("\n"), budget, pinned)
+    return "\n".join(kept), stats
+
+
+def pack_html_source(source, budget=EXTRACTION_TOKEN_BUDGET):
+    """Pack cleaned, combined HTML, keeping the per-file section markers"""
+    packed, stats = pack_text(source, budget, pinned=lambda block: block.startswith(SECTION_MARKER))
+    if stats.get("dropped") or stats.get("duplicates"):
+        logger.info(
+            f"Packed HTML source into {stats['output_tokens']}/{budget} tokens "
+            f"(from {stats['input_tokens']}, {stats['duplicates']} duplicate and {stats['dropped']} low-value blocks dropped)"
+        )
+    return packed, stats
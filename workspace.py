@@ -0,0 +1,274 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+from job_control import JOB_DEADLINE_S
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Each job renders, extracts and writes its FAQ inside its own scratch
+# directory under WORKSPACE_ROOT, so jobs for the same page never share
+# files. A workspace is deleted when its job ends; with WORKSPACE_KEEP the
+# workspaces of failed (or all) jobs are gzipped and kept for WORKSPACE_TTL_S
+# for debugging. Workspaces left behind by a crashed process are swept once
+# they are older than WORKSPACE_MAX_LIFETIME_S. The sweep runs in the
+# background (maybe_sweep, from the job watchdog) and also measures the total
+# usage that create() checks, so job submission never walks the tree.
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "workspaces")
+# Put workspaces in RAM (/dev/shm); pages are read back once, right after rendering
+WORKSPACE_TMPFS = os.getenv("WORKSPACE_TMPFS", "0") == "1"
+TMPFS_ROOT = "/dev/shm/faq-workspaces"
+
+WORKSPACE_QUOTA_MB = int(os.getenv("WORKSPACE_QUOTA_MB", 256))  # per job, 0 disables
+WORKSPACE_TOTAL_QUOTA_MB = int(os.getenv("WORKSPACE_TOTAL_QUOTA_MB", 4096))  # all workspaces, 0 disables
+WORKSPACE_MIN_FREE_MB = int(os.getenv("WORKSPACE_MIN_FREE_MB", 512))  # refuse new jobs below this free space
+
+WORKSPACE_KEEP = os.getenv("WORKSPACE_KEEP", "failed")  # none, failed or all
+WORKSPACE_TTL_S = int(os.getenv("WORKSPACE_TTL_S", 6 * 3600))
+WORKSPACE_MAX_LIFETIME_S = int(os.getenv("WORKSPACE_MAX_LIFETIME_S", max(3600, 2 * JOB_DEADLINE_S)))
+WORKSPACE_SWEEP_INTERVAL_S = int(os.getenv("WORKSPACE_SWEEP_INTERVAL_S", 60))
+
+MARKER = ".workspace.json"
+MB = 1024 * 1024
+
+
+class WorkspaceFull(Exception):
+    """No room for a new workspace: the total quota or the minimum free space would be broken"""
+
+
+def disk_usage(path):
+    """Bytes allocated on disk for path and everything below it"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_blocks * 512
+                except OSError:
+                    pass
+    return total
+
+
+def _write_marker(path, info):
+    tmp_path = os.path.join(path, f"{MARKER}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(tmp_path, os.path.join(path, MARKER))
+
+
+def _read_marker(path):
+    try:
+        with open(os.path.join(path, MARKER), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+class Workspace:
+    def __init__(self, job_id, path, quota_bytes=WORKSPACE_QUOTA_MB * MB):
+        self.job_id = job_id
+        self.path = path
+        self.quota_bytes = quota_bytes
+        self.closed = False
+
+    def path_for(self, name):
+        return os.path.join(self.path, name)
+
+    def usage(self):
+        return disk_usage(self.path)
+
+    def over_quota(self):
+        """Why the job must stop (its workspace is over quota), or None; used as a JobControl guard"""
+        if not self.quota_bytes or self.closed:
+            return None
+        used = self.usage()
+        if used > self.quota_bytes:
+            return f"workspace used {used / MB:.0f} MB, over the {self.quota_bytes / MB:.0f} MB quota"
+        return None
+
+    def compact(self):
+        """gzip every artifact in place, returns the bytes saved"""
+        before = self.usage()
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".gz") or name.startswith(MARKER):
+                    continue
+                source = os.path.join(directory, name)
+                with open(source, "rb") as src, gzip.open(f"{source}.gz", "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(source)
+        return before - self.usage()
+
+    def close(self, succeeded):
+        """Delete the workspace, or compact and keep it for WORKSPACE_TTL_S if WORKSPACE_KEEP says so"""
+        if self.closed:
+            return
+        self.closed = True
+        keep = WORKSPACE_KEEP == "all" or (WORKSPACE_KEEP == "failed" and not succeeded)
+        try:
+            if not keep:
+                shutil.rmtree(self.path, ignore_errors=True)
+                return
+            saved = self.compact()
+            _write_marker(self.path, {
+                "job_id": self.job_id,
+                "state": "kept",
+                "succeeded": succeeded,
+                "expires_at": time.time() + WORKSPACE_TTL_S,
+            })
+            logger.info(f"Kept workspace of job {self.job_id} for {WORKSPACE_TTL_S}s ({saved / MB:.1f} MB saved by compression)")
+        except OSError as e:
+            logger.warning(f"Could not close workspace {self.path}: {e}")
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class WorkspaceManager:
+    def __init__(self, root=None):
+        self.root = root or self._default_root()
+        self.lock = threading.Lock()
+        self.last_sweep = 0.0
+        # Bytes used by all workspaces as of the last sweep, None until measured
+        self.used_bytes = None
+
+    @staticmethod
+    def _default_root():
+        if WORKSPACE_TMPFS:
+            if os.path.isdir(os.path.dirname(TMPFS_ROOT)) and os.access(os.path.dirname(TMPFS_ROOT), os.W_OK):
+                return TMPFS_ROOT
+            logger.warning(f"WORKSPACE_TMPFS is set but {os.path.dirname(TMPFS_ROOT)} is not writable, using {WORKSPACE_ROOT}")
+        return WORKSPACE_ROOT
+
+    def _workspaces(self):
+        """(path, marker) of every workspace, oldest first"""
+        try:
+            entries = [e for e in os.scandir(self.root) if e.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+        found = [(entry.path, _read_marker(entry.path) or {}) for entry in entries]
+        return sorted(found, key=lambda item: item[1].get("created_at", 0))
+
+    def _free_bytes(self):
+        return shutil.disk_usage(self.root).free
+
+    def _over_limits(self):
+        """Why there is no room for another workspace, or None"""
+        if WORKSPACE_MIN_FREE_MB and self._free_bytes() < WORKSPACE_MIN_FREE_MB * MB:
+            return f"less than {WORKSPACE_MIN_FREE_MB} MB free on {self.root}"
+        if WORKSPACE_TOTAL_QUOTA_MB:
+            if self.used_bytes is None:
+                self.used_bytes = disk_usage(self.root)
+            if self.used_bytes >= WORKSPACE_TOTAL_QUOTA_MB * MB:
+                return f"workspaces use {self.used_bytes / MB:.0f} MB of the {WORKSPACE_TOTAL_QUOTA_MB} MB quota"
+        return None
+
+    def _make_room(self):
+        os.makedirs(self.root, exist_ok=True)
+
+        # Make room by dropping kept workspaces, oldest first
+        reason = self._over_limits()
+        if reason:
+            for path, marker in self._workspaces():
+                if marker.get("state") == "kept":
+                    self._remove(path)
+                    reason = self._over_limits()
+                    if not reason:
+                        break
+        if reason:
+            raise WorkspaceFull(reason)
+
+    def check_room(self):
+        """Raise WorkspaceFull if a new workspace could not be created now; for refusing a job up front"""
+        with self.lock:
+            self._make_room()
+
+    def create(self, job_id):
+        """A fresh workspace for job_id. Raises WorkspaceFull if there is no room for it."""
+        with self.lock:
+            self._make_room()
+            path = os.path.join(self.root, job_id)
+            os.makedirs(path)
+            _write_marker(path, {"job_id": job_id, "state": "active", "created_at": time.time()})
+            return Workspace(job_id, path)
+
+    def _remove(self, path):
+        size = disk_usage(path) if self.used_bytes is not None else 0
+        shutil.rmtree(path, ignore_errors=True)
+        if self.used_bytes is not None:
+            self.used_bytes = max(0, self.used_bytes - size)
+
+    def maybe_sweep(self):
+        """Sweep if the last sweep was WORKSPACE_SWEEP_INTERVAL_S ago; cheap to call often"""
+        if time.monotonic() - self.last_sweep > WORKSPACE_SWEEP_INTERVAL_S:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired workspaces and measure the total usage; returns how many were removed"""
+        with self.lock:
+            removed = self._sweep()
+        if WORKSPACE_TOTAL_QUOTA_MB:
+            # Walked outside the lock, so jobs can be created meanwhile
+            used = disk_usage(self.root)
+            with self.lock:
+                self.used_bytes = used
+        return removed
+
+    def _sweep(self):
+        self.last_sweep = time.monotonic()
+        now = time.time()
+        removed = 0
+        for path, marker in self._workspaces():
+            if marker.get("state") == "kept":
+                expired = now > marker.get("expires_at", 0)
+            else:
+                # Active past any possible job lifetime (or unreadable): its process is gone
+                created_at = marker.get("created_at") or os.path.getmtime(path)
+                expired = now - created_at > WORKSPACE_MAX_LIFETIME_S
+            if expired:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Swept {removed} expired workspace(s) from {self.root}")
+        return removed
+
+    def metrics(self):
+        """Disk usage of the workspaces and of the filesystem they live on"""
+        active, kept = [], []
+        for path, marker in self._workspaces():
+            item = {"job_id": marker.get("job_id", os.path.basename(path)), "bytes": disk_usage(path)}
+            (kept if marker.get("state") == "kept" else active).append(item)
+
+        metrics = {
+            "root": os.path.abspath(self.root),
+            "tmpfs": self.root == TMPFS_ROOT,
+            "active": len(active),
+            "kept": len(kept),
+            "active_bytes": sum(item["bytes"] for item in active),
+            "kept_bytes": sum(item["bytes"] for item in kept),
+            "job_quota_bytes": WORKSPACE_QUOTA_MB * MB,
+            "total_quota_bytes": WORKSPACE_TOTAL_QUOTA_MB * MB,
+            "largest": sorted(active + kept, key=lambda item: item["bytes"], reverse=True)[:10],
+            "checked_at": datetime.now().isoformat(),
+        }
+        if os.path.isdir(self.root):
+            filesystem = shutil.disk_usage(self.root)
+            metrics["filesystem"] = {"total_bytes": filesystem.total, "used_bytes": filesystem.used, "free_bytes": filesystem.free}
+        return metrics
+
+
+# Singleton instance
+workspaces = WorkspaceManager()